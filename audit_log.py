@@ -0,0 +1,475 @@
+import os
+import re
+import gzip
+import json
+import mmap
+import time
+import queue
+import atexit
+import shutil
+import logging
+import tempfile
+import logging.handlers
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from itertools import accumulate, islice
+
+from transfer_store import write_json_atomic
+
+# --- Logging pipeline ---
+# Callers only put records on a queue; a listener thread formats them and
+# does all file I/O, including rotation. The active log rolls over by size
+# or age into gzip archives <log>.1.gz (newest) ... <log>.N.gz (oldest).
+AUDIT_LOG_FILE = 'photo_transfer.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = 16 * 1024 * 1024
+LOG_MAX_AGE = 7 * 24 * 3600
+LOG_BACKUP_COUNT = 10
+ARCHIVE_SUFFIX = '.gz'
+
+_listener = None
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    # RotatingFileHandler that also rolls over once the active file is
+    # max_age seconds old, and gzips each rotated segment
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, max_age=LOG_MAX_AGE, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.max_age = max_age
+        self.namer = lambda name: name + ARCHIVE_SUFFIX
+        self.rotator = self._compress
+        self.opened_at = _segment_started(self.baseFilename) or time.time()
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as fsrc, gzip.open(dest, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+        os.remove(source)
+
+    def shouldRollover(self, record):
+        if self.max_age and time.time() - self.opened_at >= self.max_age:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
+
+def _segment_started(path):
+    # When a log segment was started: the timestamp of its first line.
+    # File times cannot tell, as Linux keeps no creation time and the
+    # mtime moves with every write; None for an empty or unreadable file.
+    head = _segment_head(path)
+    if head is None:
+        return None
+    try:
+        return datetime.strptime(head[:19], '%Y-%m-%d %H:%M:%S').timestamp()
+    except ValueError:
+        return None
+
+
+def start_log_pipeline(log_path=AUDIT_LOG_FILE, level=logging.INFO, max_bytes=LOG_MAX_BYTES,
+                       max_age=LOG_MAX_AGE, backup_count=LOG_BACKUP_COUNT):
+    global _listener
+    stop_log_pipeline()
+    handler = CompressingRotatingFileHandler(log_path, max_bytes, max_age, backup_count)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    for existing in [h for h in root_logger.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        root_logger.removeHandler(existing)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    return _listener
+
+
+def stop_log_pipeline():
+    # Drains the queue and closes the file
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_log_pipeline)
+
+
+def log_segments(log_path):
+    # Archived segments oldest first, then the active log, if they exist
+    segments = []
+    n = 1
+    while os.path.exists(f"{log_path}.{n}{ARCHIVE_SUFFIX}"):
+        segments.append(f"{log_path}.{n}{ARCHIVE_SUFFIX}")
+        n += 1
+    segments.reverse()
+    if os.path.exists(log_path):
+        segments.append(log_path)
+    return segments
+
+
+def open_segment(path):
+    if path.endswith(ARCHIVE_SUFFIX):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+# --- Audit log reader ---
+# The audit log grows by one line per copied file, so it is far too large
+# to read into a widget. Each segment is memory-mapped (archives are first
+# decompressed to a temporary file) and only the byte offset of each line
+# start is kept; lines are decoded when shown.
+INDEX_CHUNK_SIZE = 16 * 1024 * 1024
+LEVELS = ('INFO', 'WARNING', 'ERROR')
+
+
+def _level_marker(level):
+    # Lines look like "2024-05-01 10:00:00,123 - LEVEL - message"
+    return f" - {level} - ".encode()
+
+
+class _Segment:
+    def __init__(self, path):
+        self.path = path
+        self.inode = None
+        # _segment_head() of the file once it has been indexed past it
+        self.head = None
+        self._file = None
+        self.mm = None
+        # offsets[i] is where line i starts; the last offset is the end of
+        # the last complete line, so a line still being written is hidden
+        self.offsets = array('Q', [0])
+
+    @property
+    def line_count(self):
+        return len(self.offsets) - 1
+
+    def note_head(self, head):
+        # head was read before the last remap; kept only once a line was
+        # indexed, so it cannot belong to a file that changed in between
+        if self.head is None and self.line_count:
+            self.head = head
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def load_archive(self):
+        self._file = tempfile.TemporaryFile()
+        with gzip.open(self.path, 'rb') as f:
+            shutil.copyfileobj(f, self._file)
+        self._file.flush()
+        size = self._file.tell()
+        if size:
+            self.mm = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+            self._index_from(0)
+
+    def remap(self, size):
+        # The active log only grows; map it again at its new size
+        self.close()
+        self._file = open(self.path, 'rb')
+        self.mm = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+        self._index_from(self.offsets[-1])
+
+    def _index_from(self, start):
+        mm = self.mm
+        end = len(mm)
+        pos = start
+        while pos < end:
+            chunk = mm[pos:min(pos + INDEX_CHUNK_SIZE, end)]
+            parts = chunk.split(b'\n')
+            # Every part but the last ends in a newline
+            complete = parts[:-1]
+            if complete:
+                # accumulate starts with pos itself, which is already indexed
+                self.offsets.extend(islice(accumulate((len(p) + 1 for p in complete), initial=pos), 1, None))
+            if len(chunk) < INDEX_CHUNK_SIZE or not complete:
+                break
+            pos = self.offsets[-1]
+
+    def line(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.mm[start:end].rstrip(b'\r\n').decode('utf-8', errors='replace')
+
+    def find_lines(self, needles, first_line, base, matches):
+        # Only the first needle is scanned for; the others are checked
+        # within each candidate line
+        if self.mm is None or first_line >= self.line_count:
+            return
+        mm = self.mm
+        needle, others = needles[0], needles[1:]
+        pos = self.offsets[first_line]
+        end = self.offsets[-1]
+        while True:
+            pos = mm.find(needle, pos, end)
+            if pos < 0:
+                break
+            i = bisect_right(self.offsets, pos) - 1
+            line_start, line_end = self.offsets[i], self.offsets[i + 1]
+            if all(mm.find(n, line_start, line_end) >= 0 for n in others):
+                matches.append(base + i)
+            pos = line_end
+
+
+class AuditLog:
+    # Line-addressed view over the archived segments and the active log,
+    # in chronological order
+    def __init__(self, path):
+        self.path = path
+        self.segments = []
+        self._archived_lines = 0
+
+    @property
+    def line_count(self):
+        active = self.segments[-1].line_count if self.segments else 0
+        return self._archived_lines + active
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self._archived_lines = 0
+
+    def _rebuild(self):
+        self.close()
+        for path in log_segments(self.path):
+            segment = _Segment(path)
+            if path.endswith(ARCHIVE_SUFFIX):
+                try:
+                    segment.load_archive()
+                except (OSError, EOFError):
+                    # Being written by a rotation right now
+                    segment.close()
+                    continue
+            self.segments.append(segment)
+        if not self.segments or self.segments[-1].path != self.path:
+            self.segments.append(_Segment(self.path))
+        self._archived_lines = sum(s.line_count for s in self.segments[:-1])
+
+    def refresh(self):
+        # Indexes only bytes appended to the active log since the last call.
+        # After a rotation (the active log has a new inode or, if the inode
+        # was reused, a new first line) or a truncation every segment is
+        # indexed afresh. Returns the index of the first new line (0 after a
+        # rebuild), or None if nothing changed.
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        head = _segment_head(self.path) if st is not None else None
+        active = self.segments[-1] if self.segments else None
+        if active is None or st is None or st.st_ino != active.inode or st.st_size < active.offsets[-1] \
+                or (active.head is not None and head != active.head):
+            had_lines = self.line_count
+            self._rebuild()
+            active = self.segments[-1]
+            if st is not None:
+                active.inode = st.st_ino
+                if st.st_size:
+                    active.remap(st.st_size)
+                active.note_head(head)
+            return 0 if had_lines or self.line_count else None
+        if not st.st_size or (active.mm is not None and st.st_size == len(active.mm)):
+            return None
+        first_new = self.line_count
+        active.remap(st.st_size)
+        active.note_head(head)
+        return first_new if self.line_count != first_new else None
+
+    def _locate(self, i):
+        if i >= self._archived_lines:
+            return self.segments[-1], i - self._archived_lines
+        for segment in self.segments[:-1]:
+            if i < segment.line_count:
+                return segment, i
+            i -= segment.line_count
+        raise IndexError(i)
+
+    # --- Reading ---
+    def line(self, i):
+        segment, local = self._locate(i)
+        return segment.line(local)
+
+    def lines(self, start, count):
+        stop = min(self.line_count, start + count)
+        return [self.line(i) for i in range(max(0, start), stop)]
+
+    # --- Filtering ---
+    def find_lines(self, text=None, level=None, first_line=0):
+        # Indices of lines from first_line on that contain text and were
+        # logged at level, searched in the mapped bytes
+        matches = array('L')
+        if first_line >= self.line_count:
+            return matches
+        needles = [n for n in (text.encode('utf-8') if text else None,
+                               _level_marker(level) if level else None) if n]
+        if not needles:
+            matches.extend(range(first_line, self.line_count))
+            return matches
+        base = 0
+        for segment in self.segments:
+            if first_line < base + segment.line_count:
+                segment.find_lines(needles, max(0, first_line - base), base, matches)
+            base += segment.line_count
+        return matches
+
+
+# --- Session summary index ---
+# The sessions view needs only the SESSION_SUMMARY lines. They are parsed
+# once and kept in <log>.sessions.json together with where reading stopped:
+# the active log's inode, byte offset and first line. Later updates read
+# only what was appended. After a rotation, the segment that used to be
+# active is found among the archives by its first line, and reading
+# resumes there and continues through the newer segments.
+SESSION_MARKER = b'SESSION_SUMMARY'
+HEAD_SIZE = 256
+_SUMMARY_RE = re.compile(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,(\d+))? - \w+ - '
+                         r'SESSION_SUMMARY files=(\d+) source=(.*?) dest=(.*)$')
+
+
+def session_index_path_for(log_path):
+    return os.path.splitext(log_path)[0] + '.sessions.json'
+
+
+def parse_summary_line(line):
+    match = _SUMMARY_RE.match(line.rstrip('\r\n'))
+    if match is None:
+        return None
+    stamp, millis, files, source, dest = match.groups()
+    return [f"{stamp}.{millis}" if millis else stamp, int(files), source.strip(), dest.strip()]
+
+
+def _segment_head(path):
+    # First complete line, or its first HEAD_SIZE bytes, identifying a
+    # segment across rename and gzip; None until that much is written
+    try:
+        with open_segment(path) as f:
+            head = f.read(HEAD_SIZE)
+    except (OSError, EOFError):
+        return None
+    end = head.find(b'\n')
+    if end < 0 and len(head) == HEAD_SIZE:
+        end = HEAD_SIZE
+    return head[:end].decode('latin-1') if end > 0 else None
+
+
+class SessionSummaryIndex:
+    def __init__(self, log_path, index_path=None):
+        self.log_path = log_path
+        self.index_path = index_path or session_index_path_for(log_path)
+        self.inode = None
+        self.offset = 0
+        self.head = None
+        # [timestamp, files, source, dest] per summary, oldest first
+        self.sessions = []
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.inode = data.get('inode')
+            self.offset = data.get('offset', 0)
+            self.head = data.get('head')
+            self.sessions = data.get('sessions', [])
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def _save(self):
+        try:
+            write_json_atomic(self.index_path, {'inode': self.inode, 'offset': self.offset, 'head': self.head,
+                                                'sessions': self.sessions}, indent=None)
+        except OSError as e:
+            logging.error(f"Cannot write session index {self.index_path}: {e}")
+
+    def update(self):
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            st = None
+        # Rotation deletes the old file before creating the new one, so the
+        # new log can get the same inode; its first line tells them apart
+        if st is not None and st.st_ino == self.inode and \
+                (self.head is None or _segment_head(self.log_path) == self.head):
+            if st.st_size == self.offset:
+                return self.sessions
+            # Same file: appended to, or truncated in place
+            offset = self.offset if st.st_size > self.offset else 0
+            plan = [(self.log_path, offset)]
+        else:
+            plan = self._plan_after_rotation()
+        added = []
+        for path, offset in plan:
+            added.extend(self._read_from(path, offset))
+        if st is not None:
+            self.inode = st.st_ino
+            self.head = _segment_head(self.log_path)
+        self.sessions.extend(added)
+        self._save()
+        return self.sessions
+
+    def _plan_after_rotation(self):
+        segments = log_segments(self.log_path)
+        if self.head is not None:
+            for k in range(len(segments) - 1, -1, -1):
+                if _segment_head(segments[k]) == self.head:
+                    return [(segments[k], self.offset)] + [(path, 0) for path in segments[k + 1:]]
+        elif self.inode is not None:
+            # The file read last had no complete line yet, so it is the
+            # newest archive
+            return [(path, 0) for path in segments[-2:]]
+        # First run, or everything read before has been rotated away
+        return [(path, 0) for path in segments]
+
+    def _read_from(self, path, offset):
+        added = []
+        try:
+            f = open_segment(path)
+        except OSError:
+            return added
+        with f:
+            f.seek(offset)
+            while True:
+                chunk = f.read(INDEX_CHUNK_SIZE)
+                if not chunk:
+                    break
+                end = chunk.rfind(b'\n') + 1
+                if not end:
+                    # A line still being written; pick it up next time
+                    break
+                # Only lines containing the marker are decoded and parsed
+                pos = chunk.find(SESSION_MARKER, 0, end)
+                while pos >= 0:
+                    start = chunk.rfind(b'\n', 0, pos) + 1
+                    stop = chunk.find(b'\n', pos) + 1
+                    summary = parse_summary_line(chunk[start:stop].decode('utf-8', errors='ignore'))
+                    if summary is not None:
+                        added.append(summary)
+                    pos = chunk.find(SESSION_MARKER, stop, end)
+                offset += end
+                f.seek(offset)
+        if path == self.log_path:
+            self.offset = offset
+        else:
+            self.offset = 0
+        return added
+
+    def summaries(self):
+        # Dicts as the sessions view expects, with parsed timestamps
+        rows = []
+        for stamp, files, source, dest in self.update():
+            try:
+                when = datetime.fromisoformat(stamp)
+            except ValueError:
+                when = stamp
+            rows.append({'timestamp': when, 'files': files, 'source': source, 'dest': dest})
+        return rows
@@ -0,0 +1,373 @@
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+
+from media_dates import get_file_date, get_metadata_cache, set_metadata_cache
+from scanner import iter_media_files, scan_media, DEFAULT_SCAN_WORKERS
+from copy_engine import CopyEngine, DEFAULT_COPY_WORKERS
+from layout_planner import plan_layout
+from transfer_store import TransferLogStore, TransferLogIndex
+from benchmarks.corpus import CorpusSpec, KINDS, DEFAULT_MIX, CORPUS_MTIME, build_corpus, parse_size
+
+# --- Benchmark harness ---
+# Times each hot path on its own against a synthetic corpus and writes one
+# JSON document, so two versions can be compared with --compare. Timings
+# are warm-cache: the corpus was just written or is reused from disk.
+RESULTS_VERSION = 1
+BENCHMARKS = ('file_date', 'walk', 'scan', 'copy', 'log_save', 'log_load', 'session_grouping')
+DEFAULT_REPEAT = 3
+DEFAULT_LOG_ENTRIES = 50000
+DEFAULT_SESSIONS = 200
+DEFAULT_THRESHOLD = 0.10
+# Sparse sources are written out in full by a copy, so the copy benchmark
+# only takes files up to this many bytes in total
+DEFAULT_COPY_BUDGET = 512 * 1024 * 1024
+
+
+def _progress(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _measure(func, repeat, setup=None):
+    # Runs func repeat times and returns (timings, last result); setup runs
+    # untimed before each repeat
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def _summary(timings, items=None, nbytes=None, **extra):
+    median = statistics.median(timings)
+    out = {'runs': len(timings), 'min_seconds': round(min(timings), 6), 'median_seconds': round(median, 6),
+           'max_seconds': round(max(timings), 6)}
+    if items is not None:
+        out['items'] = items
+        out['items_per_sec'] = round(items / median, 1) if median > 0 else None
+    if nbytes is not None:
+        out['bytes'] = nbytes
+        out['mb_per_sec'] = round(nbytes / (1024 * 1024) / median, 1) if median > 0 else None
+    out.update(extra)
+    return out
+
+
+# --- Individual benchmarks ---
+def bench_file_date(paths, repeat):
+    # Single-threaded, uncached: the cost of one header read per file
+    def run():
+        return [get_file_date(p) for p in paths]
+    timings, dates = _measure(run, repeat)
+    by_kind = {}
+    for kind in KINDS:
+        subset = [p for p in paths if _kind_of(p) == kind]
+        if subset:
+            kind_timings, _ = _measure(lambda: [get_file_date(p) for p in subset], repeat)
+            by_kind[kind] = _summary(kind_timings, len(subset))
+    # Corpus mtimes are all CORPUS_MTIME, so this counts the mtime fallbacks
+    from_mtime = sum(d == CORPUS_MTIME for d in dates)
+    return _summary(timings, len(paths), resolved=sum(d is not None for d in dates), from_mtime=from_mtime,
+                    by_kind=by_kind)
+
+
+def _kind_of(path):
+    name = os.path.basename(path)
+    ext = os.path.splitext(name)[1].lower()
+    if ext == '.jpg':
+        return 'jpeg_noexif' if name.startswith('SCAN_') else 'jpeg'
+    return {'.png': 'png', '.heic': 'heic', '.mp4': 'mp4', '.mov': 'mov'}.get(ext)
+
+
+def bench_walk(media_root, repeat):
+    timings, paths = _measure(lambda: list(iter_media_files(media_root)), repeat)
+    return _summary(timings, len(paths))
+
+
+def bench_scan(media_root, repeat, workers):
+    timings, (matched, stats) = _measure(lambda: scan_media(media_root, workers=workers), repeat)
+    return _summary(timings, len(matched), workers=stats.workers, stats=stats.as_dict())
+
+
+def _within_budget(matched, budget):
+    selected = []
+    total = 0
+    for path, file_date in sorted(matched):
+        size = os.path.getsize(path)
+        if total + size <= budget:
+            selected.append((path, file_date))
+            total += size
+    return selected
+
+
+def bench_copy(work_dir, repeat, workers, matched, budget=DEFAULT_COPY_BUDGET):
+    dest = os.path.join(work_dir, 'copy_dest')
+    matched = _within_budget(matched, budget)
+
+    def setup():
+        shutil.rmtree(dest, ignore_errors=True)
+        os.makedirs(dest)
+
+    def run():
+        jobs = plan_layout(matched, dest).jobs
+        engine = CopyEngine(workers=workers)
+        progress = engine.run(jobs)
+        return progress, engine.copy_stats
+
+    timings, (progress, copy_stats) = _measure(run, repeat, setup)
+    shutil.rmtree(dest, ignore_errors=True)
+    return _summary(timings, progress.completed, progress.bytes_copied, workers=workers,
+                    failed=progress.failed, strategies=copy_stats.as_dict()['files'])
+
+
+def make_log_entries(count, sessions, seed=1):
+    # Entries shaped like TransferSession.make_entry writes them
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    session_info = []
+    for s in range(sessions):
+        started = (start + timedelta(days=s)).isoformat()
+        session_info.append((started, f"/media/phone/DCIM/{s:04}", f"/photos/import_{s:04}"))
+    entries = []
+    for n in range(count):
+        sid, source, dest = session_info[rng.randrange(sessions)]
+        when = datetime.fromisoformat(sid) + timedelta(seconds=n)
+        name = f"IMG_{n:07}.jpg"
+        entries.append({
+            'source': f"{source}/{name}",
+            'destination': f"{dest}/{when:%Y-%m}/{name}",
+            'timestamp': when.isoformat(),
+            'session_id': sid,
+            'session_started_at': sid,
+            'session_source': source,
+            'session_destination': dest,
+            'size': rng.randrange(1, 8 * 1024 * 1024),
+            'mtime': when.timestamp(),
+        })
+    return entries
+
+
+def bench_log(work_dir, repeat, entries):
+    log_path = os.path.join(work_dir, 'transfer_log.json')
+
+    def clear():
+        for path in (log_path, log_path + '.journal'):
+            if os.path.exists(path):
+                os.remove(path)
+    store_args = {'compact_every': len(entries) + 1}
+
+    # Journaled appends plus the final compaction into a snapshot
+    def save():
+        store = TransferLogStore(log_path, **store_args)
+        for entry in entries:
+            store.put_entry(entry)
+        store.compact()
+        store.close()
+
+    save_timings, _ = _measure(save, repeat, clear)
+    snapshot_bytes = os.path.getsize(log_path)
+
+    def load():
+        store = TransferLogStore(log_path, **store_args)
+        count = len(store.index)
+        store.close()
+        return count
+
+    load_timings, count = _measure(load, repeat)
+    clear()
+    return (_summary(save_timings, len(entries), snapshot_bytes=snapshot_bytes),
+            _summary(load_timings, count, snapshot_bytes=snapshot_bytes))
+
+
+def bench_session_grouping(repeat, entries):
+    def run():
+        return TransferLogIndex(entries).session_summaries()
+    timings, summaries = _measure(run, repeat)
+    return _summary(timings, len(entries), sessions=len(summaries))
+
+
+# --- Environment ---
+def _git_commit():
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo, capture_output=True,
+                             text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment():
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'platform': platform.platform(), 'machine': platform.machine(), 'cpu_count': os.cpu_count(),
+            'git_commit': _git_commit()}
+
+
+# --- Comparison ---
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # Median time ratio per benchmark (current / baseline); above
+    # 1 + threshold is a regression
+    rows = []
+    for name, result in current.get('results', {}).items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        old, new = before['median_seconds'], result['median_seconds']
+        ratio = new / old if old > 0 else None
+        status = 'same'
+        if ratio is not None and ratio > 1 + threshold:
+            status = 'slower'
+        elif ratio is not None and ratio < 1 - threshold:
+            status = 'faster'
+        rows.append({'benchmark': name, 'baseline_seconds': old, 'current_seconds': new,
+                     'ratio': round(ratio, 3) if ratio is not None else None, 'status': status})
+    if baseline.get('corpus', {}).get('spec') != current.get('corpus', {}).get('spec'):
+        _progress('warning: baseline was measured on a different corpus spec')
+    return rows
+
+
+# --- Runner ---
+def run_benchmarks(corpus_dir, spec, selected=BENCHMARKS, repeat=DEFAULT_REPEAT, scan_workers=None,
+                   copy_workers=DEFAULT_COPY_WORKERS, copy_budget=DEFAULT_COPY_BUDGET,
+                   log_entries=DEFAULT_LOG_ENTRIES, sessions=DEFAULT_SESSIONS):
+    _progress(f"Building corpus in {corpus_dir} ({spec.files} files)")
+    start = time.perf_counter()
+    manifest = build_corpus(corpus_dir, spec)
+    _progress(f"Corpus ready in {time.perf_counter() - start:.1f}s")
+    media_root = os.path.join(corpus_dir, 'media')
+    results = {}
+    # Benchmarks measure the readers, not the SQLite cache
+    previous_cache = get_metadata_cache()
+    set_metadata_cache(None)
+    work_dir = tempfile.mkdtemp(prefix='bench_', dir=corpus_dir)
+    try:
+        paths = list(iter_media_files(media_root))
+        if 'file_date' in selected:
+            _progress('file_date')
+            results['file_date'] = bench_file_date(paths, repeat)
+        if 'walk' in selected:
+            _progress('walk')
+            results['walk'] = bench_walk(media_root, repeat)
+        if 'scan' in selected:
+            _progress('scan')
+            results['scan'] = bench_scan(media_root, repeat, scan_workers)
+        if 'copy' in selected:
+            _progress('copy')
+            matched, _ = scan_media(media_root, workers=scan_workers)
+            results['copy'] = bench_copy(work_dir, repeat, copy_workers, matched, copy_budget)
+        if {'log_save', 'log_load', 'session_grouping'} & set(selected):
+            entries = make_log_entries(log_entries, sessions, spec.seed)
+            if 'log_save' in selected or 'log_load' in selected:
+                _progress('log_save / log_load')
+                saved, loaded = bench_log(work_dir, repeat, entries)
+                if 'log_save' in selected:
+                    results['log_save'] = saved
+                if 'log_load' in selected:
+                    results['log_load'] = loaded
+            if 'session_grouping' in selected:
+                _progress('session_grouping')
+                results['session_grouping'] = bench_session_grouping(repeat, entries)
+    finally:
+        set_metadata_cache(previous_cache)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {'version': RESULTS_VERSION, 'created': datetime.now().isoformat(), 'environment': environment(),
+            'corpus': manifest, 'repeat': repeat, 'results': results}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark scan, copy and log paths on a synthetic media corpus.')
+    parser.add_argument('--corpus', default=None, help='Corpus folder (reused when the spec matches; '
+                                                        'default: a temporary folder removed afterwards)')
+    parser.add_argument('--files', type=int, default=1000, help='Number of media files')
+    parser.add_argument('--depth', type=int, default=3, help='Folder nesting depth')
+    parser.add_argument('--fanout', type=int, default=4, help='Sub-folders per folder')
+    parser.add_argument('--min-size', type=parse_size, default=parse_size('64K'), help='Smallest file, e.g. 16K')
+    parser.add_argument('--max-size', type=parse_size, default=parse_size('8M'),
+                        help='Largest file, e.g. 2G (file bodies are sparse)')
+    parser.add_argument('--mix', default=None,
+                        help=f"Kind weights, e.g. jpeg=40,heic=20,mp4=10 (kinds: {', '.join(KINDS)})")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', default=None, help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--scan-workers', type=int, default=DEFAULT_SCAN_WORKERS)
+    parser.add_argument('--copy-workers', type=int, default=DEFAULT_COPY_WORKERS)
+    parser.add_argument('--copy-budget', type=parse_size, default=DEFAULT_COPY_BUDGET,
+                        help='Total bytes the copy benchmark may write, e.g. 2G (default 512M)')
+    parser.add_argument('--log-entries', type=int, default=DEFAULT_LOG_ENTRIES)
+    parser.add_argument('--sessions', type=int, default=DEFAULT_SESSIONS)
+    parser.add_argument('--output', default=None, help='Write results JSON here instead of stdout')
+    parser.add_argument('--compare', default=None, help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative slowdown reported as a regression (default 0.10)')
+    return parser
+
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    selected = BENCHMARKS
+    if args.only:
+        selected = tuple(name.strip() for name in args.only.split(','))
+        unknown = set(selected) - set(BENCHMARKS)
+        if unknown:
+            parser.error(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+    try:
+        spec = CorpusSpec(files=args.files, depth=args.depth, fanout=args.fanout,
+                          mix=_parse_mix(args.mix) if args.mix else DEFAULT_MIX,
+                          min_size=args.min_size, max_size=args.max_size, seed=args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix='media_corpus_')
+    os.makedirs(corpus_dir, exist_ok=True)
+    try:
+        results = run_benchmarks(corpus_dir, spec, selected, max(1, args.repeat), args.scan_workers,
+                                 args.copy_workers, args.copy_budget, args.log_entries, max(1, args.sessions))
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            rows = compare(json.load(f), results, args.threshold)
+        results['comparison'] = {'baseline': args.compare, 'threshold': args.threshold, 'rows': rows}
+        for row in rows:
+            _progress(f"{row['benchmark']:<18} {row['baseline_seconds']:>10.4f}s -> "
+                      f"{row['current_seconds']:>10.4f}s  x{row['ratio']}  {row['status']}")
+        regressions = sum(row['status'] == 'slower' for row in rows)
+
+    text = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    # Non-zero exit lets a CI job fail on a slowdown
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import os
+import json
+import math
+import zlib
+import random
+import struct
+from datetime import datetime, timedelta
+
+# --- Synthetic media corpus ---
+# Builds reproducible trees of media files whose headers are real (EXIF in
+# a JPEG APP1 segment, PNG eXIf, a HEIC meta/iloc Exif item, MP4/MOV mvhd)
+# and whose bulk is a sparse hole, so a "2 GB" video takes no disk space
+# and the date readers do exactly the work they do on a phone dump. The
+# same spec and seed always give the same names, dates, sizes and mtimes.
+# Every file's mtime is CORPUS_MTIME, never a capture date, so a date read
+# from a header cannot be mistaken for the mtime fallback.
+CORPUS_VERSION = 2
+CORPUS_MTIME = datetime(2001, 1, 1)
+MANIFEST_NAME = 'corpus.json'
+KINDS = ('jpeg', 'jpeg_noexif', 'png', 'heic', 'mp4', 'mov')
+DEFAULT_MIX = {'jpeg': 40, 'jpeg_noexif': 10, 'png': 10, 'heic': 15, 'mp4': 15, 'mov': 10}
+DEFAULT_CAMERAS = ('Pixel 7', 'iPhone 14 Pro', 'SM-G991B', 'Canon EOS R6')
+QT_EPOCH_OFFSET = 2082844800
+_EXTENSIONS = {'jpeg': '.jpg', 'jpeg_noexif': '.jpg', 'png': '.png', 'heic': '.heic', 'mp4': '.mp4', 'mov': '.mov'}
+_PREFIXES = {'jpeg': 'IMG', 'jpeg_noexif': 'SCAN', 'png': 'SCREEN', 'heic': 'IMG', 'mp4': 'VID', 'mov': 'MOV'}
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(value):
+    # '512', '64K', '8M', '2G'
+    text = str(value).strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in _SIZE_UNITS else ''
+    number = text[:-1] if unit else text
+    try:
+        return int(float(number) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size {value!r}")
+
+
+class CorpusSpec:
+    def __init__(self, files=1000, depth=3, fanout=4, mix=None, min_size=parse_size('64K'),
+                 max_size=parse_size('8M'), start=datetime(2018, 1, 1), days=6 * 365, seed=1):
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.start = start
+        self.days = days
+        self.seed = seed
+        unknown = set(self.mix) - set(KINDS)
+        if unknown:
+            raise ValueError(f"Unknown file kind(s): {', '.join(sorted(unknown))}")
+
+    def as_dict(self):
+        return {'version': CORPUS_VERSION, 'files': self.files, 'depth': self.depth, 'fanout': self.fanout,
+                'mix': self.mix, 'min_size': self.min_size, 'max_size': self.max_size,
+                'start': self.start.isoformat(), 'days': self.days, 'seed': self.seed}
+
+
+# --- Container builders ---
+def _tiff(date, model, endian='<'):
+    # IFD0 holds Model and the Exif IFD pointer; the Exif IFD holds
+    # DateTimeOriginal. Offsets are relative to the TIFF header.
+    date_bytes = date.strftime('%Y:%m:%d %H:%M:%S').encode() + b'\0'
+    model_bytes = model.encode() + b'\0'
+    exif_ifd = 8 + 2 + 2 * 12 + 4
+    date_at = exif_ifd + 2 + 12 + 4
+    model_at = date_at + len(date_bytes)
+    out = (b'II' if endian == '<' else b'MM') + struct.pack(endian + 'HI', 42, 8)
+    out += struct.pack(endian + 'H', 2)
+    out += struct.pack(endian + 'HHII', 0x0110, 2, len(model_bytes), model_at)
+    out += struct.pack(endian + 'HHII', 0x8769, 4, 1, exif_ifd)
+    out += struct.pack(endian + 'I', 0)
+    out += struct.pack(endian + 'H', 1)
+    out += struct.pack(endian + 'HHII', 0x9003, 2, len(date_bytes), date_at)
+    out += struct.pack(endian + 'I', 0)
+    return out + date_bytes + model_bytes
+
+
+def _jpeg(date, model, exif=True):
+    out = b'\xff\xd8'
+    out += b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\0\x01\x01\0\0\x01\0\x01\0\0'
+    if exif:
+        payload = b'Exif\0\0' + _tiff(date, model)
+        out += b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+    return out + b'\xff\xda' + struct.pack('>H', 12) + b'\0' * 10
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def _png(date, model):
+    ihdr = struct.pack('>IIBBBBB', 4032, 3024, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', ihdr) + _png_chunk(b'eXIf', _tiff(date, model, '>'))
+            + _png_chunk(b'IDAT', b'\0' * 64))
+
+
+def _box(box_type, data):
+    return struct.pack('>I', 8 + len(data)) + box_type + data
+
+
+def _full_box(box_type, version, data):
+    return _box(box_type, bytes([version, 0, 0, 0]) + data)
+
+
+def _heic(date, model):
+    # ftyp, meta (hdlr, iinf with an hvc1 and an Exif item, iloc), mdat
+    # holding the Exif payload first
+    payload = struct.pack('>I', 6) + b'Exif\0\0' + _tiff(date, model, '>')
+    ftyp = _box(b'ftyp', b'heic\0\0\0\0mif1heic')
+    infe = (_full_box(b'infe', 2, struct.pack('>HH', 1, 0) + b'hvc1\0')
+            + _full_box(b'infe', 2, struct.pack('>HH', 2, 0) + b'Exif\0'))
+    iinf = _full_box(b'iinf', 0, struct.pack('>H', 2) + infe)
+
+    def meta_at(offset):
+        iloc = _full_box(b'iloc', 0, bytes([0x44, 0x00]) + struct.pack('>H', 2)
+                         + struct.pack('>HHHII', 1, 0, 1, offset + len(payload), 64)
+                         + struct.pack('>HHHII', 2, 0, 1, offset, len(payload)))
+        return _full_box(b'meta', 0, _full_box(b'hdlr', 0, b'\0' * 4 + b'pict' + b'\0' * 13) + iinf + iloc)
+
+    offset = len(ftyp) + len(meta_at(0)) + 8
+    return ftyp + meta_at(offset) + _box(b'mdat', payload + b'\0' * 64)
+
+
+def _mp4_parts(date, size, brand):
+    # ftyp + a 64-bit mdat header spanning the (sparse) media data, then
+    # moov at the end of the file as cameras write it
+    created = int(date.timestamp()) + QT_EPOCH_OFFSET
+    mvhd = _full_box(b'mvhd', 0, struct.pack('>IIII', created, created, 1000, 0) + b'\0' * 80)
+    moov = _box(b'moov', mvhd + _box(b'trak', b'\0' * 32))
+    ftyp = _box(b'ftyp', brand + b'\0\0\0\0' + brand + b'mp41')
+    mdat_size = max(16, size - len(ftyp) - len(moov))
+    head = ftyp + struct.pack('>I', 1) + b'mdat' + struct.pack('>Q', mdat_size)
+    return head, len(ftyp) + mdat_size, moov
+
+
+# --- Writing ---
+def _write_file(path, kind, date, model, size):
+    with open(path, 'wb') as f:
+        if kind in ('mp4', 'mov'):
+            head, moov_at, moov = _mp4_parts(date, size, b'isom' if kind == 'mp4' else b'qt  ')
+            f.write(head)
+            # Everything between the mdat header and moov stays a hole
+            f.seek(moov_at)
+            f.write(moov)
+            return moov_at + len(moov)
+        if kind == 'jpeg':
+            header = _jpeg(date, model)
+        elif kind == 'jpeg_noexif':
+            header = _jpeg(date, model, exif=False)
+        elif kind == 'png':
+            header = _png(date, model)
+        else:
+            header = _heic(date, model)
+        f.write(header)
+        size = max(size, len(header))
+        f.truncate(size)
+        return size
+
+
+def _folders(spec, rng):
+    # DCIM-like nesting: depth levels of fanout folders each
+    folders = ['']
+    level = ['']
+    for depth in range(spec.depth):
+        level = [os.path.join(parent, f"D{depth}_{i:02}") for parent in level for i in range(spec.fanout)]
+        folders.extend(level)
+    rng.shuffle(folders)
+    return folders
+
+
+def plan_corpus(spec):
+    # (relative path, kind, date, camera, size) for every file, without
+    # touching the disk
+    rng = random.Random(spec.seed)
+    kinds = [k for k in KINDS if spec.mix.get(k)]
+    weights = [spec.mix[k] for k in kinds]
+    folders = _folders(spec, rng)
+    log_min, log_max = math.log(max(1, spec.min_size)), math.log(max(1, spec.max_size))
+    files = []
+    for n in range(spec.files):
+        kind = rng.choices(kinds, weights)[0]
+        date = spec.start + timedelta(seconds=rng.randrange(max(1, spec.days) * 86400))
+        # Log-uniform sizes: mostly small photos, a tail of large videos
+        size = int(math.exp(rng.uniform(log_min, log_max)))
+        name = f"{_PREFIXES[kind]}_{date:%Y%m%d_%H%M%S}_{n:06}{_EXTENSIONS[kind]}"
+        files.append((os.path.join(rng.choice(folders), name), kind, date, rng.choice(DEFAULT_CAMERAS), size))
+    return files
+
+
+def build_corpus(root, spec):
+    # Reuses an existing corpus built from the same spec
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('spec') == spec.as_dict():
+            return manifest
+    except (OSError, ValueError):
+        pass
+
+    counts = dict.fromkeys(KINDS, 0)
+    apparent = 0
+    for relative, kind, date, model, size in plan_corpus(spec):
+        path = os.path.join(root, 'media', relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        apparent += _write_file(path, kind, date, model, size)
+        os.utime(path, (CORPUS_MTIME.timestamp(), CORPUS_MTIME.timestamp()))
+        counts[kind] += 1
+    manifest = {'spec': spec.as_dict(), 'media_root': os.path.join(root, 'media'), 'counts': counts,
+                'apparent_bytes': apparent, 'disk_bytes': disk_usage(os.path.join(root, 'media'))}
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+def disk_usage(root):
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                total += os.stat(os.path.join(dirpath, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from copy_backend import verify_destination
+
+# --- Delete defaults ---
+# Unlinks on phone (MTP/FUSE) mounts are latency bound, so several run at
+# once. Log changes are committed every DEFAULT_COMMIT_EVERY files: if the
+# run fails or is cancelled, the log only lacks the files actually removed.
+DEFAULT_DELETE_WORKERS = 8
+DEFAULT_COMMIT_EVERY = 500
+
+DELETED = 'deleted'
+MISSING = 'missing'
+FAILED = 'failed'
+UNVERIFIED = 'unverified'
+
+
+class DeleteProgress:
+    # Snapshot handed to the UI; written only by the delete runner thread
+    def __init__(self, total):
+        self.total = total
+        self.completed = 0
+        self.deleted = 0
+        self.missing = 0
+        self.failed = 0
+        self.unverified = 0
+        self.dirs_removed = 0
+        self.current = ''
+        self.started_at = time.monotonic()
+        self.finished = False
+        self.cancelled = False
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def files_per_sec(self):
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class BulkDeleter:
+    # Deletes transferred source files on a thread pool. The log index is
+    # consulted through its hash maps only (never by scanning entries), and
+    # removed or already-missing sources are dropped from the log in
+    # batches by the single runner thread.
+    def __init__(self, store, workers=DEFAULT_DELETE_WORKERS, require_verified=False,
+                 remove_empty_dirs=False, commit_every=DEFAULT_COMMIT_EVERY):
+        self.store = store
+        self.workers = max(1, workers)
+        self.require_verified = require_verified
+        self.remove_empty_dirs = remove_empty_dirs
+        self.commit_every = max(1, commit_every)
+        self.progress = DeleteProgress(0)
+        self.cancel_event = threading.Event()
+        self._roots = set()
+        self._thread = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def done(self):
+        return self.progress.finished
+
+    def _delete_one(self, src_path, entries):
+        if self.require_verified and not any(verify_destination(e) for e in entries):
+            return UNVERIFIED, None
+        try:
+            os.remove(src_path)
+            return DELETED, None
+        except FileNotFoundError:
+            return MISSING, None
+        except Exception as e:
+            return FAILED, e
+
+    def _commit(self, batch):
+        if batch:
+            self.store.delete_sources(batch)
+            self.store.flush()
+            batch.clear()
+
+    def _record(self, src_path, outcome, error, batch, parents):
+        progress = self.progress
+        progress.completed += 1
+        progress.current = src_path
+        if outcome == DELETED:
+            progress.deleted += 1
+            parents.add(os.path.dirname(src_path))
+        elif outcome == MISSING:
+            progress.missing += 1
+        elif outcome == UNVERIFIED:
+            progress.unverified += 1
+            logging.warning(f"Not deleting {src_path}: no copy with a matching checksum")
+        else:
+            progress.failed += 1
+            logging.error(f"Failed to delete source {src_path}: {error}")
+        # Removed from the log whether deleted now or already gone
+        if outcome in (DELETED, MISSING):
+            batch.append(src_path)
+            if len(batch) >= self.commit_every:
+                self._commit(batch)
+
+    def _run(self, sources):
+        by_source = self.store.index.by_source
+        batch = []
+        parents = set()
+        in_flight = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='delete') as pool:
+                for src_path in sources:
+                    if self.cancel_event.is_set():
+                        break
+                    entries = list(by_source.get(src_path, {}).values())
+                    in_flight[pool.submit(self._delete_one, src_path, entries)] = src_path
+                    # Bound the queue so cancel takes effect quickly
+                    if len(in_flight) >= self.workers * 4:
+                        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            self._record(in_flight.pop(future), *future.result(), batch, parents)
+                for future in list(in_flight):
+                    self._record(in_flight.pop(future), *future.result(), batch, parents)
+            self._commit(batch)
+            if self.remove_empty_dirs and not self.cancel_event.is_set():
+                self._remove_empty_dirs(parents)
+        except Exception as e:
+            logging.error(f"Bulk delete stopped: {e}")
+            self._commit(batch)
+        finally:
+            self.progress.cancelled = self.cancel_event.is_set()
+            self.progress.finished = True
+
+    def _remove_empty_dirs(self, parents):
+        # Walk up from each emptied folder, deepest first, but never above
+        # the session's source folder
+        roots = self._roots
+        candidates = set()
+        for directory in parents:
+            directory = os.path.normpath(directory)
+            while directory not in roots and any(directory.startswith(root + os.sep) for root in roots):
+                candidates.add(directory)
+                directory = os.path.dirname(directory)
+        for directory in sorted(candidates, key=lambda d: d.count(os.sep), reverse=True):
+            try:
+                os.rmdir(directory)
+                self.progress.dirs_removed += 1
+                logging.info(f"Removed empty folder {directory}")
+            except OSError:
+                pass
+
+    def start(self, sources):
+        # Duplicates collapse to one unlink; order is kept for the log
+        sources = [src for src in dict.fromkeys(sources) if src]
+        self.progress = DeleteProgress(len(sources))
+        # Session source folders, collected now because the entries leave
+        # the index as their files are deleted
+        if self.remove_empty_dirs:
+            by_source = self.store.index.by_source
+            for src_path in sources:
+                for entry in by_source.get(src_path, {}).values():
+                    if entry.get('session_source'):
+                        self._roots.add(os.path.normpath(entry['session_source']))
+        self._thread = threading.Thread(target=self._run, args=(sources,), daemon=True)
+        self._thread.start()
+        return self.progress
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+        return self.progress
+
+    def run(self, sources):
+        # Blocking convenience for headless callers
+        self.start(sources)
+        return self.wait()
@@ -0,0 +1,343 @@
+import os
+import time
+import errno
+import shutil
+import threading
+
+from dedup import full_hash, new_content_hasher, MTIME_TOLERANCE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# --- Copy strategies ---
+# Tried in this order; the kernel-side ones never move file data through
+# Python memory. A strategy that a (source device, destination device)
+# pair does not support is remembered and skipped for later files.
+FICLONE = 0x40049409
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+MAX_CHUNK = 1 << 30
+STRATEGIES = ('reflink', 'copy_file_range', 'sendfile', 'buffer')
+_UNSUPPORTED_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY,
+                       errno.EINVAL, errno.EBADF, errno.EPERM, errno.ENOTSUP}
+
+_unsupported = set()
+_buffers = threading.local()
+
+
+class StrategyUnsupported(Exception):
+    pass
+
+
+def _unsupported_error(e, copied):
+    # Only fall back if nothing has been written yet; a failure halfway
+    # through a file is a real error
+    return copied == 0 and e.errno in _UNSUPPORTED_ERRNOS
+
+
+def _copy_reflink(src_fd, dst_fd, size, start=0):
+    # Clones whole files only
+    if fcntl is None or start:
+        raise StrategyUnsupported()
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as e:
+        if _unsupported_error(e, 0):
+            raise StrategyUnsupported()
+        raise
+    return os.fstat(dst_fd).st_size
+
+
+def _copy_file_range(src_fd, dst_fd, size, start=0):
+    if not hasattr(os, 'copy_file_range'):
+        raise StrategyUnsupported()
+    copied = start
+    while copied < size:
+        try:
+            n = os.copy_file_range(src_fd, dst_fd, min(size - copied, MAX_CHUNK), copied, copied)
+        except OSError as e:
+            if _unsupported_error(e, copied - start):
+                raise StrategyUnsupported()
+            raise
+        if n == 0:
+            if copied == start:
+                # Some filesystems (e.g. procfs-like or FUSE) report 0 bytes
+                raise StrategyUnsupported()
+            break
+        copied += n
+    return copied - start
+
+
+def _copy_sendfile(src_fd, dst_fd, size, start=0):
+    if not hasattr(os, 'sendfile'):
+        raise StrategyUnsupported()
+    # sendfile writes at the destination's file position
+    os.lseek(dst_fd, start, os.SEEK_SET)
+    copied = start
+    while copied < size:
+        try:
+            n = os.sendfile(dst_fd, src_fd, copied, min(size - copied, MAX_CHUNK))
+        except OSError as e:
+            if _unsupported_error(e, copied - start):
+                raise StrategyUnsupported()
+            raise
+        if n == 0:
+            break
+        copied += n
+    return copied - start
+
+
+def _copy_buffer(src_fd, dst_fd, size, hasher=None, start=0):
+    # Large reusable per-thread buffer; readinto avoids allocating per chunk.
+    # With a hasher, each chunk is hashed in the same pass that writes it.
+    # Returns the bytes written.
+    buf = getattr(_buffers, 'copy', None)
+    if buf is None:
+        buf = _buffers.copy = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buf)
+    os.lseek(src_fd, start, os.SEEK_SET)
+    os.lseek(dst_fd, start, os.SEEK_SET)
+    total = 0
+    with open(src_fd, 'rb', buffering=0, closefd=False) as fsrc:
+        while True:
+            n = fsrc.readinto(view)
+            if not n:
+                break
+            if hasher is not None:
+                hasher.update(view[:n])
+            written = 0
+            while written < n:
+                written += os.write(dst_fd, view[written:n])
+            total += n
+    return total
+
+
+_STRATEGY_FUNCS = {
+    'reflink': _copy_reflink,
+    'copy_file_range': _copy_file_range,
+    'sendfile': _copy_sendfile,
+    'buffer': _copy_buffer,
+}
+
+
+# --- Copy statistics ---
+class CopyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = {name: 0 for name in STRATEGIES}
+        self.bytes = {name: 0 for name in STRATEGIES}
+        self.seconds = {name: 0.0 for name in STRATEGIES}
+
+    def record(self, strategy, size, seconds):
+        with self._lock:
+            self.files[strategy] += 1
+            self.bytes[strategy] += size
+            self.seconds[strategy] += seconds
+
+    def as_dict(self):
+        with self._lock:
+            total_bytes = sum(self.bytes.values())
+            total_seconds = sum(self.seconds.values())
+            return {
+                'files': dict(self.files),
+                'bytes': dict(self.bytes),
+                'mb_per_sec': {name: round(self.bytes[name] / (1024 * 1024) / self.seconds[name], 1)
+                               for name in STRATEGIES if self.seconds[name] > 0},
+                # Per-copy throughput; concurrent copies overlap in wall time
+                'total_mb_per_sec': round(total_bytes / (1024 * 1024) / total_seconds, 1)
+                if total_seconds > 0 else 0.0,
+            }
+
+
+# --- Copy entry point ---
+class ShortCopyError(OSError):
+    pass
+
+
+def _check_not_same(src, dst, src_st):
+    # Opening the destination truncates it, so copying a file onto itself
+    # would empty the source; shutil.copy2 refuses this too
+    try:
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        return
+    if (dst_st.st_dev, dst_st.st_ino) == (src_st.st_dev, src_st.st_ino):
+        raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+
+
+def _check_length(src, dst, copied, expected):
+    if copied < expected:
+        raise ShortCopyError(f"Short copy {src} -> {dst}: {copied} of {expected} bytes written")
+
+
+def _copy_fds(src_fd, dst_fd, st, start=0):
+    # Returns (strategy, bytes written)
+    dst_dev = os.fstat(dst_fd).st_dev
+    for name in STRATEGIES:
+        key = (name, st.st_dev, dst_dev)
+        if key in _unsupported:
+            continue
+        try:
+            copied = _STRATEGY_FUNCS[name](src_fd, dst_fd, st.st_size, start=start)
+        except StrategyUnsupported:
+            if name != 'buffer' and not start:
+                _unsupported.add(key)
+            continue
+        return name, copied
+    return None, 0
+
+
+def copy_file(src, dst, stats=None):
+    # Drop-in replacement for shutil.copy2 (file to file path) that returns
+    # the strategy used.
+    start = time.perf_counter()
+    src_fd = os.open(src, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        st = os.fstat(src_fd)
+        _check_not_same(src, dst, st)
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            used, copied = _copy_fds(src_fd, dst_fd, st)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    _check_length(src, dst, copied, st.st_size)
+    # Preserve timestamps and permission bits like copy2 does
+    shutil.copystat(src, dst)
+    if stats is not None:
+        stats.record(used, copied, time.perf_counter() - start)
+    return used
+
+
+# --- Resumed copy ---
+# A copy interrupted by a crash leaves a destination that is a prefix of
+# the source. Before continuing from its end, the last RESUME_CHECK_SIZE
+# bytes of that prefix are compared with the source, which catches a
+# different file under the same name and blocks that never reached disk.
+RESUME_CHECK_SIZE = 64 * 1024
+
+
+def destination_complete(src_st, dst_st):
+    # copystat runs after the data is written, so a matching mtime means the
+    # copy finished
+    return dst_st.st_size == src_st.st_size and abs(dst_st.st_mtime - src_st.st_mtime) <= MTIME_TOLERANCE
+
+
+def _prefix_matches(src_fd, dst_fd, offset):
+    n = min(offset, RESUME_CHECK_SIZE)
+    return os.pread(src_fd, n, offset - n) == os.pread(dst_fd, n, offset - n)
+
+
+def copy_file_resume(src, dst, stats=None):
+    # Continues a copy_file that was interrupted: a complete destination is
+    # left alone ('existing'), a valid partial one is extended from where it
+    # stopped, anything else is copied again from the start.
+    try:
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        return copy_file(src, dst, stats)
+    st = os.stat(src)
+    _check_not_same(src, dst, st)
+    if destination_complete(st, dst_st):
+        return 'existing'
+    offset = dst_st.st_size
+    if not 0 < offset < st.st_size or not hasattr(os, 'pread'):
+        return copy_file(src, dst, stats)
+
+    start = time.perf_counter()
+    src_fd = os.open(src, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        st = os.fstat(src_fd)
+        dst_fd = os.open(dst, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        try:
+            if not _prefix_matches(src_fd, dst_fd, offset):
+                offset = 0
+                os.ftruncate(dst_fd, 0)
+            used, copied = _copy_fds(src_fd, dst_fd, st, start=offset)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    _check_length(src, dst, copied, st.st_size - offset)
+    shutil.copystat(src, dst)
+    if stats is not None:
+        stats.record(used, copied, time.perf_counter() - start)
+    return used
+
+
+# --- Verified copy ---
+DIGEST_PREFIX = 'blake2b:'
+
+
+class VerificationError(OSError):
+    pass
+
+
+def file_digest(path):
+    return DIGEST_PREFIX + full_hash(path)
+
+
+def copy_file_verified(src, dst, stats=None, read_back=False):
+    # Buffered copy that hashes the data as it is written, so the source is
+    # read exactly once. With read_back the destination is flushed, dropped
+    # from the page cache where supported, and hashed again. Returns
+    # (strategy, digest).
+    start = time.perf_counter()
+    hasher = new_content_hasher()
+    src_fd = os.open(src, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        src_st = os.fstat(src_fd)
+        size = src_st.st_size
+        _check_not_same(src, dst, src_st)
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            copied = _copy_buffer(src_fd, dst_fd, size, hasher)
+            if read_back:
+                os.fsync(dst_fd)
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(dst_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    _check_length(src, dst, copied, size)
+    shutil.copystat(src, dst)
+    digest = DIGEST_PREFIX + hasher.hexdigest()
+    if read_back:
+        check = file_digest(dst)
+        if check != digest:
+            raise VerificationError(f"Checksum mismatch after copying {src} -> {dst}")
+    if stats is not None:
+        stats.record('buffer', copied, time.perf_counter() - start)
+    return 'buffer', digest
+
+
+def copy_file_verified_resume(src, dst, stats=None, read_back=False):
+    # The verified digest covers the source bytes as they were written, so a
+    # partial destination cannot be extended; only a complete one is kept,
+    # and its digest comes from re-reading it.
+    try:
+        src_st = os.stat(src)
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        pass
+    else:
+        _check_not_same(src, dst, src_st)
+        if destination_complete(src_st, dst_st):
+            return 'existing', file_digest(dst)
+    return copy_file_verified(src, dst, stats, read_back)
+
+
+def verify_destination(entry):
+    # True if the entry carries a digest and its destination still matches
+    # it, i.e. the source can be deleted safely
+    digest = entry.get('digest')
+    destination = entry.get('destination')
+    if not digest or not destination:
+        return False
+    try:
+        return file_digest(destination) == digest
+    except OSError:
+        return False
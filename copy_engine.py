@@ -0,0 +1,257 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from copy_backend import (CopyStats, copy_file, copy_file_verified, copy_file_resume,
+                          copy_file_verified_resume)
+import metrics
+
+# --- Copy defaults ---
+DEFAULT_COPY_WORKERS = 4
+DEFAULT_PER_SOURCE_LIMIT = 4
+DEFAULT_PER_DEST_LIMIT = 4
+
+
+class CopyJob:
+    def __init__(self, src, dest, file_date=None):
+        self.src = src
+        self.dest = dest
+        self.file_date = file_date
+        # Source size/mtime, filled in by planning when known
+        self.size = None
+        self.mtime = None
+        # Position in the session plan, for checkpointing
+        self.plan_index = None
+
+
+class CopyResult:
+    def __init__(self, index, job, ok, error=None, size=0, seconds=0.0, strategy=None, digest=None):
+        self.index = index
+        self.strategy = strategy
+        self.digest = digest
+        self.job = job
+        self.ok = ok
+        self.error = error
+        self.size = size
+        self.seconds = seconds
+
+
+class CopyProgress:
+    # Snapshot handed to the UI; written only by the log-writer thread
+    def __init__(self, total):
+        self.total = total
+        self.completed = 0
+        self.copied = 0
+        self.failed = 0
+        self.bytes_copied = 0
+        self.current = ''
+        self.started_at = time.monotonic()
+        # True while jobs are still arriving from a streaming source; total
+        # then counts the jobs handed out so far
+        self.streaming = False
+        self.finished = False
+        self.cancelled = False
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def files_per_sec(self):
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mb_per_sec(self):
+        return self.bytes_copied / (1024 * 1024) / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def _device_of(path):
+    # st_dev of the nearest existing ancestor, used to group concurrency limits
+    while path:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+    return None
+
+
+# --- Copy engine ---
+class CopyEngine:
+    # Copies run on a bounded thread pool. A dispatcher thread hands out jobs
+    # while honouring separate concurrency limits per source device and per
+    # destination device. Completions go through a queue to a single
+    # log-writer thread, which calls on_result in job order, so log writes
+    # never race and progress reads like the plan.
+    def __init__(self, workers=DEFAULT_COPY_WORKERS, per_source_limit=DEFAULT_PER_SOURCE_LIMIT,
+                 per_dest_limit=DEFAULT_PER_DEST_LIMIT, copy_func=None, on_result=None,
+                 verify=False, read_back=False, resume=False, make_dirs=True):
+        self.workers = max(1, workers)
+        self.per_source_limit = max(1, per_source_limit)
+        self.per_dest_limit = max(1, per_dest_limit)
+        # copy_func(src, dest) may return the strategy it used, or a
+        # (strategy, digest) pair when it checksums the copy. With resume,
+        # destinations left by an interrupted run are kept or continued.
+        self.copy_stats = CopyStats()
+        if copy_func is None:
+            if verify:
+                verified = copy_file_verified_resume if resume else copy_file_verified
+                copy_func = lambda src, dest: verified(src, dest, self.copy_stats, read_back)
+            else:
+                plain = copy_file_resume if resume else copy_file
+                copy_func = lambda src, dest: plain(src, dest, self.copy_stats)
+        self.copy_func = copy_func
+        # Off when the caller has already created every destination folder
+        self.make_dirs = make_dirs
+        self.on_result = on_result
+        self.progress = CopyProgress(0)
+        self.cancel_event = threading.Event()
+        self._results = queue.Queue()
+        self._semaphores = {}
+        self._device_cache = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def done(self):
+        return self.progress.finished
+
+    def _semaphore(self, kind, device, limit):
+        with self._lock:
+            key = (kind, device)
+            sem = self._semaphores.get(key)
+            if sem is None:
+                sem = self._semaphores[key] = threading.BoundedSemaphore(limit)
+            return sem
+
+    def _device(self, path):
+        directory = os.path.dirname(path)
+        device = self._device_cache.get(directory)
+        if device is None:
+            device = self._device_cache[directory] = _device_of(directory)
+        return device
+
+    def _copy_one(self, index, job, release):
+        start = time.perf_counter()
+        try:
+            if self.make_dirs:
+                os.makedirs(os.path.dirname(job.dest), exist_ok=True)
+            strategy = self.copy_func(job.src, job.dest)
+            digest = None
+            if isinstance(strategy, tuple):
+                strategy, digest = strategy
+            size = os.path.getsize(job.dest)
+            result = CopyResult(index, job, True, size=size, seconds=time.perf_counter() - start,
+                                strategy=strategy, digest=digest)
+        except Exception as e:
+            result = CopyResult(index, job, False, error=e, seconds=time.perf_counter() - start)
+        finally:
+            for sem in release:
+                sem.release()
+        self._results.put(result)
+
+    def _acquire(self, sem):
+        # Poll so a cancel is noticed while waiting for a slot
+        while not sem.acquire(timeout=0.2):
+            if self.cancel_event.is_set():
+                return False
+        return True
+
+    def _dispatch(self, jobs, pool):
+        submitted = 0
+        progress = self.progress
+        try:
+            # Jobs are pulled one at a time once a slot is free, so a
+            # streaming source is never read further ahead than the copies
+            for index, job in enumerate(jobs):
+                if self.cancel_event.is_set():
+                    break
+                if progress.streaming:
+                    progress.total = index + 1
+                source_sem = self._semaphore('source', self._device(job.src), self.per_source_limit)
+                dest_sem = self._semaphore('dest', self._device(job.dest), self.per_dest_limit)
+                if not self._acquire(source_sem):
+                    break
+                if not self._acquire(dest_sem):
+                    source_sem.release()
+                    break
+                pool.submit(self._copy_one, index, job, (source_sem, dest_sem))
+                submitted += 1
+        finally:
+            progress.streaming = False
+            pool.shutdown(wait=True)
+            # Tell the writer how many results to expect
+            self._results.put(submitted)
+
+    def _write_results(self):
+        progress = self.progress
+        pending = {}
+        next_index = 0
+        expected = None
+        received = 0
+        while expected is None or received < expected:
+            item = self._results.get()
+            if isinstance(item, int):
+                expected = item
+                continue
+            received += 1
+            pending[item.index] = item
+            # Emit strictly in job order
+            while next_index in pending:
+                result = pending.pop(next_index)
+                next_index += 1
+                self._emit(result)
+        # Results after a gap left by cancellation
+        for index in sorted(pending):
+            self._emit(pending[index])
+        progress.cancelled = self.cancel_event.is_set()
+        progress.finished = True
+
+    def _emit(self, result):
+        progress = self.progress
+        metrics.record(metrics.COPY, result.seconds, result.job.src, result.size, result.ok)
+        if self.on_result is not None:
+            try:
+                self.on_result(result)
+            except Exception as e:
+                logging.error(f"Failed to record copy of {result.job.src}: {e}")
+        progress.completed += 1
+        if result.ok:
+            progress.copied += 1
+            progress.bytes_copied += result.size
+        else:
+            progress.failed += 1
+        progress.current = result.job.src
+
+    def start(self, jobs):
+        # jobs is a list, or any other iterable (e.g. a pipeline.JobStream)
+        # to copy files while they are still being found
+        sized = isinstance(jobs, (list, tuple))
+        self.progress = CopyProgress(len(jobs) if sized else 0)
+        self.progress.streaming = not sized
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='copy')
+        self._threads = [
+            threading.Thread(target=self._dispatch, args=(jobs, pool), daemon=True),
+            threading.Thread(target=self._write_results, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        return self.progress
+
+    def wait(self):
+        for t in self._threads:
+            t.join()
+        return self.progress
+
+    def run(self, jobs):
+        # Blocking convenience for headless callers
+        self.start(jobs)
+        return self.wait()
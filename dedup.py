@@ -0,0 +1,186 @@
+import os
+import hashlib
+import logging
+
+# --- Content hashing ---
+PARTIAL_HASH_SIZE = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# FAT/exFAT cards store mtimes at 2-second resolution
+MTIME_TOLERANCE = 2.0
+
+
+def partial_hash(path, size=None):
+    # Size plus the first and last PARTIAL_HASH_SIZE bytes: cheap, and
+    # enough to tell almost all same-size media files apart
+    if size is None:
+        size = os.path.getsize(path)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(PARTIAL_HASH_SIZE))
+        if size > PARTIAL_HASH_SIZE:
+            f.seek(max(PARTIAL_HASH_SIZE, size - PARTIAL_HASH_SIZE))
+            h.update(f.read(PARTIAL_HASH_SIZE))
+    return h.hexdigest()
+
+
+def new_content_hasher():
+    # Shared by full_hash and the verified copy path, so digests compare
+    return hashlib.blake2b(digest_size=32)
+
+
+def full_hash(path):
+    h = new_content_hasher()
+    buf = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+class ContentIndex:
+    # Known files grouped by size. Hashes are only computed when two files
+    # share a size (partial hash) and then a partial hash (full hash), and
+    # are cached per path.
+    def __init__(self):
+        self.by_size = {}
+        self._partial = {}
+        self._full = {}
+        self._indexed_dirs = set()
+
+    def add(self, path, size):
+        self.by_size.setdefault(size, set()).add(path)
+
+    def index_directory(self, directory):
+        if directory in self._indexed_dirs:
+            return
+        self._indexed_dirs.add(directory)
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        self.add(entry.path, entry.stat(follow_symlinks=False).st_size)
+        except FileNotFoundError:
+            pass
+
+    def _partial_of(self, path, size):
+        digest = self._partial.get(path)
+        if digest is None:
+            digest = self._partial[path] = partial_hash(path, size)
+        return digest
+
+    def _full_of(self, path):
+        digest = self._full.get(path)
+        if digest is None:
+            digest = self._full[path] = full_hash(path)
+        return digest
+
+    def find_duplicate(self, path, size):
+        candidates = self.by_size.get(size)
+        if not candidates:
+            return None
+        for candidate in candidates:
+            if candidate == path:
+                continue
+            try:
+                if self._partial_of(candidate, size) != self._partial_of(path, size):
+                    continue
+                if self._full_of(candidate) == self._full_of(path):
+                    return candidate
+            except OSError as e:
+                logging.warning(f"Cannot hash {candidate} or {path}: {e}")
+        return None
+
+
+# --- Incremental check ---
+def already_transferred(src, st, log_index):
+    # True if the log has an entry for src whose recorded size/mtime (or,
+    # for older entries without them, whose destination file) still
+    # matches the source
+    for entry in log_index.by_source.get(src, {}).values():
+        size = entry.get('size')
+        mtime = entry.get('mtime')
+        if size is None or mtime is None:
+            try:
+                dest_st = os.stat(entry.get('destination'))
+            except (OSError, TypeError):
+                continue
+            size, mtime = dest_st.st_size, dest_st.st_mtime
+        if size == st.st_size and abs(mtime - st.st_mtime) <= MTIME_TOLERANCE:
+            return True
+    return False
+
+
+def unique_destination(dest, taken=()):
+    # "IMG_0001.jpg" -> "IMG_0001 (1).jpg", "IMG_0001 (2).jpg", ...
+    base, ext = os.path.splitext(dest)
+    n = 1
+    candidate = f"{base} ({n}){ext}"
+    while candidate in taken or os.path.lexists(candidate):
+        n += 1
+        candidate = f"{base} ({n}){ext}"
+    return candidate
+
+
+# --- Transfer planning ---
+class TransferPlan:
+    def __init__(self):
+        self.jobs = []
+        self.skipped = []   # (job, reason, detail)
+        self.renamed = []   # (job, original destination)
+
+
+class TransferPlanner:
+    # Filters copy jobs for the "only new files" (incremental) and
+    # duplicate-skipping (dedup) modes. Without dedup, name collisions
+    # overwrite as before; with it, true duplicates are skipped and
+    # different files with the same name are renamed. Known content and
+    # planned names carry over between calls, so batches of a streaming
+    # scan are checked against each other too.
+    def __init__(self, log_index=None, incremental=False, dedup=False):
+        self.log_index = log_index
+        self.incremental = incremental
+        self.content = ContentIndex() if dedup else None
+        self.planned = set()
+
+    def plan(self, jobs):
+        plan = TransferPlan()
+        content = self.content
+        planned = self.planned
+        for job in jobs:
+            try:
+                st = os.stat(job.src)
+            except OSError:
+                # Let the copy itself report the error
+                plan.jobs.append(job)
+                continue
+            job.size = st.st_size
+            job.mtime = st.st_mtime
+
+            if self.incremental and self.log_index is not None and already_transferred(job.src, st, self.log_index):
+                plan.skipped.append((job, 'already transferred', None))
+                continue
+
+            if content is not None:
+                content.index_directory(os.path.dirname(job.dest))
+                duplicate = content.find_duplicate(job.src, st.st_size)
+                if duplicate is not None:
+                    plan.skipped.append((job, 'duplicate', duplicate))
+                    continue
+                if job.dest in planned or os.path.lexists(job.dest):
+                    original = job.dest
+                    job.dest = unique_destination(job.dest, planned)
+                    plan.renamed.append((job, original))
+                # Later copies of the same content are duplicates too
+                content.add(job.src, st.st_size)
+
+            planned.add(job.dest)
+            plan.jobs.append(job)
+        return plan
+
+
+def plan_transfer(jobs, log_index=None, incremental=False, dedup=False):
+    return TransferPlanner(log_index, incremental, dedup).plan(jobs)
@@ -0,0 +1,208 @@
+import os
+import time
+from datetime import datetime
+
+# --- Directory date summaries ---
+# For every scanned directory the metadata cache keeps its mtime, the
+# min/max media date of the files directly in it and of its whole subtree,
+# and the names of its child directories. A later scan with a date window
+# skips a subtree whose range lies outside the window as long as neither
+# the directory nor any directory below it has a new mtime: adding,
+# removing or renaming an entry changes the parent directory's mtime, so
+# unchanged mtimes mean the recorded children and ranges still describe
+# the tree. Checking costs one stat per directory and reads no files.
+# Files rewritten in place (no rename) are not noticed, except those
+# whose date came from their mtime rather than a header: touching such a
+# file moves its date without changing the directory, so each directory
+# also records their names and mtimes, and checking stats them again.
+#
+# A directory listed within RACY_NS of its mtime may still have been
+# changing while it was read, so its record is never trusted; neither is
+# one holding an mtime-dated file that changed that close to the listing.
+RACY_NS = 2 * 10 ** 9
+
+
+class DirectoryRecord:
+    __slots__ = ('mtime_ns', 'listed_ns', 'own_min', 'own_max', 'sub_min', 'sub_max', 'children', 'mtime_dated')
+
+    def __init__(self, mtime_ns, listed_ns, own_min, own_max, sub_min, sub_max, children, mtime_dated=None):
+        self.mtime_ns = mtime_ns
+        self.listed_ns = listed_ns
+        self.own_min = own_min
+        self.own_max = own_max
+        self.sub_min = sub_min
+        self.sub_max = sub_max
+        self.children = children   # child directory names
+        # File name -> mtime_ns of files dated by their mtime
+        self.mtime_dated = mtime_dated or {}
+
+    def as_row(self, path):
+        mtime_dated = '\0'.join(f"{name}\0{mtime_ns}" for name, mtime_ns in self.mtime_dated.items())
+        return (path, self.mtime_ns, self.listed_ns, self.own_min, self.own_max, self.sub_min, self.sub_max,
+                '\0'.join(self.children), mtime_dated)
+
+    @classmethod
+    def from_row(cls, row):
+        children = row[7].split('\0') if row[7] else []
+        fields = row[8].split('\0') if row[8] else []
+        mtime_dated = {fields[i]: int(fields[i + 1]) for i in range(0, len(fields) - 1, 2)}
+        return cls(row[1], row[2], row[3], row[4], row[5], row[6], children, mtime_dated)
+
+
+def _widen(low, high, other_low, other_high):
+    # Dates are ISO strings, which sort like the datetimes they encode
+    if other_low is not None and (low is None or other_low < low):
+        low = other_low
+    if other_high is not None and (high is None or other_high > high):
+        high = other_high
+    return low, high
+
+
+class _Listing:
+    __slots__ = ('key', 'mtime_ns', 'listed_ns', 'low', 'high', 'complete', 'children', 'mtime_dated')
+
+    def __init__(self, key, mtime_ns, listed_ns, children):
+        self.key = key
+        self.mtime_ns = mtime_ns
+        self.listed_ns = listed_ns
+        self.low = None
+        self.high = None
+        self.complete = True
+        self.children = children
+        self.mtime_dated = {}
+
+
+class DirectorySummaries:
+    # Used by one scan: answers should_skip() while walking, collects the
+    # dates of the files it resolves and writes the new summaries back
+    # with commit() once the scan has covered the whole tree.
+    def __init__(self, cache, root, start_dt=None, end_dt=None):
+        self.cache = cache
+        self.root = os.path.abspath(root)
+        self.start = start_dt.isoformat() if start_dt else None
+        self.end = end_dt.isoformat() if end_dt else None
+        self.records = cache.load_directories(self.root)
+        self.dirs_checked = 0
+        # Keyed by the walker's own path spelling (see begin)
+        self._listings = {}
+        self._kept = set()
+
+    @property
+    def windowed(self):
+        return self.start is not None or self.end is not None
+
+    def _outside(self, record):
+        if record.sub_min is None:
+            # No media anywhere below
+            return True
+        return (self.end is not None and record.sub_min > self.end) or \
+               (self.start is not None and record.sub_max < self.start)
+
+    def _unchanged(self, key, record):
+        stack = [(key, record)]
+        while stack:
+            path, rec = stack.pop()
+            self.dirs_checked += 1
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                return False
+            if mtime_ns != rec.mtime_ns or rec.listed_ns - rec.mtime_ns < RACY_NS:
+                return False
+            for name, file_mtime_ns in rec.mtime_dated.items():
+                try:
+                    if os.stat(os.path.join(path, name)).st_mtime_ns != file_mtime_ns:
+                        return False
+                except OSError:
+                    return False
+            for name in rec.children:
+                child_key = os.path.join(path, name)
+                child = self.records.get(child_key)
+                if child is None:
+                    return False
+                stack.append((child_key, child))
+        return True
+
+    # --- Walk hooks ---
+    def should_skip(self, path):
+        if not self.windowed:
+            return False
+        key = os.path.abspath(path)
+        record = self.records.get(key)
+        if record is None or not self._outside(record) or not self._unchanged(key, record):
+            return False
+        self._kept.add(key)
+        return True
+
+    def begin(self, path, mtime_ns, listed_ns, subdirs):
+        # dirname(join(path, x)) is how file_resolved will spell this
+        # directory, whatever trailing separators path has
+        raw = os.path.dirname(os.path.join(path, '_'))
+        self._listings[raw] = _Listing(os.path.abspath(path), mtime_ns, listed_ns,
+                                       [os.path.basename(sub) for sub in subdirs])
+
+    def file_resolved(self, file_path, file_date):
+        listing = self._listings.get(os.path.dirname(file_path))
+        if listing is None:
+            return
+        if file_date is None:
+            listing.complete = False
+            return
+        # get_file_date falls back to the mtime when a file has no header
+        # date; a header date equal to the mtime is treated the same way,
+        # which only costs a stat when checking
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            listing.complete = False
+            return
+        if file_date == datetime.fromtimestamp(st.st_mtime):
+            if listing.listed_ns - st.st_mtime_ns < RACY_NS:
+                listing.complete = False
+                return
+            listing.mtime_dated[os.path.basename(file_path)] = st.st_mtime_ns
+        value = file_date.isoformat()
+        listing.low, listing.high = _widen(listing.low, listing.high, value, value)
+
+    # --- Saving ---
+    def commit(self):
+        listings = {listing.key: listing for listing in self._listings.values()}
+        fresh = {}
+        # Children before parents
+        for key in sorted(listings, key=lambda k: k.count(os.sep), reverse=True):
+            listing = listings[key]
+            complete = listing.complete
+            sub_min, sub_max = listing.low, listing.high
+            for name in listing.children:
+                child_key = os.path.join(key, name)
+                child = fresh.get(child_key)
+                if child is None and child_key in self._kept:
+                    child = self.records.get(child_key)
+                if child is None:
+                    complete = False
+                    break
+                sub_min, sub_max = _widen(sub_min, sub_max, child.sub_min, child.sub_max)
+            if complete:
+                fresh[key] = DirectoryRecord(listing.mtime_ns, listing.listed_ns, listing.low, listing.high,
+                                             sub_min, sub_max, listing.children, listing.mtime_dated)
+
+        # Records below skipped subtrees stay; any other old record under
+        # the root is stale (deleted, changed or incomplete directory)
+        kept = set()
+        stack = list(self._kept)
+        while stack:
+            key = stack.pop()
+            if key in kept or key not in self.records:
+                continue
+            kept.add(key)
+            stack.extend(os.path.join(key, name) for name in self.records[key].children)
+        removed = [key for key in self.records if key not in fresh and key not in kept]
+        self.cache.save_directories([record.as_row(key) for key, record in fresh.items()], removed)
+        return len(fresh), len(removed)
+
+
+def listing_times(path):
+    # (mtime_ns, listed_ns) taken before a directory is listed, so a change
+    # made while listing shows up as a newer mtime next time
+    listed_ns = time.time_ns()
+    return os.stat(path).st_mtime_ns, listed_ns
@@ -1,28 +1,36 @@
 import os
-import shutil
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
+from tkinter import font as tkfont
 from datetime import datetime
-from PIL import Image
+from collections import OrderedDict
 import json
 import logging
-
-# --- Logging Setup ---
-logging.basicConfig(filename='photo_transfer.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-# --- Tkinter setup ---
-root = tk.Tk()
-root.title("Phone Media Manager")
-
-root.attributes('-fullscreen', False)
-
-# Styling
-style = ttk.Style()
-try:
-    style.theme_use('clam')
-except Exception:
-    pass
+import queue
+import threading
+import itertools
+
+from media_dates import set_metadata_cache
+from metadata_cache import open_metadata_cache
+from scanner import MediaScanner
+from copy_engine import CopyEngine
+from bulk_delete import BulkDeleter
+from pipeline import JobStream
+import metrics
+import thumbnails
+from transfer_store import TransferLogStore, log_file
+from transfer_core import (AUDIT_LOG_FILE, setup_logging, ensure_transfer_log_file, build_copy_jobs,
+                           create_destination_folders, stream_plan_options, TransferSession)
+from layout_planner import LAYOUT_TEMPLATES, DEFAULT_LAYOUT
+from audit_log import AuditLog, SessionSummaryIndex, LEVELS
+from session_plan import list_incomplete_sessions
+from virtual_tree import VirtualTree
+
+# Tk root and the metadata cache are created in main(), so this module can
+# be imported without a display
+root = None
+metadata_cache = None
+session_summary_index = None
 
 PRIMARY_BG = '#0f1115'
 SECONDARY_BG = '#151924'
@@ -31,78 +39,48 @@ ACCENT_HOVER = '#8fb5ff'
 TEXT_PRIMARY = '#e5e9f0'
 TEXT_SECONDARY = '#a9b1d6'
 
-root.configure(bg=PRIMARY_BG)
-
-style.configure('TFrame', background=PRIMARY_BG)
-style.configure('Secondary.TFrame', background=SECONDARY_BG)
-style.configure('Header.TLabel', background=PRIMARY_BG, foreground=TEXT_PRIMARY,
-                font=('Segoe UI', 24, 'bold'))
-style.configure('Subheader.TLabel', background=PRIMARY_BG, foreground=TEXT_SECONDARY,
-                font=('Segoe UI', 12))
-style.configure('Card.TFrame', background=SECONDARY_BG)
-style.configure('Primary.TButton', font=('Segoe UI', 12, 'bold'), padding=(16, 12))
-style.map('Primary.TButton',
-          background=[('!disabled', SECONDARY_BG), ('active', '#1b2130')],
-          foreground=[('!disabled', TEXT_PRIMARY)],
-          relief=[('pressed', 'sunken'), ('!pressed', 'raised')])
-style.configure('Primary.TButton', background=SECONDARY_BG, foreground=TEXT_PRIMARY, borderwidth=0)
-style.configure('Accent.TButton', font=('Segoe UI', 12, 'bold'), padding=(16, 12),
-                background=ACCENT, foreground='#0b0e14')
-style.map('Accent.TButton', background=[('active', ACCENT_HOVER)])
-style.configure('Body.TLabel', background=PRIMARY_BG, foreground=TEXT_SECONDARY, font=('Segoe UI', 10))
-# Ensure base layout exists for custom progressbar style
-style.layout('lux.Progressbar', style.layout('Horizontal.TProgressbar'))
-style.configure('lux.Progressbar', troughcolor=SECONDARY_BG, background=ACCENT, bordercolor=SECONDARY_BG,
-                lightcolor=ACCENT, darkcolor=ACCENT)
-
-# --- File extensions ---
-image_extensions = ('.jpg', '.jpeg', '.png', '.heic')
-video_extensions = ('.mp4', '.mov', '.avi', '.mkv')
-
-# --- Helper to get file date ---
-def get_file_date(file_path):
+# --- Styling ---
+def configure_styles():
+    style = ttk.Style()
     try:
-        if file_path.lower().endswith(image_extensions):
-            img = Image.open(file_path)
-            exif_data = img._getexif()
-            if exif_data:
-                date_str = exif_data.get(36867)
-                if date_str:
-                    return datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-        timestamp = os.path.getmtime(file_path)
-        return datetime.fromtimestamp(timestamp)
-    except Exception as e:
-        logging.warning(f"Cannot read metadata for {file_path}: {e}")
-        return datetime.fromtimestamp(os.path.getmtime(file_path))
+        style.theme_use('clam')
+    except Exception:
+        pass
+
+    style.configure('TFrame', background=PRIMARY_BG)
+    style.configure('Secondary.TFrame', background=SECONDARY_BG)
+    style.configure('Header.TLabel', background=PRIMARY_BG, foreground=TEXT_PRIMARY,
+                    font=('Segoe UI', 24, 'bold'))
+    style.configure('Subheader.TLabel', background=PRIMARY_BG, foreground=TEXT_SECONDARY,
+                    font=('Segoe UI', 12))
+    style.configure('Card.TFrame', background=SECONDARY_BG)
+    style.configure('Primary.TButton', font=('Segoe UI', 12, 'bold'), padding=(16, 12))
+    style.map('Primary.TButton',
+              background=[('!disabled', SECONDARY_BG), ('active', '#1b2130')],
+              foreground=[('!disabled', TEXT_PRIMARY)],
+              relief=[('pressed', 'sunken'), ('!pressed', 'raised')])
+    style.configure('Primary.TButton', background=SECONDARY_BG, foreground=TEXT_PRIMARY, borderwidth=0)
+    style.configure('Accent.TButton', font=('Segoe UI', 12, 'bold'), padding=(16, 12),
+                    background=ACCENT, foreground='#0b0e14')
+    style.map('Accent.TButton', background=[('active', ACCENT_HOVER)])
+    style.configure('Body.TLabel', background=PRIMARY_BG, foreground=TEXT_SECONDARY, font=('Segoe UI', 10))
+    # Ensure base layout exists for custom progressbar style
+    style.layout('lux.Progressbar', style.layout('Horizontal.TProgressbar'))
+    style.configure('lux.Progressbar', troughcolor=SECONDARY_BG, background=ACCENT, bordercolor=SECONDARY_BG,
+                    lightcolor=ACCENT, darkcolor=ACCENT)
 
 # --- Locked JSON log file path ---
-log_file = 'transfer_log.json'
+transfer_store = TransferLogStore(log_file)
 
 def load_transfer_log():
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r') as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
+    try:
+        return transfer_store.load()
+    except Exception as e:
+        logging.error(f"Cannot load transfer log: {e}")
+        return {}
 
 def save_transfer_log(data):
-    with open(log_file, 'w') as f:
-        json.dump(data, f, indent=4)
-
-# --- Initialize transfer log (create if missing, then read) ---
-def ensure_transfer_log_file():
-    if not os.path.exists(log_file):
-        try:
-            with open(log_file, 'w') as f:
-                json.dump({}, f)
-        except Exception:
-            pass
-
-ensure_transfer_log_file()
-# Global in-memory store for the transfer log
-transfer_log = load_transfer_log()
+    transfer_store.replace(data)
 
 # --- Center Window Helper ---
 def center_window(win, width=None, height=None):
@@ -114,6 +92,140 @@ def center_window(win, width=None, height=None):
     y = (win.winfo_screenheight() // 2) - (height // 2)
     win.geometry(f"{width}x{height}+{x}+{y}")
 
+# --- Busy Dialog Helper ---
+def run_with_busy_dialog(title, text, func):
+    # Runs func on a background thread behind a modal indeterminate progress
+    # dialog and returns its result, or None if it raised.
+    result = {'value': None, 'error': None}
+
+    def worker():
+        try:
+            result['value'] = func()
+        except Exception as e:
+            result['error'] = e
+
+    dlg = tk.Toplevel(root)
+    dlg.title(title)
+    dlg.configure(bg=PRIMARY_BG)
+    dlg.transient(root)
+    dlg.grab_set()
+    dlg.protocol('WM_DELETE_WINDOW', lambda: None)
+
+    container = ttk.Frame(dlg, style='Secondary.TFrame')
+    container.pack(padx=24, pady=24, fill='both', expand=True)
+    ttk.Label(container, text=text, style='Body.TLabel').pack(padx=10, pady=(10, 6), anchor='w')
+    bar = ttk.Progressbar(container, length=500, mode='indeterminate', style='lux.Progressbar')
+    bar.pack(padx=10, pady=(0, 10), fill='x')
+    bar.start(15)
+    center_window(dlg, 640, 140)
+
+    thread = threading.Thread(target=worker, daemon=True)
+
+    def poll():
+        if thread.is_alive():
+            dlg.after(100, poll)
+        else:
+            bar.stop()
+            dlg.destroy()
+
+    thread.start()
+    dlg.after(100, poll)
+    dlg.wait_window()
+    if result['error'] is not None:
+        logging.error(f"{title} failed: {result['error']}")
+        messagebox.showerror("Error", f"{title} failed: {result['error']}")
+        return None
+    return result['value']
+
+# --- Metadata cache reporting ---
+def report_scan_stats(source_folder, scanner):
+    logging.info(f"SCAN_STATS source={source_folder} {json.dumps(scanner.stats.as_dict())}")
+    report_metadata_cache_stats()
+
+def report_metadata_cache_stats():
+    if metadata_cache is None:
+        return
+    metadata_cache.flush()
+    stats = metadata_cache.session_stats()
+    logging.info(f"CACHE_STATS hits={stats['hits']} misses={stats['misses']} "
+                 f"hit_ratio={stats['hit_ratio']:.1%} entries={stats['entries']}")
+    metadata_cache.reset_session_stats()
+
+# --- Scan Dialog ---
+def scan_with_progress(source_folder, start_dt, end_dt):
+    # Runs the scan engine on a background thread and polls its batches from
+    # the Tk loop, so the window stays responsive on large sources.
+    # Returns the matched (path, datetime) list, or None if cancelled.
+    scanner = MediaScanner()
+    batches = queue.Queue()
+    matched_files = []
+    result = {'cancelled': False, 'error': None}
+
+    def worker():
+        try:
+            for batch in scanner.scan(source_folder, start_dt, end_dt):
+                batches.put(batch)
+        except Exception as e:
+            result['error'] = e
+        finally:
+            batches.put(None)
+
+    dlg = tk.Toplevel(root)
+    dlg.title("Scanning Source")
+    dlg.configure(bg=PRIMARY_BG)
+    dlg.transient(root)
+    dlg.grab_set()
+
+    container = ttk.Frame(dlg, style='Secondary.TFrame')
+    container.pack(padx=24, pady=24, fill='both', expand=True)
+    status_label = ttk.Label(container, text="Scanning...", style='Body.TLabel')
+    status_label.pack(padx=10, pady=(10, 6), anchor='w')
+    bar = ttk.Progressbar(container, length=500, mode='indeterminate', style='lux.Progressbar')
+    bar.pack(padx=10, pady=(0, 10), fill='x')
+    bar.start(15)
+
+    def on_cancel():
+        result['cancelled'] = True
+        scanner.cancel()
+        status_label.config(text="Cancelling...")
+
+    ttk.Button(container, text="Cancel", style='Primary.TButton', command=on_cancel).pack(anchor='e')
+    dlg.protocol('WM_DELETE_WINDOW', on_cancel)
+    center_window(dlg, 640, 200)
+
+    def poll():
+        finished = False
+        try:
+            while True:
+                batch = batches.get_nowait()
+                if batch is None:
+                    finished = True
+                    break
+                matched_files.extend(batch)
+        except queue.Empty:
+            pass
+        stats = scanner.stats
+        status_label.config(text=f"Scanned {stats.files_resolved} of {stats.files_discovered} files, "
+                                 f"{stats.files_matched} matched ({stats.files_per_sec:.0f} files/sec)")
+        if finished:
+            bar.stop()
+            dlg.destroy()
+        else:
+            dlg.after(100, poll)
+
+    threading.Thread(target=worker, daemon=True).start()
+    dlg.after(100, poll)
+    dlg.wait_window()
+
+    report_scan_stats(source_folder, scanner)
+    if result['error'] is not None:
+        logging.error(f"Scan failed for {source_folder}: {result['error']}")
+        messagebox.showerror("Error", f"Scan failed: {result['error']}")
+        return None
+    if result['cancelled']:
+        return None
+    return matched_files
+
 # --- Transfer Function ---
 def transfer_files():
     source_folder = filedialog.askdirectory(title="Select Source Folder")
@@ -163,6 +275,32 @@ def transfer_files():
         end_year.current(len(years)-1)
         end_year.grid(row=3, column=4, padx=(0,8), pady=(0,12))
 
+        # Transfer options
+        incremental_var = tk.BooleanVar(value=False)
+        dedup_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="Only new files (skip files already transferred)", variable=incremental_var,
+                        style='Body.TLabel').grid(row=4, column=0, columnspan=6, sticky='w', pady=(0,4))
+        ttk.Checkbutton(frame, text="Skip duplicates and rename name collisions", variable=dedup_var,
+                        style='Body.TLabel').grid(row=5, column=0, columnspan=6, sticky='w', pady=(0,4))
+        verify_var = tk.BooleanVar(value=False)
+        read_back_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="Verify copies with a checksum", variable=verify_var,
+                        style='Body.TLabel').grid(row=6, column=0, columnspan=6, sticky='w', pady=(0,4))
+        ttk.Checkbutton(frame, text="Re-read destination to confirm checksum", variable=read_back_var,
+                        style='Body.TLabel').grid(row=7, column=0, columnspan=6, sticky='w', pady=(0,4))
+
+        # Folder layout
+        ttk.Label(frame, text="Folder layout", style='Body.TLabel').grid(row=8, column=0, columnspan=2, sticky='w', pady=(0,12))
+        layout_box = ttk.Combobox(frame, values=list(LAYOUT_TEMPLATES), state='readonly', width=16)
+        layout_box.set(DEFAULT_LAYOUT)
+        layout_box.grid(row=8, column=2, columnspan=4, sticky='w', pady=(0,12))
+        stream_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="Start copying while scanning (choose destination first)", variable=stream_var,
+                        style='Body.TLabel').grid(row=9, column=0, columnspan=6, sticky='w', pady=(0,4))
+        profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="Record a CPU profile of this transfer (slower)", variable=profile_var,
+                        style='Body.TLabel').grid(row=10, column=0, columnspan=6, sticky='w', pady=(0,12))
+
         result = {'ok': False}
 
         def on_ok():
@@ -181,6 +319,10 @@ def transfer_files():
                 result['ok'] = True
                 result['start'] = start_dt
                 result['end'] = end_dt
+                result['options'] = {'incremental': incremental_var.get(), 'dedup': dedup_var.get(),
+                                     'verify': verify_var.get() or read_back_var.get(),
+                                     'read_back': read_back_var.get(), 'layout': layout_box.get(),
+                                     'stream': stream_var.get(), 'profile': profile_var.get()}
                 dlg.destroy()
             except Exception:
                 messagebox.showerror("Error", "Invalid date selection.", parent=dlg)
@@ -189,32 +331,37 @@ def transfer_files():
             dlg.destroy()
 
         btns = ttk.Frame(frame, style='Secondary.TFrame')
-        btns.grid(row=4, column=0, columnspan=6, sticky='e')
+        btns.grid(row=11, column=0, columnspan=6, sticky='e')
         ttk.Button(btns, text="OK", style='Accent.TButton', command=on_ok).grid(row=0,column=0,padx=8)
         ttk.Button(btns, text="Cancel", style='Primary.TButton', command=on_cancel).grid(row=0,column=1)
 
         dlg.update_idletasks()
-        center_window(dlg, 520, 280)
+        center_window(dlg, 520, 530)
         dlg.wait_window()
         if result.get('ok'):
-            return result['start'], result['end']
+            return result['start'], result['end'], result['options']
         return None
 
     date_range = date_range_dialog(root)
     if not date_range:
         return
-    start_dt, end_dt = date_range
+    start_dt, end_dt, options = date_range
+    # Per-stage metrics (and optionally a profile) for this transfer; the
+    # session writes them when it finishes
+    metrics.begin_session(profile=options['profile'])
+    try:
+        if options['stream']:
+            stream_files(source_folder, start_dt, end_dt, options)
+        else:
+            copy_files(source_folder, start_dt, end_dt, options)
+    finally:
+        metrics.end_session()
 
+def copy_files(source_folder, start_dt, end_dt, options):
     # Collect media files
-    matched_files = []
-    for root_dir, _, files in os.walk(source_folder):
-        for file in files:
-            if file.lower().endswith(image_extensions + video_extensions):
-                full_path = os.path.join(root_dir, file)
-                dt = get_file_date(full_path)
-                if start_dt <= dt <= end_dt:
-                    matched_files.append((full_path, dt))
-
+    matched_files = scan_with_progress(source_folder, start_dt, end_dt)
+    if matched_files is None:
+        return
     if not matched_files:
         messagebox.showinfo("No files", "No media files found in the selected date range.")
         return
@@ -223,9 +370,86 @@ def transfer_files():
     if not dest_folder:
         return
 
-    # Progress window
+    session = TransferSession(transfer_store, source_folder, dest_folder)
+    # Camera layouts read each file's EXIF, so plan behind a busy dialog
+    jobs = run_with_busy_dialog("Planning Folders", "Working out destination folders...",
+                                lambda: build_copy_jobs(matched_files, dest_folder, options['layout']))
+    if jobs is None:
+        return
+
+    if options['incremental'] or options['dedup']:
+        jobs = run_with_busy_dialog("Planning Transfer", "Checking for already transferred and duplicate files...",
+                                    lambda: session.plan(jobs, incremental=options['incremental'],
+                                                         dedup=options['dedup']))
+        if jobs is None:
+            return
+        if not jobs:
+            messagebox.showinfo("No files", f"All {len(session.skipped)} matching files were skipped as already transferred or duplicates.")
+            return
+
+    session.start_plan(jobs, {'verify': options['verify'], 'read_back': options['read_back']})
+    create_destination_folders(jobs)
+    engine = CopyEngine(on_result=session.record_result, verify=options['verify'], read_back=options['read_back'],
+                        make_dirs=False)
+    run_engine_with_progress(engine, jobs, session_id=session.session_id)
+    session.finish(engine)
+    show_transfer_result(session, engine)
+
+def stream_files(source_folder, start_dt, end_dt, options):
+    # Streaming mode: the destination is chosen up front and copying starts
+    # with the first scan batch instead of after the whole scan
+    dest_folder = filedialog.askdirectory(title="Select Destination Folder")
+    if not dest_folder:
+        return
+
+    session = TransferSession(transfer_store, source_folder, dest_folder)
+    session.start_plan([], stream_plan_options(start_dt, end_dt, options['layout'], options['incremental'],
+                                               options['dedup'], options['verify'], options['read_back']),
+                       streaming=True)
+    engine = CopyEngine(on_result=session.record_result, verify=options['verify'], read_back=options['read_back'],
+                        make_dirs=False)
+    stream = JobStream(MediaScanner(), source_folder, start_dt, end_dt,
+                       session.batch_planner(options['layout'], options['incremental'], options['dedup']),
+                       cancel_event=engine.cancel_event, on_complete=session.session_plan.mark_scan_complete)
+    run_engine_with_progress(engine, stream.start(), session_id=session.session_id,
+                             describe=lambda progress: describe_stream_progress(progress, stream))
+    stream.join()
+    report_scan_stats(source_folder, stream.scanner)
+    session.finish(engine)
+
+    if stream.error is not None:
+        messagebox.showerror("Scan Error", f"Scanning stopped early: {stream.error}")
+    if not session.transferred_files and not session.skipped and not engine.progress.cancelled:
+        messagebox.showinfo("No files", "No media files found in the selected date range.")
+        return
+    show_transfer_result(session, engine)
+
+def show_transfer_result(session, engine):
+    transferred = len(session.transferred_files)
+    skipped_note = f" {len(session.skipped)} skipped." if session.skipped else ""
+    if engine.progress.cancelled:
+        messagebox.showinfo("Cancelled", f"Transfer cancelled. {transferred} files transferred.{skipped_note} "
+                                         f"Use Resume Session to continue it later.")
+    else:
+        messagebox.showinfo("Done", f"Transfer completed! {transferred} files transferred.{skipped_note}")
+
+def describe_copy_progress(progress):
+    return (f"Processing {os.path.basename(progress.current)} "
+            f"({progress.completed}/{progress.total}, {progress.mb_per_sec:.1f} MB/s)")
+
+def describe_stream_progress(progress, stream, planned_before=0):
+    # planned_before: files queued ahead of the stream, e.g. a resumed plan's
+    stats = stream.scanner.stats
+    scan = "scan finished" if stream.scan_finished else f"still scanning, {stats.files_resolved} files checked"
+    return (f"Copied {progress.completed} of {planned_before + stream.planned} files found ({scan}), "
+            f"{progress.mb_per_sec:.1f} MB/s")
+
+def run_engine_with_progress(engine, items, title="Transferring Files", describe=describe_copy_progress,
+                             session_id=None):
+    # Runs a CopyEngine or BulkDeleter behind a modal progress window with a
+    # Cancel button. Progress window
     progress_window = tk.Toplevel(root)
-    progress_window.title("Transferring Files")
+    progress_window.title(title)
     progress_window.configure(bg=PRIMARY_BG)
     progress_window.transient(root)
     progress_window.grab_set()
@@ -236,100 +460,168 @@ def transfer_files():
     progress_label.pack(padx=10, pady=(10,6), anchor='w')
     progress_bar = ttk.Progressbar(container, length=500, mode='determinate', style='lux.Progressbar')
     progress_bar.pack(padx=10, pady=(0,10), fill='x')
-    progress_bar['maximum'] = len(matched_files)
+    # Set from progress.total on each poll; it grows while a stream runs
+    progress_bar['maximum'] = len(items) if isinstance(items, (list, tuple)) else 1
+
+    def on_cancel():
+        engine.cancel()
+        progress_label.config(text="Cancelling after in-flight operations finish...")
+
+    ttk.Button(container, text="Cancel", style='Primary.TButton', command=on_cancel).pack(anchor='e')
+    progress_window.protocol('WM_DELETE_WINDOW', on_cancel)
     progress_window.update_idletasks()
-    center_window(progress_window, 640, 160)
+    center_window(progress_window, 640, 200)
 
-    transfer_log = load_transfer_log()
-    transferred_files = []
+    last_completed = [0]
 
-    # Establish a session identifier for this transfer operation
-    session_id = datetime.now().isoformat()
-    session_started_at = session_id
+    # Poll the engine from the Tk loop instead of updating the window per file
+    def poll():
+        with metrics.timed(metrics.UI_POLL):
+            update()
+        if engine.progress.finished:
+            progress_window.destroy()
+        else:
+            progress_window.after(100, poll)
+
+    def update():
+        progress = engine.progress
+        if progress.completed != last_completed[0]:
+            last_completed[0] = progress.completed
+            # refresh session logs pane if visible (only this session's row
+            # when known; updates are coalesced)
+            refresh_session_logs(session_id)
+        if not engine.cancel_event.is_set():
+            progress_label.config(text=describe(progress))
+        progress_bar['maximum'] = max(1, progress.total)
+        progress_bar['value'] = progress.completed
+
+    engine.start(items)
+    progress_window.after(100, poll)
+    progress_window.wait_window()
+    return engine.progress
+
+# --- Resume Function ---
+def resume_session():
+    plans = list_incomplete_sessions()
+    if not plans:
+        messagebox.showinfo("Resume Session", "There are no interrupted transfer sessions.")
+        return
 
-    for idx, (src_file, file_date) in enumerate(matched_files, 1):
-        progress_label.config(text=f"Processing {os.path.basename(src_file)} ({idx}/{len(matched_files)})")
-        progress_window.update()
+    dlg = tk.Toplevel(root)
+    dlg.title("Resume Session")
+    dlg.configure(bg=PRIMARY_BG)
+    dlg.transient(root)
+    dlg.grab_set()
 
-        month_folder = os.path.join(dest_folder, f"{file_date.year}-{file_date.month:02}")
-        os.makedirs(month_folder, exist_ok=True)
-        dest_file = os.path.join(month_folder, os.path.basename(src_file))
+    frame = ttk.Frame(dlg, style='Secondary.TFrame')
+    frame.pack(padx=24, pady=24, fill='both', expand=True)
+    frame.rowconfigure(1, weight=1)
+    frame.columnconfigure(0, weight=1)
+    ttk.Label(frame, text="Interrupted sessions", style='Header.TLabel').grid(row=0, column=0, sticky='w', pady=(0,8))
+
+    columns = ('when', 'done', 'pending', 'failed', 'source', 'dest')
+    tree = ttk.Treeview(frame, columns=columns, show='headings', selectmode='browse')
+    for col, text, width, anchor in (('when', 'When', 180, 'w'), ('done', 'Done', 70, 'e'),
+                                     ('pending', 'Pending', 70, 'e'), ('failed', 'Failed', 70, 'e'),
+                                     ('source', 'Source', 220, 'w'), ('dest', 'Destination', 220, 'w')):
+        tree.heading(col, text=text)
+        tree.column(col, width=width, anchor=anchor)
+    tree.grid(row=1, column=0, sticky='nsew')
 
-        try:
-            shutil.copy2(src_file, dest_file)
-            logging.info(f"Copied {src_file} -> {dest_file}")
-            transferred_files.append(src_file)
-
-            # Update structured JSON transfer log per file
-            if not isinstance(transfer_log, dict):
-                # Safety: re-load or reset if corrupted
-                current = load_transfer_log()
-                transfer_log.clear() if isinstance(transfer_log, dict) else None
-                if isinstance(current, dict):
-                    transfer_log.update(current)
-                else:
-                    transfer_log.clear()
-            entries = transfer_log.setdefault('entries', [])
-            entry = {
-                'source': src_file,
-                'destination': dest_file,
-                'timestamp': datetime.now().isoformat(),
-                'session_id': session_id,
-                'session_started_at': session_started_at,
-                'session_source': source_folder,
-                'session_destination': dest_folder
-            }
-            # Update if destination already exists, else append
-            updated = False
-            for i, e in enumerate(entries):
-                if isinstance(e, dict) and e.get('destination') == dest_file:
-                    entries[i] = entry
-                    updated = True
-                    break
-            if not updated:
-                entries.append(entry)
-            save_transfer_log(transfer_log)
-            # refresh session logs pane if visible
-            refresh_session_logs()
-        except Exception as e:
-            logging.error(f"Error copying {src_file} -> {dest_file}: {e}")
+    plans_by_iid = {}
+    for plan in plans:
+        counts = plan.counts()
+        # A session stopped mid-scan has more files to find on resume
+        pending = counts['pending'] if plan.scan_complete else f"{counts['pending']}+"
+        iid = tree.insert('', 'end', values=(plan.session_started_at, counts['done'], pending,
+                                             counts['failed'], plan.source, plan.dest))
+        plans_by_iid[iid] = plan
+    tree.selection_set(tree.get_children()[0])
 
-        progress_bar['value'] = idx
-        progress_window.update()
+    result = {}
 
-    progress_window.destroy()
+    def selected_plan():
+        selection = tree.selection()
+        return plans_by_iid.get(selection[0]) if selection else None
 
-    if 'transfers' not in transfer_log:
-        transfer_log['transfers'] = []
-    transfer_log['transfers'].extend(transferred_files)
-    save_transfer_log(transfer_log)
+    def on_resume():
+        result['plan'] = selected_plan()
+        dlg.destroy()
 
-    messagebox.showinfo("Done", f"Transfer completed! {len(transferred_files)} files transferred.")
+    def on_discard():
+        iid = tree.selection()[0] if tree.selection() else None
+        if iid is None:
+            return
+        if not messagebox.askyesno("Discard Session", "Discard this session? Files already copied are kept, "
+                                   "but it can no longer be resumed.", parent=dlg):
+            return
+        plans_by_iid.pop(iid).remove()
+        tree.delete(iid)
+        if tree.get_children():
+            tree.selection_set(tree.get_children()[0])
 
-    # Session summary log for UI consumption
-    try:
-        logging.info(f"SESSION_SUMMARY files={len(transferred_files)} source={source_folder} dest={dest_folder}")
-    except Exception:
-        pass
+    btns = ttk.Frame(frame, style='Secondary.TFrame')
+    btns.grid(row=2, column=0, sticky='e', pady=(12,0))
+    ttk.Button(btns, text="Resume", style='Accent.TButton', command=on_resume).grid(row=0, column=0, padx=8)
+    ttk.Button(btns, text="Discard", style='Primary.TButton', command=on_discard).grid(row=0, column=1, padx=(0,8))
+    ttk.Button(btns, text="Cancel", style='Primary.TButton', command=dlg.destroy).grid(row=0, column=2)
+
+    dlg.update_idletasks()
+    center_window(dlg, 900, 420)
+    dlg.wait_window()
+
+    session_plan = result.get('plan')
+    if session_plan is None:
+        return
+
+    session = TransferSession.resume(transfer_store, session_plan)
+    # Only the files still pending are re-stat'ed; the source is rescanned
+    # only if the session stopped before its scan finished
+    jobs = run_with_busy_dialog("Resuming Session", "Checking pending files...", session_plan.pending_jobs)
+    if jobs is None:
+        return
+    logging.info(f"SESSION_RESUMED session={session.session_id} pending={len(jobs)} "
+                 f"rescan={not session_plan.scan_complete} "
+                 f"source={session.source_folder} dest={session.dest_folder}")
+    options = session_plan.options
+    metrics.begin_session()
+    engine = CopyEngine(on_result=session.record_result, verify=options.get('verify', False),
+                        read_back=options.get('read_back', False), resume=True)
+    stream = session.rescan_stream(engine.cancel_event)
+    if stream is not None:
+        run_engine_with_progress(engine, itertools.chain(jobs, stream.start()), title="Resuming Transfer",
+                                 session_id=session.session_id,
+                                 describe=lambda progress: describe_stream_progress(progress, stream, len(jobs)))
+        stream.join()
+        report_scan_stats(session.source_folder, stream.scanner)
+    else:
+        run_engine_with_progress(engine, jobs, title="Resuming Transfer", session_id=session.session_id)
+    session.finish(engine)
+    if stream is not None and stream.error is not None:
+        messagebox.showerror("Scan Error", f"Scanning stopped early: {stream.error}")
+
+    transferred = len(session.transferred_files)
+    if engine.progress.cancelled:
+        messagebox.showinfo("Cancelled", f"Resume cancelled. {transferred} files transferred.")
+    elif session.failed:
+        messagebox.showinfo("Done", f"Session resumed. {transferred} files transferred, {session.failed} failed.")
+    else:
+        messagebox.showinfo("Done", f"Session completed! {transferred} files transferred.")
+    refresh_session_logs(session.session_id)
 
 # --- Delete Function ---
+THUMBNAIL_POLL_MS = 100
+THUMBNAIL_MEMORY = 500   # PhotoImages kept for rows scrolled past
+
 def delete_transferred_files():
     # New flow: delete files at source by selecting a session and entries
-    data = load_transfer_log()
-    entries = data.get('entries', []) if isinstance(data, dict) else []
-    if not entries:
+    index = transfer_store.index
+    if not len(index):
         messagebox.showinfo("No files", "No transfer entries found.")
         return
 
-    # Build sessions list from entries
-    sessions = {}
-    for e in entries:
-        sid = e.get('session_id') or 'unknown'
-        sessions.setdefault(sid, {'started': e.get('session_started_at') or e.get('timestamp'),
-                                  'source': e.get('session_source'),
-                                  'dest': e.get('session_destination'),
-                                  'items': []})
-        sessions[sid]['items'].append(e)
+    # Sessions come from the log index, copied under the store's lock
+    sessions = dict(transfer_store.session_summaries())
 
     # Modal to select a session
     dlg = tk.Toplevel(root)
@@ -355,40 +647,88 @@ def delete_transferred_files():
     select_all_var = tk.BooleanVar()
     select_all_cb = ttk.Checkbutton(list_frame, text="Select All Files", variable=select_all_var, style='Body.TLabel')
     select_all_cb.pack(anchor='w', pady=(0, 4))
+    require_verified_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(list_frame, text="Only delete files whose copy matches its checksum",
+                    variable=require_verified_var, style='Body.TLabel').pack(anchor='w', pady=(0, 4))
+    remove_empty_dirs_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(list_frame, text="Remove source folders left empty",
+                    variable=remove_empty_dirs_var, style='Body.TLabel').pack(anchor='w', pady=(0, 4))
 
-    cols = ('selection', 'source', 'destination', 'timestamp')
-    tree = ttk.Treeview(list_frame, columns=cols, show='headings', selectmode='none')
-    for c, text in zip(cols, ['Selection', 'Source', 'Destination', 'Timestamp']):
-        tree.heading(c, text=text)
-    tree.column('selection', width=100, anchor='center')
-    tree.column('source', width=400, anchor='w')
-    tree.column('destination', width=400, anchor='w')
-    tree.column('timestamp', width=200, anchor='w')
-    tree.pack(fill='both', expand=True)
+    status_var_local = tk.StringVar(value='')
 
-    # Add checkbox column
-    checkboxes = {}
-    checkbox_frame = ttk.Frame(list_frame, style='Secondary.TFrame')
-    checkbox_frame.pack(fill='x', pady=(4, 0))
+    # Only the rows in view exist as Treeview items; entries are paged in
+    # from the log index by destination as they scroll into view
+    destinations = []
+
+    def get_row(i):
+        e = index.by_destination.get(destinations[i]) or {}
+        return e.get('source'), e.get('destination'), e.get('timestamp')
+
+    def on_selection_change():
+        count = len(vtree.selected)
+        status_var_local.set(f'{count} of {vtree.total} file(s) selected.' if count else '')
+
+    # Thumbnails of the rows in view (and the next page) are rendered on a
+    # process pool; the dialog polls for finished ones
+    loader = thumbnails.ThumbnailLoader() if thumbnails.available() else None
+    images = OrderedDict()   # destination -> PhotoImage, most recent last
+    no_thumbnail = set()
+
+    def get_image(i):
+        image = images.get(destinations[i])
+        if image is not None:
+            images.move_to_end(destinations[i])
+        return image
+
+    def request_thumbnails(top, count):
+        wanted = destinations[top:top + 2 * max(count, 1)]
+        loader.retain(wanted)
+        for destination in wanted:
+            if destination not in images and destination not in no_thumbnail:
+                e = index.by_destination.get(destination)
+                if e is not None:
+                    # The source is what gets deleted; its copy stands in
+                    # once the source is gone
+                    loader.request(destination, (e.get('source'), destination))
+
+    def poll_thumbnails():
+        try:
+            if not dlg.winfo_exists():
+                return
+        except tk.TclError:
+            return
+        visible = set(destinations[vtree.top:vtree.top + vtree.visible])
+        changed = False
+        for destination, path in loader.drain():
+            if path is None:
+                no_thumbnail.add(destination)
+                continue
+            try:
+                images[destination] = tk.PhotoImage(file=path)
+            except tk.TclError:
+                no_thumbnail.add(destination)
+                continue
+            changed = changed or destination in visible
+        while len(images) > THUMBNAIL_MEMORY:
+            images.popitem(last=False)
+        if changed:
+            vtree.refresh()
+        dlg.after(THUMBNAIL_POLL_MS, poll_thumbnails)
+
+    if loader is not None:
+        vtree = VirtualTree(list_frame, ('source', 'destination', 'timestamp'),
+                            ('Source', 'Destination', 'Timestamp'), (360, 360, 180), on_change=on_selection_change,
+                            get_image=get_image, on_render=request_thumbnails, image_size=thumbnails.THUMB_SIZE)
+        dlg.bind('<Destroy>', lambda e: loader.close() if e.widget is dlg else None)
+        dlg.after(THUMBNAIL_POLL_MS, poll_thumbnails)
+    else:
+        vtree = VirtualTree(list_frame, ('source', 'destination', 'timestamp'),
+                            ('Source', 'Destination', 'Timestamp'), (400, 400, 200), on_change=on_selection_change)
+    vtree.pack(fill='both', expand=True)
 
     def refresh_items(*_):
-        for i in tree.get_children():
-            tree.delete(i)
-        # Clear old checkboxes
-        for widget in checkbox_frame.winfo_children():
-            widget.destroy()
-        checkboxes.clear()
-
-        sid = session_combo.get()
-        row_idx = 0
-        for e in sessions.get(sid, {}).get('items', []):
-            item = tree.insert('', 'end', values=('', e.get('source'), e.get('destination'), e.get('timestamp')))
-            # Add checkbox for this row
-            var = tk.BooleanVar()
-            cb = ttk.Checkbutton(checkbox_frame, variable=var)
-            cb.grid(row=row_idx, column=0, padx=(20, 8), pady=2)  # Increased left padding to align with Selection column
-            checkboxes[item] = var
-            row_idx += 1
+        destinations[:] = transfer_store.session_destinations(session_combo.get())
+        vtree.set_source(len(destinations), get_row)
         # Reset select all checkbox when session changes
         select_all_var.set(False)
 
@@ -396,59 +736,43 @@ def delete_transferred_files():
     refresh_items()
 
     def on_select_all():
-        state = select_all_var.get()
-        for var in checkboxes.values():
-            var.set(state)
+        vtree.select_all(select_all_var.get())
 
     select_all_cb.configure(command=on_select_all)
 
     btns = ttk.Frame(frame, style='Secondary.TFrame')
     btns.pack(fill='x')
-    status_var_local = tk.StringVar(value='')
     status_label = ttk.Label(frame, textvariable=status_var_local, style='Body.TLabel')
     status_label.pack(anchor='w', pady=(6, 0))
 
     def on_delete():
-        # Get selected from checkboxes instead of tree selection
-        selected_items = [item for item, var in checkboxes.items() if var.get()]
-        if not selected_items:
+        if not vtree.selected:
             status_var_local.set('Select one or more items to delete.')
             return
         to_delete_sources = []
-        values_list = [tree.item(i, 'values') for i in selected_items]
-        for v in values_list:
-            src = v[1]  # Source is now at index 1
-            to_delete_sources.append(src)
-
-        deleted = 0
-        missing = 0
-        new_entries = []
-        for e in entries:
-            if e.get('source') in to_delete_sources:
-                src_path = e.get('source')
-                if src_path and os.path.exists(src_path):
-                    try:
-                        os.remove(src_path)
-                        deleted += 1
-                    except Exception as ex:
-                        logging.error(f"Failed to delete source {src_path}: {ex}")
-                        # keep entry if deletion failed
-                        new_entries.append(e)
-                        continue
-                else:
-                    # already gone
-                    missing += 1
-                # removed from log regardless if missing or deleted
-            else:
-                new_entries.append(e)
-
-        data['entries'] = new_entries
-        save_transfer_log(data)
-
-        if missing and not deleted:
-            messagebox.showinfo('Info', 'data previously deleted')
+        for i in sorted(vtree.selected):
+            e = index.by_destination.get(destinations[i])
+            if e is not None:
+                to_delete_sources.append(e.get('source'))
+
+        # Unlinks run on a worker pool; the log is committed in batches
+        deleter = BulkDeleter(transfer_store, require_verified=require_verified_var.get(),
+                              remove_empty_dirs=remove_empty_dirs_var.get())
+        progress = run_engine_with_progress(
+            deleter, to_delete_sources, title="Deleting Files",
+            describe=lambda p: f"Deleting {os.path.basename(p.current)} ({p.completed}/{p.total})")
+        deleted, missing, unverified = progress.deleted, progress.missing, progress.unverified
+
+        unverified_note = f" {unverified} file(s) kept: no verified copy." if unverified else ""
+        failed_note = f" {progress.failed} file(s) could not be deleted." if progress.failed else ""
+        if progress.cancelled:
+            messagebox.showinfo('Cancelled', f'Delete cancelled. Deleted {deleted} file(s).{failed_note}')
+        elif missing and not deleted:
+            messagebox.showinfo('Info', f'data previously deleted{"." + unverified_note if unverified else ""}'
+                                        f'{failed_note}')
         else:
-            messagebox.showinfo('Done', f'Deleted {deleted} file(s).{" Some data previously deleted." if missing else ""}')
+            messagebox.showinfo('Done', f'Deleted {deleted} file(s).{" Some data previously deleted." if missing else ""}'
+                                        f'{unverified_note}{failed_note}')
         dlg.destroy()
 
     ttk.Button(btns, text='Delete Selected at Source', style='Accent.TButton', command=on_delete).pack(side='right')
@@ -459,46 +783,15 @@ def delete_transferred_files():
 
 # --- Logs Viewer ---
 def parse_session_summaries():
-    sessions = []
-    log_path = 'photo_transfer.log'
-    if not os.path.exists(log_path):
-        return sessions
+    # Incremental: only log bytes appended since the last call are read
+    global session_summary_index
+    if session_summary_index is None:
+        session_summary_index = SessionSummaryIndex(AUDIT_LOG_FILE)
     try:
-        with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                # Expect format: "YYYY-MM-DD HH:MM:SS,ms - LEVEL - SESSION_SUMMARY files=.. source=.. dest=.."
-                if 'SESSION_SUMMARY' not in line:
-                    continue
-                try:
-                    parts = line.split(' - ', 2)
-                    timestamp_str = parts[0].strip()
-                    msg = parts[2]
-                    # parse fields
-                    files_part = msg.split('files=', 1)[1]
-                    files_count = int(files_part.split()[0])
-                    source_part = msg.split('source=', 1)[1]
-                    source_path = source_part.split(' dest=', 1)[0].strip()
-                    dest_part = msg.split('dest=', 1)[1]
-                    dest_path = dest_part.strip()
-                    # parse timestamp
-                    when = None
-                    for fmt in ('%Y-%m-%d %H:%M:%S,%f', '%Y-%m-%d %H:%M:%S'):
-                        try:
-                            when = datetime.strptime(timestamp_str, fmt)
-                            break
-                        except Exception:
-                            continue
-                    sessions.append({
-                        'timestamp': when or timestamp_str,
-                        'files': files_count,
-                        'source': source_path,
-                        'dest': dest_path,
-                    })
-                except Exception:
-                    continue
-    except Exception:
-        return sessions
-    return sessions
+        return session_summary_index.summaries()
+    except Exception as e:
+        logging.error(f"Cannot read session summaries: {e}")
+        return []
 
 
 def view_logs():
@@ -542,8 +835,12 @@ def view_logs():
 
 # --- Raw Audit Log Viewer (read-only) ---
 def view_audit_log():
+    # Archived segments are decompressed and every segment is indexed once
+    log = AuditLog(AUDIT_LOG_FILE)
+    run_with_busy_dialog('Opening Audit Log', 'Indexing the audit log...', log.refresh)
+
     dlg = tk.Toplevel(root)
-    dlg.title('Audit Log - photo_transfer.log')
+    dlg.title(f'Audit Log - {AUDIT_LOG_FILE}')
     dlg.configure(bg=PRIMARY_BG)
     dlg.transient(root)
     dlg.grab_set()
@@ -554,72 +851,320 @@ def view_audit_log():
     # Toolbar
     top = ttk.Frame(frame, style='Secondary.TFrame')
     top.pack(fill='x', pady=(0,6))
-    ttk.Label(top, text='Read-only audit log view', style='Body.TLabel').pack(side='left')
+    ttk.Label(top, text='Filter:', style='Body.TLabel').pack(side='left')
+    filter_var = tk.StringVar()
+    filter_entry = ttk.Entry(top, textvariable=filter_var, width=40)
+    filter_entry.pack(side='left', padx=(6, 8))
+    level_combo = ttk.Combobox(top, values=('All levels',) + LEVELS, state='readonly', width=12)
+    level_combo.current(0)
+    level_combo.pack(side='left', padx=(0, 8))
+    follow_var = tk.BooleanVar(value=True)
+    ttk.Checkbutton(top, text='Follow new lines', variable=follow_var, style='Body.TLabel').pack(side='left')
     ttk.Button(top, text='Close', style='Primary.TButton', command=dlg.destroy).pack(side='right')
+    status_var = tk.StringVar(value='')
+    ttk.Label(frame, textvariable=status_var, style='Body.TLabel').pack(fill='x', side='bottom', pady=(6, 0))
 
-    # Text area with scrollbar (read-only)
+    # Text area with scrollbar (read-only). It only ever holds the lines in
+    # view; the log itself stays memory-mapped in AuditLog.
     text_frame = ttk.Frame(frame, style='Secondary.TFrame')
     text_frame.pack(fill='both', expand=True)
 
     scrollbar = ttk.Scrollbar(text_frame, orient='vertical')
     text = tk.Text(text_frame, wrap='none', bg=PRIMARY_BG, fg=TEXT_SECONDARY, insertbackground=TEXT_PRIMARY,
                    relief='flat')
-    text.configure(state='normal')
     text.pack(side='left', fill='both', expand=True)
-    scrollbar.config(command=text.yview)
-    text.configure(yscrollcommand=scrollbar.set)
     scrollbar.pack(side='right', fill='y')
+    line_height = max(1, tkfont.Font(font=text['font']).metrics('linespace'))
+
+    state = {'top': 0, 'visible': 1, 'matches': None}
+
+    def total():
+        matches = state['matches']
+        return log.line_count if matches is None else len(matches)
+
+    def render():
+        count = total()
+        state['top'] = max(0, min(state['top'], count - state['visible']))
+        first = state['top']
+        last = min(count, first + state['visible'])
+        matches = state['matches']
+        if matches is None:
+            lines = log.lines(first, last - first)
+        else:
+            lines = [log.line(matches[i]) for i in range(first, last)]
+        text.configure(state='normal')
+        text.delete('1.0', 'end')
+        if not log.line_count and not os.path.exists(AUDIT_LOG_FILE):
+            text.insert('1.0', 'Log file not found. It will be created as transfers occur.')
+        else:
+            text.insert('1.0', '\n'.join(lines))
+        text.configure(state='disabled')
+        if count:
+            scrollbar.set(first / count, last / count)
+        else:
+            scrollbar.set(0.0, 1.0)
+        if matches is None:
+            status_var.set(f'{log.line_count} lines')
+        else:
+            status_var.set(f'{len(matches)} of {log.line_count} lines match')
+
+    def scroll_to(new_top):
+        state['top'] = int(new_top)
+        # Scrolling up stops following the tail
+        follow_var.set(state['top'] >= total() - state['visible'])
+        render()
+
+    def on_scrollbar(*args):
+        if args[0] == 'moveto':
+            scroll_to(float(args[1]) * total())
+        elif args[0] == 'scroll':
+            step = state['visible'] if args[2] == 'pages' else 1
+            scroll_to(state['top'] + int(args[1]) * step)
+
+    scrollbar.config(command=on_scrollbar)
+
+    def bind_scroll(sequence, new_top):
+        def handler(event):
+            scroll_to(new_top(event))
+            return 'break'
+        text.bind(sequence, handler)
+
+    bind_scroll('<MouseWheel>', lambda e: state['top'] + (-3 if e.delta > 0 else 3))
+    bind_scroll('<Button-4>', lambda e: state['top'] - 3)
+    bind_scroll('<Button-5>', lambda e: state['top'] + 3)
+    bind_scroll('<Prior>', lambda e: state['top'] - state['visible'])
+    bind_scroll('<Next>', lambda e: state['top'] + state['visible'])
+    bind_scroll('<Home>', lambda e: 0)
+    bind_scroll('<End>', lambda e: total())
+
+    def on_configure(event):
+        visible = max(1, event.height // line_height)
+        if visible != state['visible']:
+            state['visible'] = visible
+            if follow_var.get():
+                state['top'] = total()
+            render()
+
+    text.bind('<Configure>', on_configure)
+
+    def current_filter():
+        level = level_combo.get()
+        return filter_var.get(), (level if level in LEVELS else None)
+
+    def apply_filter(*_):
+        substring, level = current_filter()
+        if substring or level:
+            # Searching a large log takes a moment; keep the UI responsive
+            matches = run_with_busy_dialog('Filtering', 'Searching the audit log...',
+                                           lambda: log.find_lines(substring, level))
+            if matches is None:
+                return
+            state['matches'] = matches
+        else:
+            state['matches'] = None
+        state['top'] = total() if follow_var.get() else 0
+        render()
+
+    def jump_to_end():
+        follow_var.set(True)
+        state['top'] = total()
+        render()
+
+    filter_entry.bind('<Return>', apply_filter)
+    level_combo.bind('<<ComboboxSelected>>', apply_filter)
+    ttk.Button(top, text='Jump to End', style='Primary.TButton', command=jump_to_end).pack(side='right', padx=(0, 8))
+
+    # Live tail: index appended bytes only, and filter just the new lines
+    def poll():
+        if not dlg.winfo_exists():
+            return
+        first_new = log.refresh()
+        if first_new is not None:
+            substring, level = current_filter()
+            if first_new == 0 or state['matches'] is None:
+                # New or rotated file: the old matches no longer apply
+                if state['matches'] is not None:
+                    state['matches'] = log.find_lines(substring, level)
+            else:
+                state['matches'].extend(log.find_lines(substring, level, first_new))
+            if follow_var.get():
+                state['top'] = total()
+            render()
+        dlg.after(1000, poll)
+
+    # Release the mapping with the window (the binding fires for children too)
+    dlg.bind('<Destroy>', lambda e: log.close() if e.widget is dlg else None)
+
+    state['top'] = total()
+    render()
+    dlg.after(1000, poll)
+    dlg.update_idletasks()
+    center_window(dlg, 1100, 640)
+
+# --- Performance Stats Panel ---
+STAT_COLUMNS = (('stage', 'Stage', 110, 'w'), ('count', 'Count', 80, 'e'), ('errors', 'Errors', 60, 'e'),
+                ('total_seconds', 'Total s', 80, 'e'), ('mean_ms', 'Mean ms', 80, 'e'),
+                ('p95_ms', 'p95 ms', 80, 'e'), ('max_ms', 'Max ms', 80, 'e'),
+                ('items_per_sec', 'Items/s', 80, 'e'), ('mb_per_sec', 'MB/s', 70, 'e'))
+
+def view_metrics():
+    paths = metrics.list_metrics_files()
+    if not paths:
+        messagebox.showinfo("Performance Stats", "No metrics yet. They are written when a transfer finishes.")
+        return
 
-    # Load log content
-    log_path = 'photo_transfer.log'
-    content = ''
-    if os.path.exists(log_path):
-        try:
-            with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-        except Exception as e:
-            content = f"Failed to read log: {e}"
-    else:
-        content = 'Log file not found. It will be created as transfers occur.'
+    dlg = tk.Toplevel(root)
+    dlg.title("Performance Stats")
+    dlg.configure(bg=PRIMARY_BG)
+    dlg.transient(root)
+
+    frame = ttk.Frame(dlg, style='Secondary.TFrame')
+    frame.pack(fill='both', expand=True, padx=12, pady=12)
+    frame.columnconfigure(0, weight=1)
+    frame.rowconfigure(2, weight=1)
+    frame.rowconfigure(4, weight=1)
+
+    top = ttk.Frame(frame, style='Secondary.TFrame')
+    top.grid(row=0, column=0, sticky='ew', pady=(0,6))
+    ttk.Label(top, text='Session:', style='Body.TLabel').pack(side='left')
+    session_combo = ttk.Combobox(top, values=[os.path.basename(p)[:-len('.json')] for p in paths],
+                                 state='readonly', width=40)
+    session_combo.current(0)
+    session_combo.pack(side='left', padx=(6, 8))
+    ttk.Button(top, text='Close', style='Primary.TButton', command=dlg.destroy).pack(side='right')
+    summary_var = tk.StringVar(value='')
+    ttk.Label(frame, textvariable=summary_var, style='Body.TLabel').grid(row=1, column=0, sticky='w', pady=(0,6))
+
+    stages = ttk.Treeview(frame, columns=[c[0] for c in STAT_COLUMNS], show='headings', selectmode='browse',
+                          height=9)
+    for col, text, width, anchor in STAT_COLUMNS:
+        stages.heading(col, text=text)
+        stages.column(col, width=width, anchor=anchor)
+    stages.grid(row=2, column=0, sticky='nsew')
+
+    ttk.Label(frame, text='Slowest items (select a stage)', style='Body.TLabel').grid(row=3, column=0, sticky='w',
+                                                                                      pady=(8,4))
+    slowest = ttk.Treeview(frame, columns=('ms', 'item'), show='headings', height=8)
+    slowest.heading('ms', text='ms')
+    slowest.column('ms', width=90, anchor='e', stretch=False)
+    slowest.heading('item', text='File / folder')
+    slowest.column('item', width=700, anchor='w')
+    slowest.grid(row=4, column=0, sticky='nsew')
+    profile_var = tk.StringVar(value='')
+    ttk.Label(frame, textvariable=profile_var, style='Body.TLabel', justify='left').grid(row=5, column=0, sticky='w',
+                                                                                           pady=(8,0))
+    state = {'data': None}
+
+    def show_slowest(event=None):
+        for item in slowest.get_children():
+            slowest.delete(item)
+        selection = stages.selection()
+        data = state['data']
+        if not selection or data is None:
+            return
+        for row in data['stages'].get(selection[0], {}).get('slowest', []):
+            slowest.insert('', 'end', values=(row['ms'], row['item']))
 
-    text.insert('1.0', content)
-    text.configure(state='disabled')
+    def load(event=None):
+        try:
+            data = metrics.load_metrics(paths[session_combo.current()])
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Performance Stats", f"Cannot read metrics: {e}", parent=dlg)
+            return
+        state['data'] = data
+        for item in stages.get_children():
+            stages.delete(item)
+        for name, stage in sorted(data['stages'].items(), key=lambda kv: kv[1]['total_seconds'], reverse=True):
+            stages.insert('', 'end', iid=name, values=[name] + [stage[c[0]] for c in STAT_COLUMNS[1:]])
+        extra = data.get('extra', {})
+        summary_var.set(f"{extra.get('transferred', 0)} transferred, {extra.get('failed', 0)} failed, "
+                        f"{extra.get('skipped', 0)} skipped in {data['wall_seconds']:.1f}s  "
+                        f"({extra.get('source', '')} -> {extra.get('dest', '')})")
+        profile = data.get('profile')
+        if profile:
+            top_rows = '\n'.join(f"  {row['cumtime']:>9.3f}s  {row['function']}" for row in profile['top'][:5])
+            profile_var.set(f"CPU profile: {profile['path']} (open with pstats/snakeviz)\n{top_rows}")
+        else:
+            profile_var.set('')
+        children = stages.get_children()
+        if children:
+            stages.selection_set(children[0])
+        show_slowest()
+
+    session_combo.bind('<<ComboboxSelected>>', load)
+    stages.bind('<<TreeviewSelect>>', show_slowest)
+    load()
+    dlg.update_idletasks()
+    center_window(dlg, 900, 620)
 
 # --- Session logs refresher (global hook) ---
+# Copies and deletes request refreshes far more often than the table needs
+# them; requests are collected and applied at most once per
+# SESSION_REFRESH_MS. A request for one session updates only that row from
+# the in-memory index counters.
+SESSION_REFRESH_MS = 250
 session_logs_tree = None
+session_log_rows = {}       # session_id -> Treeview item
+_pending_session_refresh = set()
+_session_refresh_scheduled = False
 
-def refresh_session_logs():
-    global session_logs_tree
+def format_session_when(ts):
+    if isinstance(ts, str):
+        try:
+            dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+            return dt.strftime('%d %B %Y %I:%M %p')
+        except Exception:
+            pass
+    return ts
+
+def refresh_session_logs(session_id=None):
+    # session_id None rebuilds the whole table, e.g. after sessions were
+    # removed by a delete
+    global _session_refresh_scheduled
+    _pending_session_refresh.add(session_id)
+    if not _session_refresh_scheduled and root is not None:
+        _session_refresh_scheduled = True
+        root.after(SESSION_REFRESH_MS, apply_session_refresh)
+
+def apply_session_refresh():
+    with metrics.timed(metrics.UI_REFRESH):
+        update_session_rows()
+
+def update_session_rows():
+    global _session_refresh_scheduled
+    _session_refresh_scheduled = False
+    pending = set(_pending_session_refresh)
+    _pending_session_refresh.clear()
+    if session_logs_tree is None:
+        return
+    sessions = dict(transfer_store.session_summaries())
+    if None in pending or any(sid not in sessions for sid in pending):
+        rebuild_session_logs()
+        return
+    for sid in pending:
+        info = sessions[sid]
+        item = session_log_rows.get(sid)
+        if item is None:
+            # A new session starts after all others, so it goes last
+            item = session_logs_tree.insert('', 'end', values=(
+                len(session_log_rows) + 1, format_session_when(info['when']), info['count'],
+                info['source'], info['dest']))
+            session_log_rows[sid] = item
+        else:
+            session_logs_tree.set(item, 'files', info['count'])
+
+def rebuild_session_logs():
     if session_logs_tree is None:
         return
     # Clear
     for i in session_logs_tree.get_children():
         session_logs_tree.delete(i)
-    data = load_transfer_log()
-    entries = data.get('entries', []) if isinstance(data, dict) else []
-    # Group by session
-    grouped = {}
-    for e in entries:
-        sid = e.get('session_id') or 'unknown'
-        grouped.setdefault(sid, {
-            'when': e.get('session_started_at') or e.get('timestamp'),
-            'source': e.get('session_source'),
-            'dest': e.get('session_destination'),
-            'count': 0
-        })
-        grouped[sid]['count'] += 1
+    session_log_rows.clear()
     # Insert
     idx = 1
-    for sid, info in sorted(grouped.items(), key=lambda x: str(x[1]['when'])):
-        ts = info['when']
-        when_str = ts
-        if isinstance(ts, str):
-            try:
-                dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
-                when_str = dt.strftime('%d %B %Y %I:%M %p')
-            except Exception:
-                pass
-        session_logs_tree.insert('', 'end', values=(idx, when_str, info['count'], info['source'], info['dest']))
+    for sid, info in transfer_store.session_summaries():
+        session_log_rows[sid] = session_logs_tree.insert('', 'end', values=(
+            idx, format_session_when(info['when']), info['count'], info['source'], info['dest']))
         idx += 1
 
 # --- Main View ---
@@ -657,12 +1202,16 @@ def build_main_view():
 
     transfer_btn = ttk.Button(buttons, text="Transfer Photos / Videos", style='Accent.TButton', command=transfer_files)
     transfer_btn.grid(row=0, column=0, pady=(0,12), sticky='ew')
+    resume_btn = ttk.Button(buttons, text="Resume Session", style='Primary.TButton', command=resume_session)
+    resume_btn.grid(row=1, column=0, pady=(0,12), sticky='ew')
     del_source_btn = ttk.Button(buttons, text="Delete Files at Source", style='Primary.TButton', command=delete_transferred_files)
-    del_source_btn.grid(row=1, column=0, pady=(0,12), sticky='ew')
+    del_source_btn.grid(row=2, column=0, pady=(0,12), sticky='ew')
     audit_btn = ttk.Button(buttons, text="View Audit Log (.log)", style='Primary.TButton', command=view_audit_log)
-    audit_btn.grid(row=2, column=0, pady=(0,12), sticky='ew')
+    audit_btn.grid(row=3, column=0, pady=(0,12), sticky='ew')
+    stats_btn = ttk.Button(buttons, text="Performance Stats", style='Primary.TButton', command=view_metrics)
+    stats_btn.grid(row=4, column=0, pady=(0,12), sticky='ew')
     exit_btn = ttk.Button(buttons, text="Exit", style='Primary.TButton', command=root.destroy)
-    exit_btn.grid(row=3, column=0, sticky='ew')
+    exit_btn.grid(row=5, column=0, sticky='ew')
 
     # Right session logs table
     right = ttk.Frame(content, style='Card.TFrame')
@@ -692,8 +1241,31 @@ def build_main_view():
     # set global reference and populate
     global session_logs_tree
     session_logs_tree = tree
-    refresh_session_logs()
-
-build_main_view()
-center_window(root, 1100, 720)
-root.mainloop()
+    rebuild_session_logs()
+
+# --- Entry point ---
+def main():
+    global root, metadata_cache
+    setup_logging()
+    ensure_transfer_log_file()
+    # Persistent metadata cache consulted by get_file_date
+    metadata_cache = open_metadata_cache()
+    set_metadata_cache(metadata_cache)
+
+    # --- Tkinter setup ---
+    root = tk.Tk()
+    root.title("Phone Media Manager")
+    root.attributes('-fullscreen', False)
+    root.configure(bg=PRIMARY_BG)
+    configure_styles()
+
+    build_main_view()
+    center_window(root, 1100, 720)
+    root.mainloop()
+    if metadata_cache is not None:
+        metadata_cache.close()
+    transfer_store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import os
+import string
+import logging
+
+from copy_engine import CopyJob
+from dedup import unique_destination
+from media_dates import read_camera_model
+
+# --- Destination layout templates ---
+# Folder templates relative to the destination, using {year}, {month} and
+# {day} (zero padded) and {camera} (EXIF camera model). 'month' is the
+# original YYYY-MM layout.
+LAYOUT_TEMPLATES = {
+    'month': '{year}-{month}',
+    'year/month': '{year}/{month}',
+    'year/month/day': '{year}/{year}-{month}/{year}-{month}-{day}',
+    'camera/month': '{camera}/{year}-{month}',
+}
+DEFAULT_LAYOUT = 'month'
+UNKNOWN_CAMERA = 'Unknown Camera'
+_TEMPLATE_FIELDS = {'year', 'month', 'day', 'camera'}
+_UNSAFE_NAME_CHARS = '<>:"/\\|?*'
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def resolve_template(layout):
+    # A preset name or a template string
+    template = LAYOUT_TEMPLATES.get(layout, layout)
+    try:
+        fields = {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+    except ValueError as e:
+        raise LayoutError(f"Invalid layout template {layout!r}: {e}")
+    unknown = fields - _TEMPLATE_FIELDS
+    if unknown:
+        raise LayoutError(f"Unknown layout field(s) {', '.join(sorted(unknown))} in {layout!r}")
+    # Folders must stay inside the destination; field values cannot add
+    # separators (see _safe_component), so checking the template is enough
+    if template.startswith(('/', '\\')) or os.path.splitdrive(template)[0] or template[1:2] == ':':
+        raise LayoutError(f"Layout template {layout!r} must be relative to the destination")
+    if '..' in template.replace('\\', '/').split('/'):
+        raise LayoutError(f"Layout template {layout!r} must not contain '..'")
+    return template, fields
+
+
+def _safe_component(value):
+    cleaned = ''.join('_' if c in _UNSAFE_NAME_CHARS or ord(c) < 32 else c for c in value).strip(' .')
+    return cleaned or UNKNOWN_CAMERA
+
+
+# --- Layout planning ---
+class LayoutPlan:
+    def __init__(self):
+        self.jobs = []
+        self.folders = []       # distinct target folders, in first-use order
+        self.renamed = []       # (job, original destination) for collisions in this batch
+        self.existing = []      # jobs whose destination already exists on disk
+
+
+class LayoutPlanner:
+    # Turns (source, date) pairs into copy jobs: each distinct folder key is
+    # joined once, each target folder is listed once to find existing
+    # names, and two sources mapping to the same name are told apart with
+    # " (N)" suffixes. State is kept between calls, so a scan can be
+    # planned batch by batch as it streams in. With order_by_source the
+    # jobs of each batch are sorted by source folder and inode, which keeps
+    # reads sequential on cards and spinning disks.
+    def __init__(self, dest_folder, layout=DEFAULT_LAYOUT, camera_func=read_camera_model, order_by_source=True):
+        self.dest_folder = dest_folder
+        self.layout = layout
+        self.template, self.fields = resolve_template(layout)
+        self.camera_func = camera_func
+        self.order_by_source = order_by_source
+        self.folder_for_key = {}
+        self.names_on_disk = {}
+        self.planned = set()
+
+    def plan(self, matched_files):
+        # LayoutPlan for this batch; its folders are the ones first used here
+        plan = LayoutPlan()
+        fields = self.fields
+        folder_for_key = self.folder_for_key
+        names_on_disk = self.names_on_disk
+        planned = self.planned
+        staged = []
+
+        for src_file, file_date in matched_files:
+            camera = None
+            if 'camera' in fields:
+                camera = _safe_component(self.camera_func(src_file) or UNKNOWN_CAMERA)
+            key = (file_date.year, file_date.month, file_date.day if 'day' in fields else None, camera)
+            folder = folder_for_key.get(key)
+            if folder is None:
+                relative = self.template.format(year=f"{file_date.year}", month=f"{file_date.month:02}",
+                                                day=f"{file_date.day:02}", camera=camera)
+                folder = folder_for_key[key] = os.path.join(self.dest_folder, os.path.normpath(relative))
+                if folder not in names_on_disk:
+                    plan.folders.append(folder)
+                    try:
+                        names_on_disk[folder] = set(os.listdir(folder))
+                    except OSError:
+                        names_on_disk[folder] = set()
+
+            name = os.path.basename(src_file)
+            job = CopyJob(src_file, os.path.join(folder, name), file_date)
+            if job.dest in planned:
+                # Another source in this transfer already maps here
+                original = job.dest
+                job.dest = unique_destination(job.dest, planned)
+                plan.renamed.append((job, original))
+            elif name in names_on_disk[folder]:
+                plan.existing.append(job)
+            planned.add(job.dest)
+            staged.append(job)
+
+        if self.order_by_source:
+            keyed = []
+            for job in staged:
+                try:
+                    st = os.stat(job.src)
+                    job.size = st.st_size
+                    job.mtime = st.st_mtime
+                    inode = st.st_ino
+                except OSError:
+                    inode = 0
+                keyed.append((os.path.dirname(job.src), inode, job))
+            keyed.sort(key=lambda item: (item[0], item[1]))
+            staged = [job for _, _, job in keyed]
+        plan.jobs = staged
+
+        for job, original in plan.renamed:
+            logging.info(f"Renamed {job.src} -> {job.dest} (same name as another file in this transfer: {original})")
+        return plan
+
+
+def plan_layout(matched_files, dest_folder, layout=DEFAULT_LAYOUT, camera_func=read_camera_model,
+                order_by_source=True):
+    return LayoutPlanner(dest_folder, layout, camera_func, order_by_source).plan(matched_files)
@@ -0,0 +1,617 @@
+import os
+import struct
+import logging
+import threading
+from datetime import datetime
+
+# --- File extensions ---
+image_extensions = ('.jpg', '.jpeg', '.png', '.heic')
+video_extensions = ('.mp4', '.mov', '.avi', '.mkv')
+media_extensions = image_extensions + video_extensions
+
+# --- Header-only EXIF reader ---
+# Reads at most EXIF_HEADER_SIZE bytes per lookup into a reusable per-thread
+# buffer and walks the container structure by offset, so no image data is
+# decoded. Anything it cannot parse raises ExifParseError and the caller
+# falls back to Pillow.
+EXIF_HEADER_SIZE = 16 * 1024
+EXIF_IFD_POINTER = 0x8769
+DATE_TIME_ORIGINAL = 0x9003  # 36867
+CAMERA_MODEL = 0x0110
+THUMBNAIL_OFFSET = 0x0201   # JPEGInterchangeFormat (IFD1)
+THUMBNAIL_LENGTH = 0x0202   # JPEGInterchangeFormatLength (IFD1)
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+_buffers = threading.local()
+
+
+class ExifParseError(ValueError):
+    pass
+
+
+def _read_header(f, offset=None):
+    buf = getattr(_buffers, 'header', None)
+    if buf is None:
+        buf = _buffers.header = bytearray(EXIF_HEADER_SIZE)
+    if offset is not None:
+        f.seek(offset)
+    n = f.readinto(buf)
+    return memoryview(buf)[:n or 0]
+
+
+def _read_uint(data, pos, size):
+    if size == 0:
+        return 0
+    if pos + size > len(data):
+        raise ExifParseError('field outside header buffer')
+    return int.from_bytes(data[pos:pos + size], 'big')
+
+
+def _find_ifd_entry(data, base, endian, ifd_offset, tag):
+    pos = base + ifd_offset
+    if pos + 2 > len(data):
+        raise ExifParseError('IFD outside header buffer')
+    (count,) = struct.unpack_from(endian + 'H', data, pos)
+    pos += 2
+    if pos + count * 12 > len(data):
+        raise ExifParseError('IFD outside header buffer')
+    for _ in range(count):
+        entry_tag, value_type, value_count = struct.unpack_from(endian + 'HHI', data, pos)
+        if entry_tag == tag:
+            return value_type, value_count, pos + 8
+        pos += 12
+    return None
+
+
+def _tiff_header(data, base):
+    order = bytes(data[base:base + 2])
+    if order == b'II':
+        endian = '<'
+    elif order == b'MM':
+        endian = '>'
+    else:
+        raise ExifParseError('bad TIFF byte order')
+    if base + 8 > len(data):
+        raise ExifParseError('TIFF header outside header buffer')
+    magic, ifd0 = struct.unpack_from(endian + 'HI', data, base + 2)
+    if magic != 42:
+        raise ExifParseError('bad TIFF magic')
+    return endian, ifd0
+
+
+def _tiff_ascii(data, base, endian, entry):
+    value_type, value_count, value_pos = entry
+    if value_type != 2:
+        return None
+    if value_count > 4:
+        (value_offset,) = struct.unpack_from(endian + 'I', data, value_pos)
+        value_pos = base + value_offset
+    if value_pos + value_count > len(data):
+        raise ExifParseError('ASCII value outside header buffer')
+    return bytes(data[value_pos:value_pos + value_count]).split(b'\x00', 1)[0].decode('ascii', 'ignore').strip()
+
+
+def _parse_tiff_date(data, base):
+    # data holds a TIFF structure starting at base; returns DateTimeOriginal
+    # or None when the structure is valid but carries no usable date.
+    endian, ifd0 = _tiff_header(data, base)
+    pointer = _find_ifd_entry(data, base, endian, ifd0, EXIF_IFD_POINTER)
+    if pointer is None:
+        return None
+    (exif_ifd,) = struct.unpack_from(endian + 'I', data, pointer[2])
+    entry = _find_ifd_entry(data, base, endian, exif_ifd, DATE_TIME_ORIGINAL)
+    if entry is None:
+        return None
+    date_str = _tiff_ascii(data, base, endian, entry)
+    try:
+        return datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S') if date_str else None
+    except ValueError:
+        return None
+
+
+def _parse_tiff_model(data, base):
+    # Camera model from IFD0, or None
+    endian, ifd0 = _tiff_header(data, base)
+    entry = _find_ifd_entry(data, base, endian, ifd0, CAMERA_MODEL)
+    if entry is None:
+        return None
+    return _tiff_ascii(data, base, endian, entry) or None
+
+
+def _jpeg_exif_date(f, parse=_parse_tiff_date):
+    data = _read_header(f)
+    if bytes(data[:2]) != b'\xff\xd8':
+        raise ExifParseError('not a JPEG')
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ExifParseError('bad JPEG marker')
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # End of image / start of scan: no metadata segments follow
+            return None
+        (length,) = struct.unpack_from('>H', data, pos + 2)
+        if marker == 0xE1 and bytes(data[pos + 4:pos + 10]) == b'Exif\x00\x00':
+            return parse(data, pos + 10)
+        pos += 2 + length
+    raise ExifParseError('EXIF segment outside header buffer')
+
+
+def _png_exif_date(f, parse=_parse_tiff_date):
+    if f.read(8) != PNG_SIGNATURE:
+        raise ExifParseError('not a PNG')
+    # Chunks are skipped by seeking; only chunk headers and eXIf are read
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type == b'eXIf':
+            if length > EXIF_HEADER_SIZE:
+                raise ExifParseError('eXIf chunk larger than header buffer')
+            return parse(_read_header(f)[:length], 0)
+        if chunk_type in (b'IDAT', b'IEND'):
+            return None
+        f.seek(length + 4, os.SEEK_CUR)
+
+
+def _iter_boxes(data, pos, end):
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            size = _read_uint(data, pos + 8, 8)
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ExifParseError('bad box size')
+        yield bytes(box_type), pos + header, pos + size
+        pos += size
+
+
+def _heic_exif_item(data, start, end):
+    # iinf: FullBox, entry count, then infe boxes naming each item's type
+    version = data[start]
+    pos = start + 4 + (2 if version == 0 else 4)
+    for box_type, body, body_end in _iter_boxes(data, pos, end):
+        if box_type != b'infe':
+            continue
+        infe_version = data[body]
+        if infe_version < 2:
+            continue
+        id_size = 2 if infe_version == 2 else 4
+        item_id = _read_uint(data, body + 4, id_size)
+        item_type = bytes(data[body + 4 + id_size + 2:body + 4 + id_size + 6])
+        if item_type == b'Exif':
+            return item_id
+    return None
+
+
+def _heic_item_extent(data, start, end, wanted_id):
+    version = data[start]
+    pos = start + 4
+    offset_size = data[pos] >> 4
+    length_size = data[pos] & 0x0F
+    base_offset_size = data[pos + 1] >> 4
+    index_size = (data[pos + 1] & 0x0F) if version in (1, 2) else 0
+    pos += 2
+    id_size = 2 if version < 2 else 4
+    item_count = _read_uint(data, pos, id_size)
+    pos += id_size
+    for _ in range(item_count):
+        item_id = _read_uint(data, pos, id_size)
+        pos += id_size
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = _read_uint(data, pos, 2) & 0x0F
+            pos += 2
+        pos += 2  # data_reference_index
+        base_offset = _read_uint(data, pos, base_offset_size)
+        pos += base_offset_size
+        extent_count = _read_uint(data, pos, 2)
+        pos += 2
+        extents = []
+        for _ in range(extent_count):
+            pos += index_size
+            extent_offset = _read_uint(data, pos, offset_size)
+            pos += offset_size
+            extent_length = _read_uint(data, pos, length_size)
+            pos += length_size
+            extents.append((base_offset + extent_offset, extent_length))
+        if item_id == wanted_id:
+            if construction_method != 0 or not extents:
+                raise ExifParseError('unsupported iloc construction')
+            return extents[0]
+        if pos > end:
+            break
+    return None
+
+
+def _heic_exif_date(f, parse=_parse_tiff_date):
+    data = _read_header(f, 0)
+    meta = None
+    for box_type, body, body_end in _iter_boxes(data, 0, len(data)):
+        if box_type == b'meta':
+            meta = (body + 4, body_end)  # skip FullBox version/flags
+            break
+    if meta is None or meta[1] > len(data):
+        raise ExifParseError('meta box outside header buffer')
+    exif_item = None
+    iloc = None
+    for box_type, body, body_end in _iter_boxes(data, *meta):
+        if box_type == b'iinf':
+            exif_item = _heic_exif_item(data, body, body_end)
+        elif box_type == b'iloc':
+            iloc = (body, body_end)
+    if exif_item is None:
+        return None
+    if iloc is None:
+        raise ExifParseError('missing iloc box')
+    extent = _heic_item_extent(data, iloc[0], iloc[1], exif_item)
+    if extent is None:
+        raise ExifParseError('EXIF item has no location')
+    offset, length = extent
+    # Item payload: 4-byte offset to the TIFF header, then the TIFF data
+    exif = _read_header(f, offset)
+    if length:
+        exif = exif[:length]
+    tiff_offset = _read_uint(exif, 0, 4)
+    return parse(exif, 4 + tiff_offset)
+
+
+_EXIF_READERS = {
+    '.jpg': _jpeg_exif_date,
+    '.jpeg': _jpeg_exif_date,
+    '.png': _png_exif_date,
+    '.heic': _heic_exif_date,
+}
+
+
+def read_exif_date(file_path):
+    # Returns DateTimeOriginal, or None if the file parses but has no date.
+    # Raises ExifParseError when the header cannot be parsed.
+    reader = _EXIF_READERS.get(os.path.splitext(file_path)[1].lower())
+    if reader is None:
+        raise ExifParseError(f"No header reader for {file_path}")
+    with open(file_path, 'rb') as f:
+        try:
+            return reader(f)
+        except (struct.error, IndexError) as e:
+            raise ExifParseError(str(e))
+
+
+def read_camera_model(file_path):
+    # EXIF camera model of an image, or None (videos, no EXIF, unparsable)
+    reader = _EXIF_READERS.get(os.path.splitext(file_path)[1].lower())
+    if reader is None:
+        return None
+    try:
+        with open(file_path, 'rb') as f:
+            return reader(f, parse=_parse_tiff_model)
+    except (OSError, ExifParseError, struct.error, IndexError):
+        return None
+
+
+
+# --- Embedded EXIF thumbnail ---
+# Cameras store a small JPEG preview (typically 160x120) in IFD1 of the
+# EXIF block. It can sit past EXIF_HEADER_SIZE, so the whole APP1 segment
+# (at most 64 KB) is read instead of the shared header buffer.
+def _jpeg_exif_segment(f):
+    if f.read(2) != b'\xff\xd8':
+        raise ExifParseError('not a JPEG')
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ExifParseError('bad JPEG marker')
+        if marker[1] == 0xFF:
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD8:
+            continue
+        if marker[1] in (0xD9, 0xDA):
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            raise ExifParseError('truncated JPEG segment')
+        (length,) = struct.unpack('>H', length_bytes)
+        if marker[1] == 0xE1:
+            payload = f.read(length - 2)
+            if payload[:6] == b'Exif\x00\x00':
+                return memoryview(payload)[6:]
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def _tiff_uint(data, endian, entry):
+    value_type, _, value_pos = entry
+    if value_type == 3:
+        return struct.unpack_from(endian + 'H', data, value_pos)[0]
+    if value_type == 4:
+        return struct.unpack_from(endian + 'I', data, value_pos)[0]
+    raise ExifParseError('unexpected thumbnail tag type')
+
+
+def _parse_tiff_thumbnail(data, base=0):
+    endian, ifd0 = _tiff_header(data, base)
+    (count,) = struct.unpack_from(endian + 'H', data, base + ifd0)
+    (ifd1,) = struct.unpack_from(endian + 'I', data, base + ifd0 + 2 + count * 12)
+    if not ifd1:
+        return None
+    offset = _find_ifd_entry(data, base, endian, ifd1, THUMBNAIL_OFFSET)
+    length = _find_ifd_entry(data, base, endian, ifd1, THUMBNAIL_LENGTH)
+    if offset is None or length is None:
+        return None
+    start = base + _tiff_uint(data, endian, offset)
+    end = start + _tiff_uint(data, endian, length)
+    if end > len(data) or bytes(data[start:start + 2]) != b'\xff\xd8':
+        return None
+    return bytes(data[start:end])
+
+
+def read_exif_thumbnail(file_path):
+    # JPEG bytes of the embedded EXIF preview of a JPEG, or None
+    try:
+        with open(file_path, 'rb') as f:
+            data = _jpeg_exif_segment(f)
+            return _parse_tiff_thumbnail(data) if data is not None else None
+    except (OSError, ExifParseError, struct.error, IndexError):
+        return None
+
+# --- Container-level video date reader ---
+# Walks box/element headers with seeks and small reads, so the cost is a
+# handful of syscalls and O(1) memory regardless of the clip size. Dates
+# are stored as UTC and returned as local naive datetimes, like mtime.
+QT_EPOCH_OFFSET = 2082844800   # 1904-01-01 -> 1970-01-01
+MKV_EPOCH_OFFSET = 978307200   # 1970-01-01 -> 2001-01-01
+MKV_MAX_ELEMENTS = 256
+EBML_HEADER_ID = 0x1A45DFA3
+MKV_SEGMENT_ID = 0x18538067
+MKV_INFO_ID = 0x1549A966
+MKV_CLUSTER_ID = 0x1F43B675
+MKV_DATE_UTC_ID = 0x4461
+
+
+class VideoParseError(ValueError):
+    pass
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) < size:
+        raise VideoParseError('unexpected end of file')
+    return data
+
+
+def _utc_timestamp_to_local(seconds):
+    if seconds <= 0:
+        return None
+    try:
+        return datetime.fromtimestamp(seconds)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def _mp4_boxes(f, pos, end):
+    # Yields (type, body_start, box_end) reading only each box header
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, box_type = struct.unpack('>I4s', _read_exact(f, 8))
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack('>Q', _read_exact(f, 8))
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise VideoParseError('bad box size')
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _mp4_video_date(f, file_size):
+    # moov may sit at the end of the file; mdat is skipped by seeking
+    for box_type, body, box_end in _mp4_boxes(f, 0, file_size):
+        if box_type != b'moov':
+            continue
+        for child_type, child_body, _ in _mp4_boxes(f, body, box_end):
+            if child_type == b'mvhd':
+                f.seek(child_body)
+                version = _read_exact(f, 4)[0]
+                if version == 1:
+                    (created,) = struct.unpack('>Q', _read_exact(f, 8))
+                else:
+                    (created,) = struct.unpack('>I', _read_exact(f, 4))
+                if not created:
+                    return None
+                return _utc_timestamp_to_local(created - QT_EPOCH_OFFSET)
+        return None
+    raise VideoParseError('no moov box')
+
+
+def _ebml_read_id(f):
+    first = _read_exact(f, 1)
+    length = 1
+    mask = 0x80
+    while length <= 4 and not first[0] & mask:
+        mask >>= 1
+        length += 1
+    if length > 4:
+        raise VideoParseError('bad EBML id')
+    return int.from_bytes(first + _read_exact(f, length - 1), 'big')
+
+
+def _ebml_read_size(f):
+    # Returns the element size, or None for the reserved "unknown" size
+    first = _read_exact(f, 1)[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise VideoParseError('bad EBML size')
+    value = first & (mask - 1)
+    unknown = value == mask - 1
+    for byte in _read_exact(f, length - 1):
+        value = (value << 8) | byte
+        unknown = unknown and byte == 0xFF
+    return None if unknown else value
+
+
+def _mkv_video_date(f, file_size):
+    if _ebml_read_id(f) != EBML_HEADER_ID:
+        raise VideoParseError('not an EBML file')
+    header_size = _ebml_read_size(f)
+    if header_size is None:
+        raise VideoParseError('bad EBML header')
+    f.seek(header_size, os.SEEK_CUR)
+    if _ebml_read_id(f) != MKV_SEGMENT_ID:
+        raise VideoParseError('missing Segment')
+    segment_size = _ebml_read_size(f)
+    segment_end = file_size if segment_size is None else min(file_size, f.tell() + segment_size)
+    for _ in range(MKV_MAX_ELEMENTS):
+        if f.tell() >= segment_end:
+            break
+        element_id = _ebml_read_id(f)
+        size = _ebml_read_size(f)
+        if element_id == MKV_INFO_ID and size is not None:
+            info_end = f.tell() + size
+            while f.tell() < info_end:
+                child_id = _ebml_read_id(f)
+                child_size = _ebml_read_size(f)
+                if child_size is None:
+                    break
+                if child_id == MKV_DATE_UTC_ID:
+                    nanoseconds = int.from_bytes(_read_exact(f, child_size), 'big', signed=True)
+                    return _utc_timestamp_to_local(MKV_EPOCH_OFFSET + nanoseconds / 1e9)
+                f.seek(child_size, os.SEEK_CUR)
+            return None
+        if element_id == MKV_CLUSTER_ID or size is None:
+            break
+        f.seek(size, os.SEEK_CUR)
+    raise VideoParseError('no Info element before first cluster')
+
+
+def _avi_video_date(f, file_size):
+    header = _read_exact(f, 12)
+    if header[:4] != b'RIFF' or header[8:12] != b'AVI ':
+        raise VideoParseError('not an AVI file')
+    pos = 12
+    end = file_size
+    while pos + 8 <= end:
+        f.seek(pos)
+        chunk_id, size = struct.unpack('<4sI', _read_exact(f, 8))
+        if chunk_id == b'LIST':
+            list_type = _read_exact(f, 4)
+            if list_type == b'hdrl':
+                # Descend into the header list, which is where IDIT lives
+                pos += 12
+                end = min(end, pos + size - 4)
+                continue
+            if list_type == b'movi':
+                break
+        elif chunk_id == b'IDIT':
+            value = _read_exact(f, size).split(b'\x00', 1)[0].decode('ascii', 'ignore').strip()
+            for fmt in ('%a %b %d %H:%M:%S %Y', '%Y:%m:%d %H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+                try:
+                    return datetime.strptime(value, fmt)
+                except ValueError:
+                    continue
+            return None
+        pos += 8 + size + (size & 1)
+    return None
+
+
+_VIDEO_READERS = {
+    '.mp4': _mp4_video_date,
+    '.mov': _mp4_video_date,
+    '.mkv': _mkv_video_date,
+    '.avi': _avi_video_date,
+}
+
+
+def read_video_date(file_path):
+    # Returns the container creation date, or None if the file has none.
+    # Raises VideoParseError when the container cannot be parsed.
+    reader = _VIDEO_READERS.get(os.path.splitext(file_path)[1].lower())
+    if reader is None:
+        raise VideoParseError(f"No container reader for {file_path}")
+    with open(file_path, 'rb') as f:
+        try:
+            return reader(f, os.fstat(f.fileno()).st_size)
+        except (struct.error, IndexError) as e:
+            raise VideoParseError(str(e))
+
+
+def _pillow_exif_date(file_path):
+    # Slow path: only used when the header reader gives up
+    from PIL import Image
+    with Image.open(file_path) as img:
+        exif_data = img._getexif()
+    if exif_data:
+        date_str = exif_data.get(36867)
+        if date_str:
+            return datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
+    return None
+
+# --- Metadata cache hook ---
+# When set (see metadata_cache.MetadataCache), get_file_date consults the
+# cache before reading any file headers.
+_metadata_cache = None
+
+
+def set_metadata_cache(cache):
+    global _metadata_cache
+    _metadata_cache = cache
+
+
+def get_metadata_cache():
+    return _metadata_cache
+
+# --- Helper to get file date ---
+def get_file_date(file_path):
+    cache = _metadata_cache
+    if cache is not None:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            st = None
+        if st is not None:
+            date = cache.get(file_path, st)
+            if date is None:
+                date = _read_file_date(file_path)
+                cache.put(file_path, st, date)
+            return date
+    return _read_file_date(file_path)
+
+
+def _read_file_date(file_path):
+    try:
+        if file_path.lower().endswith(image_extensions):
+            try:
+                date = read_exif_date(file_path)
+            except ExifParseError:
+                date = _pillow_exif_date(file_path)
+            if date:
+                return date
+        elif file_path.lower().endswith(video_extensions):
+            try:
+                date = read_video_date(file_path)
+            except VideoParseError as e:
+                logging.debug(f"No container date for {file_path}: {e}")
+                date = None
+            if date:
+                return date
+        timestamp = os.path.getmtime(file_path)
+        return datetime.fromtimestamp(timestamp)
+    except Exception as e:
+        logging.warning(f"Cannot read metadata for {file_path}: {e}")
+        return datetime.fromtimestamp(os.path.getmtime(file_path))
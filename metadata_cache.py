@@ -0,0 +1,183 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+from dir_summary import DirectoryRecord
+
+# --- Metadata cache file (next to transfer_log.json) ---
+METADATA_CACHE_FILE = 'metadata_cache.db'
+DEFAULT_MAX_ENTRIES = 500000
+DEFAULT_FLUSH_EVERY = 500
+
+
+class MetadataCache:
+    # Persistent path -> media date cache. An entry is only trusted while the
+    # file's size, mtime and inode are unchanged, so a re-scan of an
+    # unchanged tree costs one stat per file. Least recently used rows are
+    # evicted once the cache grows past max_entries.
+    def __init__(self, path=METADATA_CACHE_FILE, max_entries=DEFAULT_MAX_ENTRIES,
+                 flush_every=DEFAULT_FLUSH_EVERY):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending_puts = []
+        self._pending_touches = []
+        # sqlite connections must not be used from a forked child process
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS media (
+                                  path TEXT PRIMARY KEY,
+                                  size INTEGER NOT NULL,
+                                  mtime_ns INTEGER NOT NULL,
+                                  inode INTEGER NOT NULL,
+                                  date TEXT NOT NULL,
+                                  last_used REAL NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS media_last_used ON media(last_used)')
+        # Per-directory date ranges used to skip subtrees (see dir_summary).
+        # Tables from before mtime_dated are dropped: their records cannot
+        # tell which dates came from file mtimes
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(directories)')]
+        if columns and 'mtime_dated' not in columns:
+            self._conn.execute('DROP TABLE directories')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS directories (
+                                  path TEXT PRIMARY KEY,
+                                  mtime_ns INTEGER NOT NULL,
+                                  listed_ns INTEGER NOT NULL,
+                                  own_min TEXT,
+                                  own_max TEXT,
+                                  sub_min TEXT,
+                                  sub_max TEXT,
+                                  children TEXT NOT NULL,
+                                  mtime_dated TEXT NOT NULL)''')
+        self._conn.commit()
+        self._count = self._conn.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+
+    def _usable(self):
+        return self._conn is not None and os.getpid() == self._pid
+
+    def get(self, file_path, st):
+        if not self._usable():
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT size, mtime_ns, inode, date FROM media WHERE path = ?',
+                                     (file_path,)).fetchone()
+            if row and row[0] == st.st_size and row[1] == st.st_mtime_ns and row[2] == st.st_ino:
+                self.hits += 1
+                self._pending_touches.append((time.time(), file_path))
+                self._maybe_flush()
+                return datetime.fromisoformat(row[3])
+            self.misses += 1
+            return None
+
+    def put(self, file_path, st, date):
+        if not self._usable() or date is None:
+            return
+        with self._lock:
+            self._pending_puts.append((file_path, st.st_size, st.st_mtime_ns, st.st_ino,
+                                       date.isoformat(), time.time()))
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self._pending_puts) + len(self._pending_touches) >= self.flush_every:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending_puts and not self._pending_touches:
+            return
+        try:
+            with self._conn:
+                if self._pending_puts:
+                    self._conn.executemany('''INSERT INTO media VALUES (?, ?, ?, ?, ?, ?)
+                                              ON CONFLICT(path) DO UPDATE SET
+                                                  size = excluded.size, mtime_ns = excluded.mtime_ns,
+                                                  inode = excluded.inode, date = excluded.date,
+                                                  last_used = excluded.last_used''',
+                                           self._pending_puts)
+                    self._count = self._conn.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+                if self._pending_touches:
+                    self._conn.executemany('UPDATE media SET last_used = ? WHERE path = ?',
+                                           self._pending_touches)
+                if self._count > self.max_entries:
+                    self._conn.execute('''DELETE FROM media WHERE path IN
+                                              (SELECT path FROM media ORDER BY last_used LIMIT ?)''',
+                                       (self._count - self.max_entries,))
+                    self._count = self.max_entries
+        except sqlite3.Error as e:
+            logging.warning(f"Metadata cache flush failed: {e}")
+        self._pending_puts.clear()
+        self._pending_touches.clear()
+
+    def flush(self):
+        if not self._usable():
+            return
+        with self._lock:
+            self._flush_locked()
+
+    # --- Directory summaries ---
+    def load_directories(self, root):
+        # Records for root and everything below it, by path
+        if not self._usable():
+            return {}
+        prefix = root if root.endswith(os.sep) else root + os.sep
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        with self._lock:
+            try:
+                rows = self._conn.execute('SELECT * FROM directories WHERE path = ? OR (path >= ? AND path < ?)',
+                                          (root, prefix, upper)).fetchall()
+            except sqlite3.Error as e:
+                logging.warning(f"Cannot read directory summaries: {e}")
+                return {}
+        return {row[0]: DirectoryRecord.from_row(row) for row in rows}
+
+    def save_directories(self, rows, removed=()):
+        if not self._usable():
+            return
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.executemany('DELETE FROM directories WHERE path = ?', ((p,) for p in removed))
+                    self._conn.executemany('INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                           rows)
+            except sqlite3.Error as e:
+                logging.warning(f"Cannot save directory summaries: {e}")
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def session_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hit_ratio(), 4),
+            'entries': self._count,
+        }
+
+    def reset_session_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if not self._usable():
+            return
+        self.flush()
+        with self._lock:
+            self._conn.close()
+            self._conn = None
+
+
+def open_metadata_cache(path=METADATA_CACHE_FILE, **kwargs):
+    # The cache is an optimisation only: if it cannot be opened, run without it
+    try:
+        return MetadataCache(path, **kwargs)
+    except sqlite3.Error as e:
+        logging.warning(f"Metadata cache disabled, cannot open {path}: {e}")
+        return None
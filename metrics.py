@@ -0,0 +1,268 @@
+import os
+import io
+import sys
+import json
+import time
+import heapq
+import pstats
+import cProfile
+import logging
+import threading
+from datetime import datetime
+
+from transfer_store import session_file_name
+
+# --- Runtime metrics ---
+# Hot paths report each operation to the active MetricsRecorder, if any:
+# per stage a count, error count, total time, bytes, a latency histogram
+# and the slowest items. A transfer session writes its snapshot to
+# METRICS_DIR/<session id>.json, which the stats panel reads. With no
+# recorder active, reporting costs a global lookup.
+METRICS_DIR = 'transfer_metrics'
+METRICS_VERSION = 1
+SLOWEST_COUNT = 20
+PROFILE_TOP = 40
+
+# Histogram buckets: powers of two from 1 microsecond to about 67 seconds
+_BUCKET_BOUNDS = tuple(2.0 ** i / 1e6 for i in range(27))
+
+# Stage names used by the built-in instrumentation
+WALK = 'walk'
+FILE_DATE = 'file_date'
+PLAN = 'plan'
+COPY = 'copy'
+LOG_WRITE = 'log_write'
+LOG_FLUSH = 'log_flush'
+CHECKPOINT = 'checkpoint'
+UI_REFRESH = 'ui_refresh'
+UI_POLL = 'ui_poll'
+
+
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.slowest = []   # min-heap of (seconds, item)
+
+    def add(self, seconds, item, nbytes, ok):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.seconds += seconds
+        self.bytes += nbytes
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        # Linear search is fine for 27 bounds and most hits are early
+        index = 0
+        for bound in _BUCKET_BOUNDS:
+            if seconds <= bound:
+                break
+            index += 1
+        self.buckets[index] += 1
+        if item is not None:
+            if len(self.slowest) < SLOWEST_COUNT:
+                heapq.heappush(self.slowest, (seconds, item))
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, item))
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given rank
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(_BUCKET_BOUNDS[index], self.max_seconds) if index < len(_BUCKET_BOUNDS) \
+                    else self.max_seconds
+        return self.max_seconds
+
+    def as_dict(self, wall_seconds):
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_seconds': round(self.seconds, 4),
+            'mean_ms': ms(self.seconds / self.count) if self.count else 0.0,
+            'p50_ms': ms(self.percentile(0.5)),
+            'p95_ms': ms(self.percentile(0.95)),
+            'p99_ms': ms(self.percentile(0.99)),
+            'max_ms': ms(self.max_seconds),
+            'bytes': self.bytes,
+            # Rates over the session's wall time; stages overlap
+            'items_per_sec': round(self.count / wall_seconds, 1) if wall_seconds > 0 else 0.0,
+            'mb_per_sec': round(self.bytes / (1024 * 1024) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+            'histogram': [{'le_ms': ms(_BUCKET_BOUNDS[i]) if i < len(_BUCKET_BOUNDS) else None, 'count': n}
+                          for i, n in enumerate(self.buckets) if n],
+            'slowest': [{'item': item, 'ms': ms(seconds)} for seconds, item in sorted(self.slowest, reverse=True)],
+        }
+
+
+class MetricsRecorder:
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.profiler = None
+
+    def record(self, stage, seconds, item=None, nbytes=0, ok=True):
+        with self._lock:
+            metrics = self.stages.get(stage)
+            if metrics is None:
+                metrics = self.stages[stage] = StageMetrics(stage)
+            metrics.add(seconds, item, nbytes, ok)
+
+    @property
+    def wall_seconds(self):
+        return time.perf_counter() - self._started
+
+    def snapshot(self):
+        wall = self.wall_seconds
+        with self._lock:
+            stages = {name: stage.as_dict(wall) for name, stage in self.stages.items()}
+        return {'version': METRICS_VERSION, 'started_at': self.started_at.isoformat(),
+                'wall_seconds': round(wall, 3), 'stages': stages}
+
+
+# --- Active recorder ---
+_active = None
+
+
+def active():
+    return _active
+
+
+def record(stage, seconds, item=None, nbytes=0, ok=True):
+    recorder = _active
+    if recorder is not None:
+        recorder.record(stage, seconds, item, nbytes, ok)
+
+
+class timed:
+    # with timed(metrics.LOG_FLUSH): ...  (errors are counted and re-raised)
+    __slots__ = ('stage', 'item', 'start')
+
+    def __init__(self, stage, item=None):
+        self.stage = stage
+        self.item = item
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.stage, time.perf_counter() - self.start, self.item, ok=exc_type is None)
+        return False
+
+
+# --- Profiling ---
+class SessionProfiler:
+    # cProfile only follows the thread that enabled it, so every thread
+    # started while profiling enables its own profiler and the results are
+    # merged when the session ends. Threads already running (e.g. the log
+    # listener) are not profiled.
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def _enable(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per interpreter
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+    def _thread_hook(self, frame, event, arg):
+        sys.setprofile(None)
+        self._enable()
+
+    def start(self):
+        threading.setprofile(self._thread_hook)
+        self._enable()
+
+    def stop(self, path=None):
+        # Writes merged pstats to path and returns the top functions by
+        # cumulative time; without a path the profiles are discarded
+        threading.setprofile(None)
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+        for profile in profiles:
+            profile.disable()
+        if not profiles or path is None:
+            return None
+        stats = pstats.Stats(profiles[0], stream=io.StringIO())
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        top = []
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            top.append({'function': f"{os.path.basename(filename)}:{line}({function})", 'calls': calls,
+                        'tottime': round(tottime, 4), 'cumtime': round(cumtime, 4)})
+        top.sort(key=lambda row: row['cumtime'], reverse=True)
+        return {'path': path, 'threads': len(profiles), 'top': top[:PROFILE_TOP]}
+
+
+# --- Sessions ---
+def begin_session(profile=False):
+    # Makes a fresh recorder active; a session left open is dropped
+    global _active
+    end_session()
+    recorder = MetricsRecorder()
+    if profile:
+        recorder.profiler = SessionProfiler()
+        recorder.profiler.start()
+    _active = recorder
+    return recorder
+
+
+def end_session(session_id=None, directory=METRICS_DIR, extra=None):
+    # Deactivates the recorder and, given a session id, writes its metrics
+    # file. Returns the file path, or None. Safe to call twice.
+    global _active
+    recorder, _active = _active, None
+    if recorder is None:
+        return None
+    if session_id is None:
+        if recorder.profiler is not None:
+            recorder.profiler.stop()
+        return None
+    snapshot = recorder.snapshot()
+    snapshot['session_id'] = session_id
+    snapshot['finished_at'] = datetime.now().isoformat()
+    snapshot['extra'] = extra or {}
+    path = os.path.join(directory, session_file_name(session_id) + '.json')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if recorder.profiler is not None:
+            snapshot['profile'] = recorder.profiler.stop(path[:-len('.json')] + '.prof')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2)
+    except OSError as e:
+        logging.warning(f"Cannot write metrics file {path}: {e}")
+        return None
+    logging.info(f"METRICS session={session_id} path={path}")
+    return path
+
+
+def list_metrics_files(directory=METRICS_DIR):
+    # Newest first
+    if not os.path.isdir(directory):
+        return []
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.json')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    return paths
+
+
+def load_metrics(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,91 @@
+import queue
+import logging
+import threading
+
+# --- Scan-to-copy pipeline ---
+# At most DEFAULT_QUEUE_BATCHES planned batches (of scanner.DEFAULT_BATCH_SIZE
+# files) wait between the scanner and the copy engine. When the copies fall
+# behind, the scanner blocks on the full queue, so memory stays flat however
+# many files the source holds.
+DEFAULT_QUEUE_BATCHES = 8
+
+
+class JobStream:
+    # Runs a MediaScanner on a producer thread, turns each batch of matches
+    # into copy jobs with plan_batch(batch) and hands them to the copy
+    # engine, which iterates the stream like a job list. Sharing the
+    # engine's cancel_event makes one cancel stop both the scan and the
+    # copies. on_complete() runs on the producer thread after a scan that
+    # covered the whole source, before the engine sees the end of the
+    # stream.
+    def __init__(self, scanner, source_folder, start_dt, end_dt, plan_batch,
+                 queue_batches=DEFAULT_QUEUE_BATCHES, cancel_event=None, on_complete=None):
+        self.scanner = scanner
+        self.source_folder = source_folder
+        self.start_dt = start_dt
+        self.end_dt = end_dt
+        self.plan_batch = plan_batch
+        self.on_complete = on_complete
+        self.cancel_event = cancel_event or threading.Event()
+        # The scanner checks the same event between lookups
+        scanner.cancel_event = self.cancel_event
+        self.planned = 0
+        self.scan_finished = False
+        self.error = None
+        self._queue = queue.Queue(maxsize=max(1, queue_batches))
+        self._thread = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+        return self
+
+    def _put(self, item):
+        # Blocks while the queue is full; polls so a cancel is noticed
+        while not self.cancel_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            for batch in self.scanner.scan(self.source_folder, self.start_dt, self.end_dt):
+                jobs = self.plan_batch(batch)
+                if jobs and not self._put(jobs):
+                    break
+                self.planned += len(jobs)
+            else:
+                if not self.cancel_event.is_set() and self.on_complete is not None:
+                    self.on_complete()
+        except Exception as e:
+            self.error = e
+            logging.error(f"Scan of {self.source_folder} stopped: {e}")
+        finally:
+            self.scan_finished = True
+            self._put(None)
+
+    def __iter__(self):
+        while True:
+            try:
+                jobs = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                if self.cancel_event.is_set():
+                    return
+                continue
+            if jobs is None:
+                return
+            yield from jobs
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,242 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from media_dates import media_extensions, get_file_date, get_metadata_cache
+from dir_summary import DirectorySummaries, listing_times
+import metrics
+
+# --- Scan defaults ---
+DEFAULT_SCAN_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+DEFAULT_BATCH_SIZE = 256
+
+
+# --- Scan statistics ---
+class ScanStats:
+    def __init__(self):
+        self.dirs_scanned = 0
+        # Subtrees skipped because their recorded dates are outside the window
+        self.dirs_pruned = 0
+        self.files_discovered = 0
+        self.files_resolved = 0
+        self.files_matched = 0
+        self.errors = 0
+        # Per-stage timings in seconds. Discovery and date resolution overlap,
+        # so their sum can exceed the wall-clock total.
+        self.discover_seconds = 0.0
+        self.resolve_seconds = 0.0
+        self.total_seconds = 0.0
+        self.workers = 0
+
+    @property
+    def files_per_sec(self):
+        if self.total_seconds <= 0:
+            return 0.0
+        return self.files_resolved / self.total_seconds
+
+    def as_dict(self):
+        return {
+            'workers': self.workers,
+            'dirs_scanned': self.dirs_scanned,
+            'dirs_pruned': self.dirs_pruned,
+            'files_discovered': self.files_discovered,
+            'files_resolved': self.files_resolved,
+            'files_matched': self.files_matched,
+            'errors': self.errors,
+            'discover_seconds': round(self.discover_seconds, 4),
+            'resolve_seconds': round(self.resolve_seconds, 4),
+            'total_seconds': round(self.total_seconds, 4),
+            'files_per_sec': round(self.files_per_sec, 1),
+        }
+
+
+# --- Discovery ---
+def iter_media_files(source_folder, extensions=media_extensions, stats=None, summaries=None):
+    # Iterative os.scandir walk: avoids os.walk's per-entry stat calls and
+    # lets callers start resolving dates before the whole tree is listed.
+    # With summaries (a dir_summary.DirectorySummaries), subtrees known to
+    # hold no dates in the scan window are skipped and every listed
+    # directory is recorded.
+    if summaries is not None and summaries.should_skip(source_folder):
+        if stats is not None:
+            stats.dirs_pruned += 1
+        return
+    pending = [source_folder]
+    while pending:
+        current = pending.pop()
+        started = time.perf_counter()
+        try:
+            if summaries is not None:
+                mtime_ns, listed_ns = listing_times(current)
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError as e:
+            logging.warning(f"Cannot scan {current}: {e}")
+            if stats is not None:
+                stats.errors += 1
+            metrics.record(metrics.WALK, time.perf_counter() - started, current, ok=False)
+            continue
+        if stats is not None:
+            stats.dirs_scanned += 1
+        subdirs = []
+        files = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.lower().endswith(extensions):
+                    files.append(entry.path)
+            except OSError:
+                continue
+        if summaries is not None:
+            summaries.begin(current, mtime_ns, listed_ns, subdirs)
+            unpruned = [sub for sub in subdirs if not summaries.should_skip(sub)]
+            if stats is not None:
+                stats.dirs_pruned += len(subdirs) - len(unpruned)
+            subdirs = unpruned
+        metrics.record(metrics.WALK, time.perf_counter() - started, current)
+        for path in files:
+            if stats is not None:
+                stats.files_discovered += 1
+            yield path
+        # Reverse so directories are visited in listing order
+        pending.extend(reversed(subdirs))
+
+
+def _resolve_date(date_func, path):
+    start = time.perf_counter()
+    try:
+        return path, date_func(path), time.perf_counter() - start
+    except Exception as e:
+        logging.warning(f"Cannot resolve date for {path}: {e}")
+        return path, None, time.perf_counter() - start
+
+
+# --- Scan engine ---
+class MediaScanner:
+    def __init__(self, workers=None, batch_size=DEFAULT_BATCH_SIZE, use_processes=False,
+                 date_func=get_file_date, extensions=media_extensions, prune=True):
+        self.workers = max(1, workers or DEFAULT_SCAN_WORKERS)
+        # Skip subtrees using the metadata cache's directory summaries; only
+        # meaningful for the default date function and extensions
+        self.prune = prune
+        self.batch_size = max(1, batch_size)
+        self.use_processes = use_processes
+        self.date_func = date_func
+        self.extensions = extensions
+        self.stats = ScanStats()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _make_pool(self):
+        if self.use_processes:
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scan')
+
+    def scan(self, source_folder, start_dt=None, end_dt=None):
+        # Generator yielding lists of (path, datetime) in batches of at most
+        # batch_size. Only files inside [start_dt, end_dt] are yielded when a
+        # bound is given. At most workers * 4 lookups are in flight, so memory
+        # stays bounded however large the tree is.
+        stats = self.stats = ScanStats()
+        stats.workers = self.workers
+        max_in_flight = self.workers * 4
+        scan_start = time.perf_counter()
+        batch = []
+        in_flight = set()
+        summaries = self._summaries(source_folder, start_dt, end_dt)
+        discovered = iter_media_files(source_folder, self.extensions, stats, summaries)
+        exhausted = False
+
+        def collect(done):
+            for fut in done:
+                path, dt, elapsed = fut.result()
+                stats.resolve_seconds += elapsed
+                metrics.record(metrics.FILE_DATE, elapsed, path, ok=dt is not None)
+                if summaries is not None:
+                    summaries.file_resolved(path, dt)
+                if dt is None:
+                    stats.errors += 1
+                    continue
+                stats.files_resolved += 1
+                if start_dt is not None and dt < start_dt:
+                    continue
+                if end_dt is not None and dt > end_dt:
+                    continue
+                stats.files_matched += 1
+                batch.append((path, dt))
+
+        pool = self._make_pool()
+        try:
+            while not self.cancel_event.is_set():
+                # Top up the pool from the discovery stream
+                while not exhausted and len(in_flight) < max_in_flight:
+                    t0 = time.perf_counter()
+                    path = next(discovered, None)
+                    stats.discover_seconds += time.perf_counter() - t0
+                    if path is None:
+                        exhausted = True
+                        break
+                    in_flight.add(pool.submit(_resolve_date, self.date_func, path))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, timeout=0.25, return_when=FIRST_COMPLETED)
+                collect(done)
+                while len(batch) >= self.batch_size:
+                    out = batch[:self.batch_size]
+                    del batch[:self.batch_size]
+                    stats.total_seconds = time.perf_counter() - scan_start
+                    yield out
+        finally:
+            for fut in in_flight:
+                fut.cancel()
+            pool.shutdown(wait=True, cancel_futures=True)
+            stats.total_seconds = time.perf_counter() - scan_start
+        if self.cancel_event.is_set():
+            return
+        # Only a scan that covered the whole tree may update the summaries
+        if summaries is not None:
+            saved, removed = summaries.commit()
+            logging.debug(f"Directory summaries for {source_folder}: {saved} saved, {removed} removed, "
+                          f"{summaries.dirs_checked} checked for pruning")
+        if batch:
+            yield list(batch)
+
+    def _summaries(self, source_folder, start_dt, end_dt):
+        cache = get_metadata_cache()
+        if not self.prune or cache is None or self.date_func is not get_file_date \
+                or self.extensions != media_extensions:
+            return None
+        return DirectorySummaries(cache, source_folder, start_dt, end_dt)
+
+
+def scan_media(source_folder, start_dt=None, end_dt=None, workers=None, on_batch=None, **kwargs):
+    # Convenience wrapper: collect all matches into a list and return
+    # (matched_files, stats). on_batch(batch, stats) is called per batch.
+    scanner = MediaScanner(workers=workers, **kwargs)
+    matched = []
+    for batch in scanner.scan(source_folder, start_dt, end_dt):
+        matched.extend(batch)
+        if on_batch:
+            on_batch(batch, scanner.stats)
+    return matched, scanner.stats
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Scan a folder for media files and report throughput.')
+    parser.add_argument('source')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--processes', action='store_true', help='Use a process pool instead of threads')
+    args = parser.parse_args()
+
+    _, scan_stats = scan_media(args.source, workers=args.workers, batch_size=args.batch_size,
+                               use_processes=args.processes)
+    print(json.dumps(scan_stats.as_dict(), indent=4))
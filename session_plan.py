@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+from copy_engine import CopyJob
+from transfer_store import write_json_atomic, session_file_name, JournalReader, open_journal
+import metrics
+
+# --- Session plan files ---
+# Each transfer writes its planned copy jobs to <id>.plan.json once, then
+# appends one line per finished file to <id>.progress. Progress lines are
+# fsynced in batches (checkpoints); after a crash the last few results may
+# be missing, which is harmless because resumed copies keep destinations
+# that are already complete. A streaming transfer plans files while the
+# scan runs; its plan file starts empty and each planned batch is appended
+# to the progress file as a {"files": [...]} line ahead of its results. A
+# {"scan_complete": true} line follows once the whole source was scanned;
+# until then the plan may be missing files and never counts as complete.
+SESSIONS_DIR = 'transfer_sessions'
+PLAN_VERSION = 1
+CHECKPOINT_EVERY = 64
+CHECKPOINT_INTERVAL = 2.0
+
+PENDING = 0
+DONE = 1
+FAILED = 2
+_STATE_NAMES = {'done': DONE, 'failed': FAILED}
+
+
+class SessionPlan:
+    def __init__(self, plan_path, data):
+        self.plan_path = plan_path
+        self.progress_path = plan_path[:-len('.plan.json')] + '.progress'
+        self.data = data
+        self.files = data.get('files', [])
+        self.states = bytearray(len(self.files))
+        # A plan written after a full scan holds every file from the start
+        self.scan_complete = not data.get('streaming', False)
+        # Indices of done files already written to the log's transfers list
+        self.logged = set()
+        self._lock = threading.Lock()
+        self._progress = None
+        # Length of the progress file's readable records, until the first
+        # append after _replay cuts it back to that
+        self._progress_end = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    @property
+    def session_id(self):
+        return self.data.get('session_id')
+
+    @property
+    def session_started_at(self):
+        return self.data.get('session_started_at') or self.session_id
+
+    @property
+    def source(self):
+        return self.data.get('source')
+
+    @property
+    def dest(self):
+        return self.data.get('dest')
+
+    @property
+    def options(self):
+        return self.data.get('options', {})
+
+    @staticmethod
+    def _file_record(job):
+        return {'src': job.src, 'dest': job.dest, 'date': job.file_date.isoformat() if job.file_date else None,
+                'size': job.size, 'mtime': job.mtime}
+
+    @classmethod
+    def create(cls, session_id, session_started_at, source, dest, jobs, options=None, skipped=0,
+               directory=SESSIONS_DIR, streaming=False):
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for index, job in enumerate(jobs):
+            job.plan_index = index
+            files.append(cls._file_record(job))
+        data = {
+            'version': PLAN_VERSION,
+            'session_id': session_id,
+            'session_started_at': session_started_at,
+            'source': source,
+            'dest': dest,
+            'options': dict(options or {}),
+            'skipped': skipped,
+            'streaming': streaming,
+            'files': files,
+        }
+        plan_path = os.path.join(directory, session_file_name(session_id) + '.plan.json')
+        # Compact JSON: a card dump can plan hundreds of thousands of files
+        write_json_atomic(plan_path, data, indent=None)
+        plan = cls(plan_path, data)
+        # A new plan starts with an empty progress file
+        plan._progress = open(plan.progress_path, 'w', encoding='utf-8')
+        return plan
+
+    @classmethod
+    def load(cls, plan_path):
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        plan = cls(plan_path, data)
+        plan._replay()
+        return plan
+
+    def _replay(self):
+        # Strict: results refer to files by their index in earlier batches,
+        # so nothing after an unreadable line can be placed. Whatever is
+        # dropped is copied again on resume, or found again by the rescan
+        # of a plan whose scan_complete line is gone.
+        reader = JournalReader(self.progress_path, strict=True)
+        for record in reader:
+            if 'logged' in record:
+                self.logged.update(record['logged'])
+                continue
+            if record.get('scan_complete'):
+                self.scan_complete = True
+                continue
+            if 'files' in record:
+                self.files.extend(record['files'])
+                self.states.extend(bytes(len(record['files'])))
+                continue
+            index = record.get('i')
+            state = _STATE_NAMES.get(record.get('state'))
+            if state is not None and isinstance(index, int) and 0 <= index < len(self.states):
+                self.states[index] = state
+        if reader.corrupt and self.data.get('streaming'):
+            # Batches past the bad line are lost even if the scan finished
+            self.scan_complete = False
+        self._progress_end = reader.end
+
+    # --- Progress ---
+    def _append(self, record):
+        if self._progress is None:
+            self._progress = open_journal(self.progress_path, self._progress_end)
+            self._progress_end = None
+        self._progress.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._unsynced += 1
+        if self._unsynced >= CHECKPOINT_EVERY or time.monotonic() - self._last_sync >= CHECKPOINT_INTERVAL:
+            self._checkpoint_locked()
+
+    def _checkpoint_locked(self):
+        if self._progress is not None and self._unsynced:
+            with metrics.timed(metrics.CHECKPOINT):
+                self._progress.flush()
+                os.fsync(self._progress.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def checkpoint(self):
+        with self._lock:
+            self._checkpoint_locked()
+
+    def add_jobs(self, jobs):
+        # Streaming transfers: plan a batch after the plan file was written.
+        # Checkpointed at once, so a result is never replayed ahead of the
+        # file it belongs to.
+        if not jobs:
+            return
+        with self._lock:
+            first = len(self.files)
+            records = []
+            for offset, job in enumerate(jobs):
+                job.plan_index = first + offset
+                records.append(self._file_record(job))
+            self.files.extend(records)
+            self.states.extend(bytes(len(records)))
+            self._append({'files': records})
+            self._checkpoint_locked()
+
+    def mark_scan_complete(self):
+        with self._lock:
+            self.scan_complete = True
+            self._append({'scan_complete': True})
+            self._checkpoint_locked()
+
+    def mark(self, index, ok):
+        with self._lock:
+            self.states[index] = DONE if ok else FAILED
+            self._append({'i': index, 'state': 'done' if ok else 'failed'})
+
+    def mark_logged(self, indices):
+        indices = [i for i in indices if i not in self.logged]
+        if not indices:
+            return
+        with self._lock:
+            self.logged.update(indices)
+            self._append({'logged': indices})
+            self._checkpoint_locked()
+
+    # --- Queries ---
+    def counts(self):
+        done = self.states.count(DONE)
+        failed = self.states.count(FAILED)
+        return {'total': len(self.states), 'done': done, 'failed': failed,
+                'pending': len(self.states) - done - failed}
+
+    @property
+    def complete(self):
+        return self.scan_complete and self.states.count(DONE) == len(self.states)
+
+    def unlogged_sources(self):
+        # Done files whose transfers-list entry was never written, e.g.
+        # because the run before the resume crashed
+        return [(i, self.files[i]['src']) for i in range(len(self.states))
+                if self.states[i] == DONE and i not in self.logged]
+
+    def pending_jobs(self):
+        # Pending and failed files, re-stat'ed so the entries written for
+        # them describe the source as it is now. The source tree is not
+        # scanned again here; see TransferSession.rescan_stream for plans
+        # whose scan did not finish.
+        jobs = []
+        for index, item in enumerate(self.files):
+            if self.states[index] == DONE:
+                continue
+            file_date = datetime.fromisoformat(item['date']) if item.get('date') else None
+            job = CopyJob(item['src'], item['dest'], file_date)
+            job.plan_index = index
+            try:
+                st = os.stat(job.src)
+                job.size = st.st_size
+                job.mtime = st.st_mtime
+            except OSError:
+                # Let the copy itself report the error
+                pass
+            jobs.append(job)
+        return jobs
+
+    # --- Lifecycle ---
+    def close(self):
+        with self._lock:
+            self._checkpoint_locked()
+            if self._progress is not None:
+                self._progress.close()
+                self._progress = None
+
+    def remove(self):
+        self.close()
+        for path in (self.plan_path, self.progress_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def list_incomplete_sessions(directory=SESSIONS_DIR):
+    # Plans left behind by cancelled, failed or crashed transfers, newest first
+    plans = []
+    if not os.path.isdir(directory):
+        return plans
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.name.endswith('.plan.json'):
+                continue
+            try:
+                plans.append(SessionPlan.load(entry.path))
+            except Exception as e:
+                logging.error(f"Cannot read session plan {entry.path}: {e}")
+    plans.sort(key=lambda plan: plan.session_started_at or '', reverse=True)
+    return plans
+
+
+def find_session(session_id, directory=SESSIONS_DIR):
+    plan_path = os.path.join(directory, session_file_name(session_id) + '.plan.json')
+    if not os.path.exists(plan_path):
+        return None
+    return SessionPlan.load(plan_path)
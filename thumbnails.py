@@ -0,0 +1,241 @@
+import io
+import os
+import queue
+import hashlib
+import logging
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from media_dates import read_exif_thumbnail
+
+# --- Thumbnail pipeline ---
+# Thumbnails are rendered on a process pool so decoding never runs on the
+# Tk thread (or holds its GIL), and written as small PNGs, which Tk shows
+# without Pillow, to a disk cache keyed by path, size and mtime. JPEGs use
+# their embedded EXIF preview when it is big enough, or else Pillow's
+# draft() mode, which decodes at 1/2 to 1/8 scale straight from the DCT
+# data. The cache stays under max_bytes by deleting the least recently
+# used files; a cache hit touches its file's mtime.
+THUMB_DIR = 'thumbnail_cache'
+THUMB_SIZE = (64, 64)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+TRIM_TARGET = 0.9
+ORIENTATION = 0x0112
+
+# Orientation tag -> transpose method names
+_TRANSPOSES = {2: ('FLIP_LEFT_RIGHT',), 3: ('ROTATE_180',), 4: ('FLIP_TOP_BOTTOM',), 5: ('TRANSPOSE',),
+               6: ('ROTATE_270',), 7: ('TRANSVERSE',), 8: ('ROTATE_90',)}
+
+
+def available():
+    # Thumbnails need Pillow; without it the review lists paths only
+    return importlib.util.find_spec('PIL') is not None
+
+
+def cache_path(cache_dir, file_path, st, size=THUMB_SIZE):
+    key = f"{os.path.abspath(file_path)}\0{st.st_size}\0{st.st_mtime_ns}\0{size[0]}x{size[1]}"
+    digest = hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(cache_dir, digest[:2], digest + '.png')
+
+
+# --- Rendering (worker processes) ---
+def _orient(image, orientation):
+    from PIL import Image
+    methods = getattr(Image, 'Transpose', Image)
+    for name in _TRANSPOSES.get(orientation, ()):
+        image = image.transpose(getattr(methods, name))
+    return image
+
+
+def _render(file_path, size):
+    from PIL import Image
+    with Image.open(file_path) as img:
+        try:
+            orientation = img.getexif().get(ORIENTATION, 1)
+        except Exception:
+            orientation = 1
+        thumb = None
+        if img.format == 'JPEG':
+            embedded = read_exif_thumbnail(file_path)
+            if embedded is not None:
+                preview = Image.open(io.BytesIO(embedded))
+                if preview.width >= size[0] or preview.height >= size[1]:
+                    thumb = preview
+            if thumb is None:
+                img.draft('RGB', size)
+        if thumb is None:
+            thumb = img
+        thumb.thumbnail(size)
+        thumb = _orient(thumb, orientation)
+        if thumb.mode not in ('RGB', 'RGBA', 'L', 'P'):
+            thumb = thumb.convert('RGB')
+        out = io.BytesIO()
+        thumb.save(out, 'PNG')
+        return out.getvalue()
+
+
+def render_thumbnail(candidates, cache_dir=THUMB_DIR, size=THUMB_SIZE):
+    # Thumbnail path for the first candidate file that exists, rendering it
+    # into the cache if needed; (None, 0) when none can be shown. Files that
+    # cannot be decoded (videos, HEIC without a plugin) leave an empty
+    # cache file, so they are not retried until they change. Returns the
+    # bytes added to the cache as well.
+    for file_path in candidates:
+        try:
+            st = os.stat(file_path)
+        except (OSError, TypeError):
+            continue
+        path = cache_path(cache_dir, file_path, st, size)
+        try:
+            cached = os.stat(path).st_size
+        except OSError:
+            cached = None
+        if cached is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return (path if cached else None), 0
+        try:
+            data = _render(file_path, size)
+        except Exception as e:
+            logging.debug(f"No thumbnail for {file_path}: {e}")
+            data = b''
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Cannot write thumbnail {path}: {e}")
+            return None, 0
+        return (path if data else None), len(data)
+    return None, 0
+
+
+# --- Cache size ---
+def trim_cache(cache_dir=THUMB_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    # Deletes least recently used thumbnails until the cache is under
+    # TRIM_TARGET of max_bytes; returns the bytes left
+    files = []
+    total = 0
+    if not os.path.isdir(cache_dir):
+        return 0
+    for bucket in os.scandir(cache_dir):
+        if not bucket.is_dir(follow_symlinks=False):
+            continue
+        for entry in os.scandir(bucket.path):
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= max_bytes:
+        return total
+    files.sort()
+    target = max_bytes * TRIM_TARGET
+    removed = 0
+    for _, nbytes, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= nbytes
+        removed += 1
+    logging.info(f"THUMBNAIL_CACHE trimmed={removed} bytes={total} dir={cache_dir}")
+    return total
+
+
+# --- Loader (Tk side) ---
+class ThumbnailLoader:
+    # Requests are keyed by the caller (the delete dialog uses the row's
+    # destination) and finished thumbnails are collected by polling
+    # drain(), since Tk may only be touched from its own thread. retain()
+    # cancels requests for rows that have scrolled out of view before they
+    # start.
+    def __init__(self, cache_dir=THUMB_DIR, size=THUMB_SIZE, max_bytes=DEFAULT_MAX_BYTES, workers=None):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_bytes = max_bytes
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.results = queue.Queue()
+        self._pending = {}   # key -> future
+        self._pool = None
+        self._lock = threading.Lock()
+        self._cache_bytes = None
+        self._trimming = False
+        self._closed = False
+
+    def _start_trim(self):
+        # Called with the lock held
+        if self._trimming:
+            return
+        self._trimming = True
+
+        def run():
+            total = trim_cache(self.cache_dir, self.max_bytes)
+            with self._lock:
+                self._cache_bytes = total
+                self._trimming = False
+        threading.Thread(target=run, daemon=True).start()
+
+    def request(self, key, candidates):
+        with self._lock:
+            if self._closed or key in self._pending:
+                return
+            if self._pool is None:
+                # Spawned, not forked: the app has logging and Tk threads
+                # whose locks a forked child could inherit held
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+                self._start_trim()
+            future = self._pool.submit(render_thumbnail, tuple(candidates), self.cache_dir, self.size)
+            self._pending[key] = future
+        future.add_done_callback(lambda f, key=key: self._done(key, f))
+
+    def retain(self, keys):
+        keys = set(keys)
+        with self._lock:
+            stale = [future for key, future in self._pending.items() if key not in keys]
+        # Outside the lock: a successful cancel runs _done right away
+        for future in stale:
+            future.cancel()
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+            if future.cancelled():
+                return
+            try:
+                path, added = future.result()
+            except Exception as e:
+                logging.warning(f"Thumbnail worker failed for {key}: {e}")
+                path, added = None, 0
+            if self._cache_bytes is not None:
+                self._cache_bytes += added
+                if self._cache_bytes > self.max_bytes:
+                    self._start_trim()
+        self.results.put((key, path))
+
+    def drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self.results.get_nowait())
+            except queue.Empty:
+                return items
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            pool, self._pool = self._pool, None
+            self._pending.clear()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,113 @@
+import sys
+import json
+import argparse
+from datetime import datetime
+
+from media_dates import set_metadata_cache
+from metadata_cache import open_metadata_cache, METADATA_CACHE_FILE
+from copy_engine import DEFAULT_COPY_WORKERS
+from transfer_store import TransferLogStore, log_file
+from transfer_core import (AUDIT_LOG_FILE, setup_logging, ensure_transfer_log_file, run_transfer, stream_transfer,
+                           resume_transfer)
+from session_plan import SESSIONS_DIR, list_incomplete_sessions, find_session
+from layout_planner import LAYOUT_TEMPLATES, DEFAULT_LAYOUT, LayoutError, resolve_template
+import metrics
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Transfer photos and videos into YYYY-MM folders without the GUI.')
+    parser.add_argument('--source', help='Source folder to scan')
+    parser.add_argument('--dest', help='Destination folder')
+    parser.add_argument('--start', type=parse_date, default=datetime(2000, 1, 1), help='Start date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=parse_date, default=None, help='End date, inclusive (YYYY-MM-DD)')
+    parser.add_argument('--layout', default=DEFAULT_LAYOUT,
+                        help=f"Folder layout: one of {', '.join(LAYOUT_TEMPLATES)} or a template such as "
+                             f"'{{camera}}/{{year}}/{{month}}'")
+    parser.add_argument('--workers', type=int, default=DEFAULT_COPY_WORKERS, help='Copy worker threads')
+    parser.add_argument('--scan-workers', type=int, default=None, help='Metadata scan worker threads')
+    parser.add_argument('--stream', action='store_true',
+                        help='Start copying while the source is still being scanned')
+    parser.add_argument('--profile', action='store_true',
+                        help=f"Also capture a cProfile of the session next to its metrics in {metrics.METRICS_DIR}")
+    parser.add_argument('--incremental', action='store_true', help='Skip files already transferred unchanged')
+    parser.add_argument('--dedup', action='store_true', help='Skip duplicates and rename name collisions')
+    parser.add_argument('--verify', action='store_true', help='Checksum each copy while writing it')
+    parser.add_argument('--read-back', action='store_true', help='Re-read each destination to confirm its checksum')
+    parser.add_argument('--transfer-log', default=log_file, help='Structured transfer log (JSON)')
+    parser.add_argument('--audit-log', default=AUDIT_LOG_FILE, help='Audit log file')
+    parser.add_argument('--metadata-cache', default=METADATA_CACHE_FILE, help='Metadata cache database')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the metadata cache')
+    parser.add_argument('--sessions-dir', default=SESSIONS_DIR, help='Folder holding resumable session plans')
+    parser.add_argument('--list-sessions', action='store_true', help='List interrupted sessions and exit')
+    parser.add_argument('--resume', metavar='SESSION_ID', help='Resume an interrupted session')
+    return parser
+
+
+def list_sessions(sessions_dir):
+    for plan in list_incomplete_sessions(sessions_dir):
+        print(json.dumps(dict(session_id=plan.session_id, source=plan.source, dest=plan.dest, **plan.counts())))
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.list_sessions:
+        return list_sessions(args.sessions_dir)
+    if not args.resume and not (args.source and args.dest):
+        parser.error('--source and --dest are required unless resuming')
+    try:
+        resolve_template(args.layout)
+    except LayoutError as e:
+        parser.error(str(e))
+    end_dt = (args.end or datetime.now()).replace(hour=23, minute=59, second=59)
+    if args.start > end_dt:
+        print('Start date must be before end date.', file=sys.stderr)
+        return 2
+
+    setup_logging(args.audit_log)
+    ensure_transfer_log_file(args.transfer_log)
+    store = TransferLogStore(args.transfer_log)
+    cache = None if args.no_cache else open_metadata_cache(args.metadata_cache)
+    set_metadata_cache(cache)
+
+    # Machine-readable progress: one JSON object per line on stdout
+    def emit(event):
+        print(json.dumps(event), flush=True)
+
+    # Per-stage metrics are written to transfer_metrics/<session id>.json
+    metrics.begin_session(profile=args.profile)
+    try:
+        if args.resume:
+            session_plan = find_session(args.resume, args.sessions_dir)
+            if session_plan is None:
+                print(f"No interrupted session {args.resume!r} in {args.sessions_dir}", file=sys.stderr)
+                return 2
+            summary = resume_transfer(store, session_plan, workers=args.workers, on_progress=emit)
+        else:
+            transfer = stream_transfer if args.stream else run_transfer
+            summary = transfer(store, args.source, args.dest, args.start, end_dt,
+                               workers=args.workers, scan_workers=args.scan_workers,
+                               incremental=args.incremental, dedup=args.dedup,
+                               verify=args.verify or args.read_back, read_back=args.read_back,
+                               on_progress=emit, sessions_dir=args.sessions_dir, layout=args.layout)
+    finally:
+        metrics.end_session()
+        if cache is not None:
+            emit(dict(event='cache', **cache.session_stats()))
+            cache.close()
+        store.close()
+    if summary['cancelled']:
+        return 130
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import logging
+import itertools
+from datetime import datetime
+
+from scanner import MediaScanner
+from copy_engine import CopyEngine, DEFAULT_COPY_WORKERS
+from dedup import plan_transfer, TransferPlanner
+from layout_planner import plan_layout, LayoutPlanner, DEFAULT_LAYOUT
+from pipeline import JobStream, DEFAULT_QUEUE_BATCHES
+from transfer_store import log_file
+from session_plan import SessionPlan, SESSIONS_DIR
+from audit_log import AUDIT_LOG_FILE, start_log_pipeline
+import metrics
+
+
+# --- Logging Setup ---
+def setup_logging(log_path=AUDIT_LOG_FILE):
+    # Records go through a queue to a listener thread that writes and
+    # rotates the file, so copy workers never wait on log I/O
+    return start_log_pipeline(log_path)
+
+
+# --- Initialize transfer log (create if missing) ---
+def ensure_transfer_log_file(path=log_file):
+    if not os.path.exists(path):
+        try:
+            with open(path, 'w') as f:
+                json.dump({}, f)
+        except Exception:
+            pass
+
+
+# --- Destination layout ---
+def build_copy_jobs(matched_files, dest_folder, layout=DEFAULT_LAYOUT):
+    with metrics.timed(metrics.PLAN):
+        plan = plan_layout(matched_files, dest_folder, layout)
+    logging.info(f"LAYOUT layout={layout} folders={len(plan.folders)} files={len(plan.jobs)} "
+                 f"renamed={len(plan.renamed)} existing={len(plan.existing)}")
+    return plan.jobs
+
+
+def create_destination_folders(jobs):
+    # One makedirs per distinct folder, once planning has dropped skipped
+    # files; a folder that cannot be created fails its copies individually
+    for folder in dict.fromkeys(os.path.dirname(job.dest) for job in jobs):
+        try:
+            os.makedirs(folder, exist_ok=True)
+        except OSError as e:
+            logging.error(f"Cannot create folder {folder}: {e}")
+
+
+def stream_plan_options(start_dt, end_dt, layout, incremental, dedup, verify, read_back):
+    # Plan options of a streaming session; the scan options let a resume
+    # rescan the source if the session stopped mid-scan
+    return {'verify': verify, 'read_back': read_back, 'layout': layout, 'incremental': incremental,
+            'dedup': dedup, 'start': start_dt.isoformat() if start_dt else None,
+            'end': end_dt.isoformat() if end_dt else None}
+
+
+# --- Transfer session ---
+class TransferSession:
+    # One transfer operation: owns the session identifier and turns copy
+    # results into transfer log entries and audit log lines. Used by both
+    # the GUI and the command line.
+    def __init__(self, store, source_folder, dest_folder, session_id=None, session_started_at=None):
+        self.store = store
+        self.source_folder = source_folder
+        self.dest_folder = dest_folder
+        # Establish a session identifier for this transfer operation
+        self.session_id = session_id or datetime.now().isoformat()
+        self.session_started_at = session_started_at or self.session_id
+        self.transferred_files = []
+        self.failed = 0
+        self.skipped = []
+        # Checkpointed plan that lets an interrupted session be resumed
+        self.session_plan = None
+        self._transferred_indices = []
+
+    @classmethod
+    def resume(cls, store, session_plan):
+        # Continue a planned session under its original id, so its log
+        # entries and summary still group together
+        session = cls(store, session_plan.source, session_plan.dest,
+                      session_plan.session_id, session_plan.session_started_at)
+        session.session_plan = session_plan
+        for index, src_file in session_plan.unlogged_sources():
+            session._transferred_indices.append(index)
+            session.transferred_files.append(src_file)
+        return session
+
+    def start_plan(self, jobs, options=None, sessions_dir=SESSIONS_DIR, streaming=False):
+        self.session_plan = SessionPlan.create(self.session_id, self.session_started_at, self.source_folder,
+                                               self.dest_folder, jobs, options, skipped=len(self.skipped),
+                                               directory=sessions_dir, streaming=streaming)
+
+    def plan(self, jobs, incremental=False, dedup=False):
+        if not (incremental or dedup):
+            return jobs
+        with metrics.timed(metrics.PLAN):
+            plan = plan_transfer(jobs, self.store.index, incremental=incremental, dedup=dedup)
+        return self._apply_plan(plan)
+
+    def _apply_plan(self, plan):
+        for job, reason, detail in plan.skipped:
+            logging.info(f"Skipped {job.src}: {reason}{f' of {detail}' if detail else ''}")
+        for job, original in plan.renamed:
+            logging.info(f"Renamed {job.src} -> {job.dest} (name collision with {original})")
+        self.skipped.extend(plan.skipped)
+        return plan.jobs
+
+    def batch_planner(self, layout=DEFAULT_LAYOUT, incremental=False, dedup=False):
+        # plan_batch(matched) for a JobStream: lays out, filters, checkpoints
+        # and creates folders for one scan batch at a time, on the scan
+        # thread. Requires start_plan(..., streaming=True) first. Files the
+        # plan already holds (a rescan on resume) are left out, and their
+        # destinations stay reserved.
+        layout_planner = LayoutPlanner(self.dest_folder, layout)
+        transfer_planner = TransferPlanner(self.store.index, incremental, dedup) if incremental or dedup else None
+        planned_sources = {item['src'] for item in self.session_plan.files}
+        layout_planner.planned.update(item['dest'] for item in self.session_plan.files)
+
+        def plan_batch(matched_files):
+            if planned_sources:
+                matched_files = [match for match in matched_files if match[0] not in planned_sources]
+            with metrics.timed(metrics.PLAN):
+                jobs = layout_planner.plan(matched_files).jobs
+                if transfer_planner is not None:
+                    jobs = self._apply_plan(transfer_planner.plan(jobs))
+            self.session_plan.add_jobs(jobs)
+            create_destination_folders(jobs)
+            return jobs
+        return plan_batch
+
+    def rescan_stream(self, cancel_event=None, scan_workers=None, queue_batches=DEFAULT_QUEUE_BATCHES):
+        # For a streaming session interrupted before its scan finished: a
+        # JobStream that scans the source again with the original options
+        # and plans only the files the plan does not hold yet. None when the
+        # scan had finished, or the plan predates recorded scan options (it
+        # then stays incomplete rather than dropping unscanned files).
+        plan = self.session_plan
+        if plan.scan_complete:
+            return None
+        options = plan.options
+        if 'layout' not in options:
+            logging.warning(f"Session {self.session_id} stopped mid-scan and has no scan options; "
+                            f"only its planned files can be resumed")
+            return None
+        start_dt = datetime.fromisoformat(options['start']) if options.get('start') else None
+        end_dt = datetime.fromisoformat(options['end']) if options.get('end') else None
+        return JobStream(MediaScanner(workers=scan_workers), self.source_folder, start_dt, end_dt,
+                         self.batch_planner(options['layout'], options.get('incremental', False),
+                                            options.get('dedup', False)),
+                         queue_batches, cancel_event, on_complete=plan.mark_scan_complete)
+
+    def make_entry(self, result):
+        entry = {
+            'source': result.job.src,
+            'destination': result.job.dest,
+            'timestamp': datetime.now().isoformat(),
+            'session_id': self.session_id,
+            'session_started_at': self.session_started_at,
+            'session_source': self.source_folder,
+            'session_destination': self.dest_folder
+        }
+        if result.digest:
+            entry['digest'] = result.digest
+        # Source size/mtime let later incremental runs skip unchanged files
+        if result.job.size is not None:
+            entry['size'] = result.job.size
+            entry['mtime'] = result.job.mtime
+        else:
+            try:
+                st = os.stat(result.job.src)
+                entry['size'] = st.st_size
+                entry['mtime'] = st.st_mtime
+            except OSError:
+                pass
+        return entry
+
+    def record_result(self, result):
+        # Runs on the engine's log-writer thread, once per file in job order
+        src_file, dest_file = result.job.src, result.job.dest
+        if not result.ok:
+            self.failed += 1
+            logging.error(f"Error copying {src_file} -> {dest_file}: {result.error}")
+        else:
+            logging.info(f"Copied {src_file} -> {dest_file} via {result.strategy}")
+            self.transferred_files.append(src_file)
+            # Update structured JSON transfer log per file (journaled append)
+            with metrics.timed(metrics.LOG_WRITE):
+                self.store.put_entry(self.make_entry(result))
+        # Checkpoint after the log entry, so a file marked done is never
+        # missing from the log
+        if self.session_plan is not None and result.job.plan_index is not None:
+            if result.ok:
+                self._transferred_indices.append(result.job.plan_index)
+            self.session_plan.mark(result.job.plan_index, result.ok)
+
+    def finish(self, engine=None):
+        with metrics.timed(metrics.LOG_FLUSH):
+            self.store.extend_transfers(self.transferred_files)
+            self.store.flush()
+        if self.session_plan is not None:
+            self.session_plan.mark_logged(self._transferred_indices)
+            if self.session_plan.complete:
+                self.session_plan.remove()
+            else:
+                # Cancelled or with failures: keep the plan for a resume
+                counts = self.session_plan.counts()
+                logging.info(f"SESSION_INCOMPLETE session={self.session_id} pending={counts['pending']} "
+                             f"failed={counts['failed']}")
+                self.session_plan.close()
+        if engine is not None:
+            logging.info(f"COPY_STATS {json.dumps(engine.copy_stats.as_dict())}")
+        # Per-stage timings, when the caller started a metrics session
+        metrics.end_session(self.session_id, extra={
+            'source': self.source_folder, 'dest': self.dest_folder,
+            'transferred': len(self.transferred_files), 'failed': self.failed, 'skipped': len(self.skipped),
+            'copy': engine.copy_stats.as_dict() if engine is not None else None})
+        # Session summary log for UI consumption
+        try:
+            logging.info(f"SESSION_SUMMARY files={len(self.transferred_files)} "
+                         f"source={self.source_folder} dest={self.dest_folder}")
+        except Exception:
+            pass
+
+
+# --- Headless transfer ---
+def run_transfer(store, source_folder, dest_folder, start_dt, end_dt, workers=DEFAULT_COPY_WORKERS,
+                 scan_workers=None, incremental=False, dedup=False, verify=False, read_back=False,
+                 on_progress=None, progress_interval=0.5, sessions_dir=SESSIONS_DIR, layout=DEFAULT_LAYOUT):
+    # Scan, plan and copy without any UI. on_progress(event) receives plain
+    # dicts suitable for JSON output. Returns the final summary event.
+    emit = on_progress or (lambda event: None)
+    started = time.monotonic()
+
+    scanner = MediaScanner(workers=scan_workers)
+    matched_files = []
+    last_emit = 0.0
+    for batch in scanner.scan(source_folder, start_dt, end_dt):
+        matched_files.extend(batch)
+        if time.monotonic() - last_emit >= progress_interval:
+            last_emit = time.monotonic()
+            emit(dict(event='scan', **scanner.stats.as_dict()))
+    emit(dict(event='scan_done', **scanner.stats.as_dict()))
+    logging.info(f"SCAN_STATS source={source_folder} {json.dumps(scanner.stats.as_dict())}")
+
+    session = TransferSession(store, source_folder, dest_folder)
+    jobs = session.plan(build_copy_jobs(matched_files, dest_folder, layout), incremental=incremental, dedup=dedup)
+    session.start_plan(jobs, {'verify': verify, 'read_back': read_back}, sessions_dir)
+    create_destination_folders(jobs)
+    engine = CopyEngine(workers=workers, on_result=session.record_result, verify=verify, read_back=read_back,
+                        make_dirs=False)
+    summary = _run_copy(session, engine, jobs, emit, progress_interval)
+    summary['matched'] = len(matched_files)
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    emit(summary)
+    return summary
+
+
+def stream_transfer(store, source_folder, dest_folder, start_dt, end_dt, workers=DEFAULT_COPY_WORKERS,
+                    scan_workers=None, incremental=False, dedup=False, verify=False, read_back=False,
+                    on_progress=None, progress_interval=0.5, sessions_dir=SESSIONS_DIR, layout=DEFAULT_LAYOUT,
+                    queue_batches=DEFAULT_QUEUE_BATCHES):
+    # Like run_transfer, but copying starts with the first scan batch:
+    # matches flow through a bounded queue into the engine, so metadata
+    # reads overlap copy I/O and memory does not grow with the source.
+    emit = on_progress or (lambda event: None)
+    started = time.monotonic()
+    session = TransferSession(store, source_folder, dest_folder)
+    session.start_plan([], stream_plan_options(start_dt, end_dt, layout, incremental, dedup, verify, read_back),
+                       sessions_dir, streaming=True)
+    engine = CopyEngine(workers=workers, on_result=session.record_result, verify=verify, read_back=read_back,
+                        make_dirs=False)
+    stream = JobStream(MediaScanner(workers=scan_workers), source_folder, start_dt, end_dt,
+                       session.batch_planner(layout, incremental, dedup), queue_batches, engine.cancel_event,
+                       on_complete=session.session_plan.mark_scan_complete)
+    summary = _run_copy(session, engine, stream.start(), emit, progress_interval, stream)
+    stream.join()
+    scan_stats = stream.scanner.stats.as_dict()
+    logging.info(f"SCAN_STATS source={source_folder} {json.dumps(scan_stats)}")
+    emit(dict(event='scan_done', **scan_stats))
+    summary['matched'] = scan_stats['files_matched']
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    if stream.error is not None:
+        summary['scan_error'] = str(stream.error)
+    emit(summary)
+    return summary
+
+
+def resume_transfer(store, session_plan, workers=DEFAULT_COPY_WORKERS, on_progress=None, progress_interval=0.5,
+                    scan_workers=None):
+    # Continue an interrupted session from its plan: only the files not yet
+    # done are re-stat'ed and copied, and partially written destinations
+    # are continued rather than rewritten. A streaming session that stopped
+    # mid-scan also rescans its source for files it never planned.
+    emit = on_progress or (lambda event: None)
+    started = time.monotonic()
+    session = TransferSession.resume(store, session_plan)
+    jobs = session_plan.pending_jobs()
+    logging.info(f"SESSION_RESUMED session={session.session_id} pending={len(jobs)} "
+                 f"rescan={not session_plan.scan_complete} "
+                 f"source={session.source_folder} dest={session.dest_folder}")
+    options = session_plan.options
+    engine = CopyEngine(workers=workers, on_result=session.record_result, verify=options.get('verify', False),
+                        read_back=options.get('read_back', False), resume=True)
+    stream = session.rescan_stream(engine.cancel_event, scan_workers)
+    if stream is not None:
+        summary = _run_copy(session, engine, itertools.chain(jobs, stream.start()), emit, progress_interval,
+                            stream)
+        stream.join()
+        logging.info(f"SCAN_STATS source={session.source_folder} {json.dumps(stream.scanner.stats.as_dict())}")
+        if stream.error is not None:
+            summary['scan_error'] = str(stream.error)
+    else:
+        summary = _run_copy(session, engine, jobs, emit, progress_interval)
+    summary['resumed'] = True
+    summary['matched'] = len(session_plan.files)
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    emit(summary)
+    return summary
+
+
+def _run_copy(session, engine, jobs, emit, progress_interval, stream=None):
+    progress = engine.start(jobs)
+    try:
+        while not progress.finished:
+            time.sleep(progress_interval)
+            event = {'event': 'copy', 'completed': progress.completed, 'total': progress.total,
+                     'failed': progress.failed, 'bytes': progress.bytes_copied,
+                     'files_per_sec': round(progress.files_per_sec, 1),
+                     'mb_per_sec': round(progress.mb_per_sec, 1)}
+            if stream is not None:
+                stats = stream.scanner.stats
+                event.update(scanned=stats.files_resolved, matched=stats.files_matched, planned=stream.planned,
+                             queued_batches=stream.queued, scanning=not stream.scan_finished)
+            emit(event)
+    except KeyboardInterrupt:
+        engine.cancel()
+        engine.wait()
+    session.finish(engine)
+
+    return {
+        'event': 'done',
+        'session_id': session.session_id,
+        'transferred': len(session.transferred_files),
+        'skipped': len(session.skipped),
+        'failed': session.failed,
+        'cancelled': progress.cancelled,
+        'bytes': progress.bytes_copied,
+        'copy': engine.copy_stats.as_dict(),
+    }
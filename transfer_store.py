@@ -0,0 +1,586 @@
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import threading
+
+# --- Locked JSON log file path ---
+log_file = 'transfer_log.json'
+DEFAULT_FSYNC_EVERY = 64
+DEFAULT_FSYNC_INTERVAL = 1.0
+DEFAULT_COMPACT_EVERY = 10000
+
+
+def journal_path_for(path):
+    return os.path.splitext(path)[0] + '.journal'
+
+
+def session_file_name(session_id):
+    # Session ids are ISO timestamps; ':' is not allowed in Windows file names
+    return re.sub(r'[^0-9A-Za-z_-]', '-', session_id)
+
+
+def _read_snapshot(path):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+        except Exception as e:
+            logging.error(f"Cannot read transfer log snapshot {path}: {e}")
+    return {}
+
+
+def write_json_atomic(path, data, indent=4, separators=None):
+    # Write-temp-then-rename: readers see either the old or the new file,
+    # never a partially written one.
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent, separators=separators)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# --- JSON-lines journals ---
+class JournalReader:
+    # Iterates the records of a JSON-lines journal. A last line without its
+    # newline is an append torn by a crash and is dropped; any other
+    # unreadable line is reported, and with strict=True ends the replay
+    # there, for journals whose records depend on the ones before them.
+    # end is the offset of the last record read; open_journal() cuts the
+    # file back to it, so the next record is not glued to a torn line.
+    def __init__(self, path, strict=False):
+        self.path = path
+        self.strict = strict
+        self.end = 0
+        self.corrupt = False
+
+    def __iter__(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                offset += len(line)
+                if not line.endswith(b'\n'):
+                    logging.warning(f"Dropping torn last record of {self.path}")
+                    return
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.error(f"Unreadable record at byte {offset - len(line)} of {self.path}")
+                    self.corrupt = True
+                    if self.strict:
+                        return
+                    self.end = offset
+                    continue
+                self.end = offset
+                yield record
+
+
+def open_journal(path, end=None):
+    # Opens a journal for appending, first cutting anything past end (see
+    # JournalReader) when it was replayed since it was last open
+    if end is not None:
+        try:
+            if os.path.getsize(path) > end:
+                os.truncate(path, end)
+        except FileNotFoundError:
+            pass
+    return open(path, 'a', encoding='utf-8')
+
+
+# --- Log entries ---
+# Session details are held once per session and shared by its entries;
+# entries are slotted objects that still answer entry.get('session_source')
+# and entry['destination'] like the dicts they replace.
+SESSION_KEYS = ('session_id', 'session_started_at', 'session_source', 'session_destination')
+ENTRY_KEYS = ('source', 'destination', 'timestamp', 'size', 'mtime', 'digest')
+_KNOWN_KEYS = frozenset(ENTRY_KEYS + SESSION_KEYS)
+
+
+class LogSession:
+    __slots__ = ('session_id', 'started', 'source', 'dest', 'items')
+
+    def __init__(self, session_id, started, source, dest):
+        self.session_id = session_id
+        self.started = started
+        self.source = source
+        self.dest = dest
+        self.items = {}   # destination -> entry (insertion ordered)
+
+    @classmethod
+    def from_entry(cls, entry):
+        # Older entries may lack session fields; start at their timestamp
+        return cls(entry.get('session_id') or 'unknown', entry.get('session_started_at') or entry.get('timestamp'),
+                   entry.get('session_source'), entry.get('session_destination'))
+
+    def as_row(self):
+        return [self.session_id, self.started, self.source, self.dest]
+
+
+class LogEntry:
+    __slots__ = ('source', 'destination', 'timestamp', 'size', 'mtime', 'digest', 'session', 'extra')
+
+    def __init__(self, source, destination, timestamp=None, size=None, mtime=None, digest=None, session=None,
+                 extra=None):
+        self.source = source
+        self.destination = destination
+        self.timestamp = timestamp
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+        self.session = session
+        self.extra = extra   # keys this version does not know, kept as-is
+
+    @classmethod
+    def from_dict(cls, entry, session):
+        extra = None
+        if not _KNOWN_KEYS.issuperset(entry):
+            extra = {key: value for key, value in entry.items() if key not in _KNOWN_KEYS}
+        return cls(entry.get('source'), entry.get('destination'), entry.get('timestamp'), entry.get('size'),
+                   entry.get('mtime'), entry.get('digest'), session, extra)
+
+    def _value(self, key):
+        if key in ENTRY_KEYS:
+            return getattr(self, key)
+        session = self.session
+        if session is not None:
+            if key == 'session_id':
+                return session.session_id
+            if key == 'session_started_at':
+                return session.started
+            if key == 'session_source':
+                return session.source
+            if key == 'session_destination':
+                return session.dest
+        return self.extra.get(key) if self.extra else None
+
+    def get(self, key, default=None):
+        value = self._value(key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self._value(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def record(self):
+        # Dict without the session fields, as journaled
+        data = {key: getattr(self, key) for key in ENTRY_KEYS if getattr(self, key) is not None}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def as_dict(self):
+        data = self.record()
+        if self.session is not None:
+            data.update(zip(SESSION_KEYS, self.session.as_row()))
+        return data
+
+
+# --- In-memory index over log entries ---
+class TransferLogIndex:
+    # Hash maps kept up to date as entries are added and removed, so an
+    # upsert, a delete or a per-session lookup never scans the whole log.
+    def __init__(self, entries=()):
+        self.by_destination = {}   # destination -> entry (insertion ordered)
+        self.by_source = {}        # source -> {destination: entry}
+        self.sessions = {}         # session_id -> LogSession holding its entries
+        for entry in entries:
+            if isinstance(entry, (dict, LogEntry)):
+                self.add(entry)
+
+    def __len__(self):
+        return len(self.by_destination)
+
+    def _session_for(self, session):
+        # One LogSession per id, whichever entry introduced it
+        known = self.sessions.get(session.session_id)
+        if known is None:
+            if session.items:
+                # Belongs to another index (a wholesale replace)
+                session = LogSession(session.session_id, session.started, session.source, session.dest)
+            known = self.sessions[session.session_id] = session
+        return known
+
+    def add(self, entry):
+        if isinstance(entry, dict):
+            session = self.sessions.get(entry.get('session_id') or 'unknown') or LogSession.from_entry(entry)
+            entry = LogEntry.from_dict(entry, session)
+        elif entry.session is None:
+            entry.session = LogSession('unknown', entry.timestamp, None, None)
+        entry.session = self._session_for(entry.session)
+        destination = entry.destination
+        previous = self.by_destination.get(destination)
+        if previous is not None:
+            self._unlink(previous)
+        # Re-assigning an existing key keeps its position, like the old
+        # in-place list update did
+        self.by_destination[destination] = entry
+        self.by_source.setdefault(entry.source, {})[destination] = entry
+        entry.session.items[destination] = entry
+        return entry
+
+    def _unlink(self, entry):
+        destination = entry.destination
+        sources = self.by_source.get(entry.source)
+        if sources is not None:
+            sources.pop(destination, None)
+            if not sources:
+                del self.by_source[entry.source]
+        session = entry.session
+        session.items.pop(destination, None)
+        if not session.items and self.sessions.get(session.session_id) is session:
+            del self.sessions[session.session_id]
+
+    def remove_destination(self, destination):
+        entry = self.by_destination.pop(destination, None)
+        if entry is not None:
+            self._unlink(entry)
+        return entry
+
+    def remove_sources(self, sources):
+        removed = []
+        for source in sources:
+            for destination in list(self.by_source.get(source, {})):
+                removed.append(self.remove_destination(destination))
+        return removed
+
+    def entries(self):
+        return list(self.by_destination.values())
+
+    def session_items(self, session_id):
+        session = self.sessions.get(session_id)
+        return list(session.items.values()) if session else []
+
+    def session_destinations(self, session_id):
+        # Keys only; callers page entries in through by_destination
+        session = self.sessions.get(session_id)
+        return list(session.items) if session else []
+
+    def session_count(self, session_id):
+        session = self.sessions.get(session_id)
+        return len(session.items) if session else 0
+
+    def session_summaries(self):
+        # (session_id, info) pairs ordered by start time, as the session
+        # tables display them
+        return sorted(((sid, {'when': session.started, 'source': session.source,
+                              'dest': session.dest, 'count': len(session.items)})
+                       for sid, session in self.sessions.items()),
+                      key=lambda x: str(x[1]['when']))
+
+
+# --- Compact snapshot format ---
+# Version 2 snapshots store each session once and each entry as a row
+# referencing it, with directory prefixes written once in a shared table:
+#   sessions: [[id, started, source, dest], ...]
+#   dirs:     ['/media/phone/DCIM/100/', ...]
+#   entries:  [[session, src dir, src name, dest dir, dest name, timestamp, size, mtime, digest, extra], ...]
+#   transfers: [[dir, name], ...]
+# Trailing empty fields of a row are left out. Snapshots without a
+# format_version are the original list of full entry dicts; they are read
+# as before and rewritten in this format on first load.
+LOG_FORMAT_VERSION = 2
+
+
+def _split_path(path):
+    # The directory keeps its separator, so dir + name is the exact path
+    cut = max(path.rfind('/'), path.rfind('\\')) + 1
+    return path[:cut], path[cut:]
+
+
+class _DirTable:
+    def __init__(self):
+        self.dirs = []
+        self._ids = {}
+
+    def encode(self, path):
+        if path is None:
+            return [None, None]
+        directory, name = _split_path(path)
+        index = self._ids.get(directory)
+        if index is None:
+            index = self._ids[directory] = len(self.dirs)
+            self.dirs.append(directory)
+        return [index, name]
+
+
+def _trimmed(row):
+    while row and row[-1] is None:
+        row.pop()
+    return row
+
+
+def encode_snapshot(data, index):
+    dirs = _DirTable()
+    session_ids = {}
+    sessions = []
+    for sid, session in index.sessions.items():
+        session_ids[sid] = len(sessions)
+        sessions.append(session.as_row())
+    entries = []
+    for entry in index.by_destination.values():
+        entries.append(_trimmed([session_ids[entry.session.session_id]] + dirs.encode(entry.source)
+                                + dirs.encode(entry.destination)
+                                + [entry.timestamp, entry.size, entry.mtime, entry.digest, entry.extra]))
+    transfers = [dirs.encode(path) for path in data.get('transfers', [])]
+    out = {key: value for key, value in data.items() if key not in ('entries', 'transfers')}
+    out.update({'format_version': LOG_FORMAT_VERSION, 'sessions': sessions, 'dirs': dirs.dirs,
+                'entries': entries, 'transfers': transfers})
+    return out
+
+
+def decode_snapshot(data):
+    # Returns (data without entries, index) for either format
+    data = dict(data)
+    rows = data.pop('entries', None) or []
+    version = data.pop('format_version', 1)
+    if version == 1:
+        return data, TransferLogIndex(rows)
+    if version > LOG_FORMAT_VERSION:
+        raise ValueError(f"transfer log format {version} is newer than this version supports "
+                         f"({LOG_FORMAT_VERSION})")
+    dirs = data.pop('dirs', [])
+    sessions = [LogSession(*row) for row in data.pop('sessions', [])]
+
+    def path(directory, name):
+        return None if name is None else dirs[directory] + name
+
+    # Snapshot destinations are unique, so the maps are filled directly
+    # rather than through add()
+    index = TransferLogIndex()
+    by_destination, by_source = index.by_destination, index.by_source
+    for row in rows:
+        if len(row) < 10:
+            row = row + [None] * (10 - len(row))
+        session_at, src_dir, src_name, dest_dir, dest_name, timestamp, size, mtime, digest, extra = row
+        source = None if src_name is None else dirs[src_dir] + src_name
+        destination = None if dest_name is None else dirs[dest_dir] + dest_name
+        session = sessions[session_at]
+        entry = LogEntry(source, destination, timestamp, size, mtime, digest, session, extra)
+        if destination in by_destination:
+            index.add(entry)
+            continue
+        by_destination[destination] = entry
+        sources = by_source.get(source)
+        if sources is None:
+            by_source[source] = {destination: entry}
+        else:
+            sources[destination] = entry
+        session.items[destination] = entry
+    for session in sessions:
+        if session.items:
+            index.sessions.setdefault(session.session_id, session)
+    data['transfers'] = [path(directory, name) for directory, name in data.get('transfers', [])]
+    return data, index
+
+
+# --- Journaled transfer log store ---
+class TransferLogStore:
+    # transfer_log.json is a snapshot; every change since the snapshot is
+    # appended as one JSON line to transfer_log.journal. Loading replays the
+    # journal over the snapshot, and compaction folds it back in. Each
+    # record carries a sequence number and the snapshot remembers the last
+    # one it contains, so replay after a crash mid-compaction is exact.
+    def __init__(self, path=log_file, journal_path=None, fsync_every=DEFAULT_FSYNC_EVERY,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL, compact_every=DEFAULT_COMPACT_EVERY):
+        self.path = path
+        self.journal_path = journal_path or journal_path_for(path)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.data = None
+        self._index = None
+        self._seq = 0
+        self._journal = None
+        self._journal_end = None
+        self._journal_records = 0
+        # Sessions a journaled 'put' may refer to by id alone
+        self._journaled_sessions = set()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.RLock()
+
+    # --- Loading ---
+    @property
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._replay()
+            return self._index
+
+    def load(self, refresh=False):
+        # Dict view of the log ({'entries': [...], 'transfers': [...]}); the
+        # entries are LogEntry objects, read like dicts
+        with self._lock:
+            if self._index is None or refresh:
+                self._sync_locked()
+                self._replay()
+            data = dict(self.data)
+            data['entries'] = self._index.entries()
+            return data
+
+    def _replay(self):
+        snapshot = _read_snapshot(self.path)
+        data, index = decode_snapshot(snapshot)
+        legacy = bool(snapshot) and 'format_version' not in snapshot
+        snapshot_seq = data.get('journal_seq', 0)
+        self._seq = snapshot_seq
+        self._journal_records = 0
+        known = dict(index.sessions)
+        reader = JournalReader(self.journal_path)
+        for record in reader:
+            seq = record.get('seq', 0)
+            if seq <= snapshot_seq:
+                continue
+            self._seq = max(self._seq, seq)
+            self._journal_records += 1
+            op = record.get('op')
+            if op == 'session':
+                # Journals written before the row moved onto the first put
+                session = LogSession(*record['session'])
+                known[session.session_id] = session
+            elif op == 'put':
+                entry = record['entry']
+                sid = record.get('session')
+                if 'session_row' in record and sid not in known:
+                    known[sid] = LogSession(*record['session_row'])
+                if sid is None:
+                    # Journals written before sessions were split out
+                    index.add(entry)
+                else:
+                    session = known.get(sid) or LogSession(sid, entry.get('timestamp'), None, None)
+                    index.add(LogEntry.from_dict(entry, session))
+            elif op == 'delete':
+                index.remove_sources(record.get('sources', []))
+            elif op == 'transfers':
+                data.setdefault('transfers', []).extend(record.get('sources', []))
+        self.data = data
+        self._index = index
+        self._journaled_sessions = set(known)
+        # The first append cuts a torn last line (see JournalReader)
+        self._journal_end = reader.end
+        if legacy:
+            self._migrate_locked()
+
+    def _migrate_locked(self):
+        # The original format is kept next to the log as <log>.v1, once
+        backup = self.path + '.v1'
+        try:
+            if not os.path.exists(backup):
+                shutil.copy2(self.path, backup)
+            self._compact_locked()
+        except OSError as e:
+            logging.warning(f"Cannot migrate transfer log {self.path} to format {LOG_FORMAT_VERSION}: {e}")
+            return
+        logging.info(f"Migrated transfer log {self.path} to format {LOG_FORMAT_VERSION} "
+                     f"({len(self._index)} entries, {len(self._index.sessions)} sessions, backup {backup})")
+
+    # --- Locked views ---
+    # The copy engine's writer thread changes the index while the UI reads
+    # it; these copy what the session tables need under the lock instead of
+    # iterating live dicts.
+    def session_summaries(self):
+        with self._lock:
+            return self.index.session_summaries()
+
+    def session_destinations(self, session_id):
+        with self._lock:
+            return self.index.session_destinations(session_id)
+
+    # --- Mutations (applied in memory and journaled) ---
+    def put_entry(self, entry):
+        with self._lock:
+            entry = self.index.add(entry)
+            session = entry.session
+            record = {'op': 'put', 'session': session.session_id, 'entry': entry.record()}
+            if session.session_id not in self._journaled_sessions:
+                # The session's details ride on its first put, so they can
+                # only be lost together with an entry of their own
+                record['session_row'] = session.as_row()
+                self._journaled_sessions.add(session.session_id)
+            self._append(record)
+
+    def delete_sources(self, sources):
+        sources = set(sources)
+        if not sources:
+            return []
+        with self._lock:
+            removed = self.index.remove_sources(sources)
+            self._append({'op': 'delete', 'sources': sorted(sources)})
+            return removed
+
+    def extend_transfers(self, sources):
+        if not sources:
+            return
+        with self._lock:
+            if self._index is None:
+                self._replay()
+            self.data.setdefault('transfers', []).extend(sources)
+            self._append({'op': 'transfers', 'sources': list(sources)})
+
+    def _append(self, record):
+        self._seq += 1
+        record['seq'] = self._seq
+        if self._journal is None:
+            self._journal = open_journal(self.journal_path, self._journal_end)
+            self._journal_end = None
+        self._journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._journal_records += 1
+        self._unsynced += 1
+        if (self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self._sync_locked()
+        if self._journal_records >= self.compact_every:
+            self._compact_locked()
+
+    # --- Durability ---
+    def _sync_locked(self):
+        if self._journal is not None and self._unsynced:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._sync_locked()
+
+    def _compact_locked(self):
+        if self._index is None:
+            self._replay()
+        self._sync_locked()
+        self.data['journal_seq'] = self._seq
+        write_json_atomic(self.path, encode_snapshot(self.data, self._index), indent=None, separators=(',', ':'))
+        # The snapshot now covers every journaled record; start a new journal
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'w', encoding='utf-8')
+        self._journal_records = 0
+        self._journaled_sessions = set(self._index.sessions)
+
+    def compact(self):
+        with self._lock:
+            self._compact_locked()
+
+    def replace(self, data):
+        # Full rewrite for callers that build a new log wholesale
+        with self._lock:
+            data = dict(data)
+            self._index = TransferLogIndex(data.pop('entries', None) or [])
+            self.data = data
+            self._compact_locked()
+
+    def close(self):
+        with self._lock:
+            self._sync_locked()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
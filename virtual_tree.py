@@ -0,0 +1,212 @@
+import tkinter as tk
+from tkinter import ttk
+
+# --- Virtualized list ---
+CHECKED = '☑'
+UNCHECKED = '☐'
+DEFAULT_ROW_HEIGHT = 20
+
+
+class VirtualTree:
+    # A Treeview that only ever holds the rows currently in view. Row data
+    # comes from get_row(index) when a row scrolls into view, and the
+    # per-row check state is a set of indices rather than a widget and a
+    # variable per row, so opening a 20k-row list costs the same as a
+    # 30-row one. The first column shows the check mark; clicking a row or
+    # pressing space toggles it.
+    #
+    # With get_image(index), rows get an image in the tree column and taller
+    # rows; on_render(top, count) is called after each render so the owner
+    # can load images for exactly the rows in view, then refresh().
+    def __init__(self, parent, columns, headings, widths, on_change=None, get_image=None, on_render=None,
+                 image_size=None):
+        self.frame = ttk.Frame(parent, style='Secondary.TFrame')
+        self.frame.rowconfigure(0, weight=1)
+        self.frame.columnconfigure(0, weight=1)
+        self.columns = ('selection',) + tuple(columns)
+        self.get_image = get_image
+        self.on_render = on_render
+        if get_image is not None:
+            width, height = image_size or (DEFAULT_ROW_HEIGHT, DEFAULT_ROW_HEIGHT)
+            self.style = 'Images.Treeview'
+            ttk.Style().configure(self.style, rowheight=height + 4)
+            self.tree = ttk.Treeview(self.frame, columns=self.columns, show=('tree', 'headings'),
+                                     selectmode='none', style=self.style)
+            self.tree.column('#0', width=width + 12, anchor='center', stretch=False)
+        else:
+            self.style = 'Treeview'
+            self.tree = ttk.Treeview(self.frame, columns=self.columns, show='headings', selectmode='none')
+        self.tree.heading('selection', text='Selection')
+        self.tree.column('selection', width=100, anchor='center', stretch=False)
+        for col, text, width in zip(columns, headings, widths):
+            self.tree.heading(col, text=text)
+            self.tree.column(col, width=width, anchor='w')
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar = ttk.Scrollbar(self.frame, orient='vertical', command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+
+        self.on_change = on_change
+        self.total = 0
+        self.get_row = None
+        self.top = 0
+        self.visible = 1
+        self.selected = set()
+        self._cursor = None
+
+        self.tree.bind('<Configure>', self._on_configure)
+        self.tree.bind('<Button-1>', self._on_click)
+        self.tree.bind('<MouseWheel>', self._on_wheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll(3))
+        self.tree.bind('<Up>', lambda e: self._move_cursor(-1))
+        self.tree.bind('<Down>', lambda e: self._move_cursor(1))
+        self.tree.bind('<Prior>', lambda e: self.scroll(-self.visible))
+        self.tree.bind('<Next>', lambda e: self.scroll(self.visible))
+        self.tree.bind('<Home>', lambda e: self.scroll_to(0))
+        self.tree.bind('<End>', lambda e: self.scroll_to(self.total))
+        self.tree.bind('<space>', self._on_space)
+
+    def pack(self, **kw):
+        self.frame.pack(**kw)
+
+    def grid(self, **kw):
+        self.frame.grid(**kw)
+
+    # --- Data ---
+    def set_source(self, total, get_row):
+        self.total = total
+        self.get_row = get_row
+        self.top = 0
+        self.selected = set()
+        self._cursor = None
+        self.render()
+        self._changed()
+
+    def refresh(self):
+        self.render()
+
+    # --- Selection ---
+    def toggle(self, index):
+        if index in self.selected:
+            self.selected.discard(index)
+        else:
+            self.selected.add(index)
+        self.render()
+        self._changed()
+
+    def select_all(self, state=True):
+        self.selected = set(range(self.total)) if state else set()
+        self.render()
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    # --- Viewport ---
+    def _row_height(self):
+        children = self.tree.get_children()
+        if children:
+            bbox = self.tree.bbox(children[0])
+            if bbox:
+                return max(1, bbox[3])
+        try:
+            return int(ttk.Style().lookup(self.style, 'rowheight') or DEFAULT_ROW_HEIGHT)
+        except (tk.TclError, ValueError):
+            return DEFAULT_ROW_HEIGHT
+
+    def _header_height(self):
+        children = self.tree.get_children()
+        if children:
+            bbox = self.tree.bbox(children[0])
+            if bbox:
+                return bbox[1]
+        return self._row_height() + 4
+
+    def _on_configure(self, event):
+        visible = max(1, (event.height - self._header_height()) // self._row_height())
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def scroll(self, delta):
+        self.scroll_to(self.top + delta)
+
+    def scroll_to(self, top):
+        top = max(0, min(int(top), self.total - self.visible))
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * self.total)
+        elif args[0] == 'scroll':
+            step = self.visible if args[2] == 'pages' else 1
+            self.scroll(int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+
+    def _index_at(self, y):
+        iid = self.tree.identify_row(y)
+        if not iid:
+            return None
+        index = self.top + self.tree.index(iid)
+        return index if index < self.total else None
+
+    def _on_click(self, event):
+        if self.tree.identify_region(event.x, event.y) not in ('cell', 'tree'):
+            return
+        index = self._index_at(event.y)
+        if index is not None:
+            self._cursor = index
+            self.tree.focus_set()
+            self.toggle(index)
+        return 'break'
+
+    def _move_cursor(self, delta):
+        if not self.total:
+            return 'break'
+        cursor = self.top if self._cursor is None else self._cursor + delta
+        self._cursor = max(0, min(cursor, self.total - 1))
+        if self._cursor < self.top:
+            self.scroll_to(self._cursor)
+        elif self._cursor >= self.top + self.visible:
+            self.scroll_to(self._cursor - self.visible + 1)
+        self.render()
+        return 'break'
+
+    def _on_space(self, event):
+        if self._cursor is not None:
+            self.toggle(self._cursor)
+        return 'break'
+
+    def render(self):
+        # Reuse the existing row items and only rewrite their values
+        count = max(0, min(self.visible, self.total - self.top))
+        children = list(self.tree.get_children())
+        for iid in children[count:]:
+            self.tree.delete(iid)
+        for _ in range(len(children), count):
+            children.append(self.tree.insert('', 'end', values=()))
+        for offset in range(count):
+            index = self.top + offset
+            mark = CHECKED if index in self.selected else UNCHECKED
+            if self.get_image is not None:
+                self.tree.item(children[offset], values=(mark,) + tuple(self.get_row(index)),
+                               image=self.get_image(index) or '')
+            else:
+                self.tree.item(children[offset], values=(mark,) + tuple(self.get_row(index)))
+        # The keyboard cursor is shown as the Treeview selection
+        cursor = None if self._cursor is None else self._cursor - self.top
+        if cursor is not None and 0 <= cursor < count:
+            self.tree.selection_set(children[cursor])
+        else:
+            self.tree.selection_remove(self.tree.selection())
+        if self.total:
+            self.scrollbar.set(self.top / self.total, (self.top + count) / self.total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        if self.on_render is not None:
+            self.on_render(self.top, count)